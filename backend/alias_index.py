@@ -0,0 +1,246 @@
+"""香水别名索引（get_official_name 的本地字典）
+
+把用户输入的中文名、昵称、部分名称映射到官方名称，持久化为 JSON 文件：
+
+- 查找顺序：规范化后精确匹配 -> 拼音匹配（需要 pypinyin，可识别同音错字）-> 模糊匹配（difflib，数字必须一致）
+- 模糊匹配只比较候选集：与输入共享字符二元组、长度可能达到相似度阈值、数字一致的 key 中
+  共享二元组最多的前 FUZZY_MAX_CANDIDATES 个，未命中的开销不随索引规模线性增长
+- 官方名称自身也会登记为别名，用户直接输入官方名时同样命中
+- 经 analyze_scent 确认的 LLM 解析结果写回索引；运维可以用 CSV 批量导入：
+
+    python alias_index.py import aliases.csv   # 每行：别名,官方名称（可带表头 alias,official）
+    python alias_index.py lookup 白金缮
+
+服务运行时也可以导入：保存前会合并磁盘上的新条目，查找时发现文件被外部修改会重新加载。
+"""
+import argparse
+import csv
+import difflib
+import heapq
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from storage import atomic_write_json, read_json
+
+# 尝试导入 pypinyin（拼音匹配）
+PYPINYIN_AVAILABLE = False
+try:
+    from pypinyin import lazy_pinyin  # type: ignore
+    PYPINYIN_AVAILABLE = True
+except ImportError:
+    pass
+
+
+ALIAS_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "aliases.json")
+ALIAS_SEED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alias_seed.csv")
+FUZZY_MAX_CANDIDATES = 64  # 模糊匹配时交给 difflib 比较的 key 数上限
+
+_NON_WORD_RE = re.compile(r"[\W_]+", re.UNICODE)
+_DIGITS_RE = re.compile(r"\d+")
+# 结尾的泛称（"迪奥旷野香水" 与 "迪奥旷野" 视为同一个 key）
+_GENERIC_SUFFIX_RE = re.compile(r"(淡香水|淡香精|香水|香精|perfume|parfum|eaudeparfum|eaudetoilette|edp|edt)$")
+
+
+def normalize_alias(name: str) -> str:
+    """规范化 key：全角转半角、转小写、去掉空白与标点及结尾泛称（"Chanel No. 5" -> "chanelno5"）"""
+    key = _NON_WORD_RE.sub("", unicodedata.normalize("NFKC", name).lower())
+    return _GENERIC_SUFFIX_RE.sub("", key) or key
+
+
+def _bigrams(key: str) -> Set[str]:
+    return {key[i:i + 2] for i in range(len(key) - 1)}
+
+
+def pinyin_key(key: str) -> Optional[str]:
+    """规范化 key 的无声调拼音；没有汉字或未安装 pypinyin 时返回 None"""
+    if not PYPINYIN_AVAILABLE or not re.search(r"[一-鿿]", key):
+        return None
+    return "".join(lazy_pinyin(key))
+
+
+class AliasIndex:
+    def __init__(self, path: str, fuzzy_cutoff: float = 0.88):
+        self.path = path
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}  # 规范化 key -> {"alias", "official", "source"}
+        self._pinyin: Dict[str, str] = {}  # 拼音 -> 规范化 key
+        self._bigram_keys: Dict[str, Set[str]] = {}  # 字符二元组 -> 含有它的 key（模糊匹配的候选集）
+        self._pending: Dict[str, dict] = {}  # 尚未写盘的新条目
+        self._mtime: Optional[float] = None
+        self.stats = {"exact": 0, "pinyin": 0, "fuzzy": 0, "miss": 0}
+
+    # ---- 持久化 ----
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def _load_locked(self) -> None:
+        data = read_json(self.path) or {}
+        entries = data.get("aliases", {})
+        entries.update(self._pending)
+        self._entries = entries
+        self._pinyin = {}
+        self._bigram_keys = {}
+        for key in entries:
+            self._index_key(key)
+        self._mtime = self._file_mtime()
+
+    def _index_key(self, key: str) -> None:
+        py = pinyin_key(key)
+        if py:
+            self._pinyin.setdefault(py, key)
+        for gram in _bigrams(key):
+            self._bigram_keys.setdefault(gram, set()).add(key)
+
+    def _fuzzy_candidates(self, key: str) -> List[str]:
+        """可能达到模糊阈值的 key：共享二元组、数字一致，且长度满足 difflib 相似度的上界"""
+        # ratio = 2M / (la + lb) <= 2 * min(la, lb) / (la + lb)，达到 cutoff 时较短的一方至少为较长一方的 c / (2 - c)
+        scale = self.fuzzy_cutoff / (2 - self.fuzzy_cutoff)
+        min_len, max_len = math.ceil(len(key) * scale), math.floor(len(key) / scale)
+        digits = _DIGITS_RE.findall(key)  # 数字不同的是不同款（"chanelno19" 不能匹配到 "chanelno9"）
+        shared: Counter = Counter()
+        for gram in _bigrams(key):
+            shared.update(self._bigram_keys.get(gram, ()))
+        eligible = (
+            (count, candidate)
+            for candidate, count in shared.items()
+            if min_len <= len(candidate) <= max_len and _DIGITS_RE.findall(candidate) == digits
+        )
+        return [candidate for _, candidate in heapq.nlargest(FUZZY_MAX_CANDIDATES, eligible)]
+
+    def load(self) -> int:
+        with self._lock:
+            self._load_locked()
+            return len(self._entries)
+
+    def _maybe_reload(self) -> None:
+        """文件被外部（如导入命令）修改过时重新加载"""
+        mtime = self._file_mtime()
+        if mtime != self._mtime:
+            self._load_locked()
+
+    def save(self) -> int:
+        """把新条目合并进磁盘上的最新内容后原子写入，返回写入的新条目数"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            self._load_locked()
+            atomic_write_json(self.path, {"aliases": self._entries})
+            written = len(self._pending)
+            self._pending.clear()
+            self._mtime = self._file_mtime()
+            return written
+
+    # ---- 读写 ----
+    def add(self, alias: str, official: str, source: str = "llm") -> None:
+        official = official.strip()
+        if not official:
+            return
+        with self._lock:
+            for name in (alias, official):
+                key = normalize_alias(name)
+                if not key:
+                    continue
+                existing = self._entries.get(key)
+                if existing and existing.get("official") == official:
+                    continue
+                entry = {"alias": name.strip(), "official": official, "source": source}
+                self._entries[key] = entry
+                self._pending[key] = entry
+                self._index_key(key)
+
+    def lookup(self, name: str) -> Optional[Tuple[str, str]]:
+        """返回 (官方名称, 匹配方式)，未找到返回 None"""
+        key = normalize_alias(name)
+        if not key:
+            return None
+        with self._lock:
+            self._maybe_reload()
+            entry = self._entries.get(key)
+            match_type = "exact"
+            if entry is None:
+                py = pinyin_key(key)
+                if py and py in self._pinyin:
+                    entry = self._entries.get(self._pinyin[py])
+                    match_type = "pinyin"
+            if entry is None and len(key) >= 3:
+                close = difflib.get_close_matches(key, self._fuzzy_candidates(key), n=3, cutoff=self.fuzzy_cutoff)
+                if close:
+                    entry = self._entries[close[0]]
+                    match_type = "fuzzy"
+            if entry is None:
+                self.stats["miss"] += 1
+                return None
+            self.stats[match_type] += 1
+            return entry["official"], match_type
+
+    def lookup_many(self, names: Iterable[str]) -> Dict[str, Optional[Tuple[str, str]]]:
+        """批量查找（在线程里一次查完一批，不逐个切换线程）"""
+        return {name: self.lookup(name) for name in names}
+
+    def import_rows(self, rows: Iterable[Tuple[str, str]], source: str = "import") -> int:
+        count = 0
+        for alias, official in rows:
+            if alias.strip() and official.strip():
+                self.add(alias, official, source)
+                count += 1
+        return count
+
+    def import_csv(self, csv_path: str, source: str = "import") -> int:
+        """导入 CSV（别名,官方名称；表头 alias,official 可选），返回导入行数"""
+        with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+            rows = [row[:2] for row in csv.reader(f) if len(row) >= 2]
+        if rows and [c.strip().lower() for c in rows[0]] == ["alias", "official"]:
+            rows = rows[1:]
+        return self.import_rows(((a, o) for a, o in rows), source)
+
+    def official_names(self) -> set:
+        with self._lock:
+            return {entry["official"] for entry in self._entries.values()}
+
+    def metrics(self) -> dict:
+        hits = self.stats["exact"] + self.stats["pinyin"] + self.stats["fuzzy"]
+        total = hits + self.stats["miss"]
+        return {
+            "size": len(self._entries),
+            **self.stats,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "pinyin_enabled": PYPINYIN_AVAILABLE,
+        }
+
+
+def load_alias_index(path: str = ALIAS_INDEX_PATH, seed_path: str = ALIAS_SEED_PATH) -> AliasIndex:
+    """加载别名索引；索引文件不存在时先用种子 CSV 初始化"""
+    index = AliasIndex(path)
+    index.load()
+    if not os.path.exists(path) and os.path.exists(seed_path):
+        index.import_csv(seed_path, source="seed")
+        index.save()
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="香水别名索引工具")
+    parser.add_argument("--index", default=os.getenv("ALIAS_INDEX_PATH", ALIAS_INDEX_PATH))
+    sub = parser.add_subparsers(dest="command", required=True)
+    import_parser = sub.add_parser("import", help="批量导入别名 CSV（别名,官方名称）")
+    import_parser.add_argument("csv_paths", nargs="+")
+    lookup_parser = sub.add_parser("lookup", help="查询别名")
+    lookup_parser.add_argument("name")
+    args = parser.parse_args()
+
+    alias_index = load_alias_index(args.index)
+    if args.command == "import":
+        total = sum(alias_index.import_csv(path) for path in args.csv_paths)
+        alias_index.save()
+        print(f"[别名索引] 导入 {total} 行，索引共 {alias_index.metrics()['size']} 个别名 -> {args.index}")
+    elif args.command == "lookup":
+        print(alias_index.lookup(args.name))
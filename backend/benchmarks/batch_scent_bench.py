@@ -0,0 +1,138 @@
+"""Lab 批量分析吞吐量基准：逐个调用 /api/analyze_scent 与 /api/analyze_scent/batch 的对比
+
+在本地启动一个兼容 OpenAI 协议的桩服务（别名解析、批量别名解析、数据提取各有固定耗时），
+用带固定耗时的假 Tavily 客户端替换 tavily_client，分别测量（单位：款/分钟）：
+
+1. 逐个请求 /api/analyze_scent（前端逐款分析一个品牌系列的方式）
+2. 一次 /api/analyze_scent/batch（冷启动，全部需要搜索和提取）
+3. 同一批名称再请求一次 batch（复用已保存的分析结果）
+
+    python benchmarks/batch_scent_bench.py -n 40
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+
+LLM_DELAY = 0.3  # 桩 LLM 每次调用的耗时（秒）
+SEARCH_DELAY = 0.5  # 假 Tavily 每次搜索的耗时（秒）
+upstream_calls: Counter = Counter()
+
+stub = FastAPI()
+
+
+@stub.post("/v1/chat/completions")
+async def chat_completions(request: Request) -> dict:
+    body = await request.json()
+    system = body["messages"][0]["content"]
+    prompt = body["messages"][-1]["content"]
+    if "Perfume Translator" in system and "JSON array" in prompt:
+        upstream_calls["alias_batch_llm"] += 1
+        inputs = json.loads(re.search(r"User Inputs \(JSON array\): (\[.*\])", prompt).group(1))
+        content = json.dumps({name: f"Official {name}" for name in inputs}, ensure_ascii=False)
+    elif "Perfume Translator" in system:
+        upstream_calls["alias_llm"] += 1
+        content = "Official " + re.search(r'User Input: "(.*)"', prompt).group(1)
+    else:
+        upstream_calls["extract_llm"] += 1
+        official_name = re.search(r'official name: "(.*?)"', prompt).group(1)
+        content = json.dumps({"found": True, "brand": "Stub", "name": official_name, "radar_data": {"Floral": 5}})
+    await asyncio.sleep(LLM_DELAY)
+    return {
+        "id": "stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+
+class SlowTavily:
+    async def search(self, timeout=None, **params) -> dict:
+        upstream_calls["tavily"] += 1
+        await asyncio.sleep(SEARCH_DELAY)
+        return {"results": [{"title": params["query"], "content": "notes, accords", "url": "https://example.com/p"}]}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _names(prefix: str, n: int) -> list:
+    """互不相似的名称（避免别名索引的模糊匹配把不同香水当成同一款）"""
+    return [f"{prefix} {hashlib.md5(f'{prefix}{i}'.encode()).hexdigest()[:10]}" for i in range(n)]
+
+
+def _report(label: str, count: int, elapsed: float) -> None:
+    print(f"[批量基准] {label}: {count} 款 {elapsed:.2f}s，{count / elapsed * 60:.0f} 款/分钟，"
+          f"上游调用 {dict(upstream_calls)}")
+    upstream_calls.clear()
+
+
+async def run(n: int) -> int:
+    import server
+
+    server.tavily_client = SlowTavily()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=300) as client:
+        # 1. 逐个请求
+        start = time.perf_counter()
+        for name in _names("single", n):
+            response = await client.post("/api/analyze_scent", json={"name": name})
+            assert response.status_code == 200 and response.json()["found"], response.text
+        _report("逐个 /api/analyze_scent", n, time.perf_counter() - start)
+
+        # 2 / 3. 批量（冷启动，然后复用已保存的结果）
+        names = _names("batch", n)
+        for label in ("batch 冷启动", "batch 复用已保存结果"):
+            start = time.perf_counter()
+            response = await client.post("/api/analyze_scent/batch", json={"names": names})
+            elapsed = time.perf_counter() - start
+            events = [json.loads(line) for line in response.text.splitlines()]
+            items = [e for e in events if e["stage"] == "item"]
+            if len(items) != n or not all(e.get("data", {}).get("found") for e in items):
+                print(f"[批量基准] ❌ {label}: 结果不完整 {events[-1]}")
+                return 1
+            _report(label, n, elapsed)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lab 批量分析吞吐量基准")
+    parser.add_argument("-n", type=int, default=40, help="香水数量")
+    parser.add_argument("--concurrency", type=int, default=8, help="SCENT_BATCH_CONCURRENCY")
+    args = parser.parse_args()
+
+    port = _free_port()
+    stub_server = uvicorn.Server(uvicorn.Config(stub, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=stub_server.run, daemon=True).start()
+    while not stub_server.started:
+        time.sleep(0.05)
+
+    workdir = tempfile.mkdtemp()
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+    os.environ["ALIAS_INDEX_PATH"] = os.path.join(workdir, "aliases.json")
+    os.environ["SCENT_ANALYSIS_DB_PATH"] = os.path.join(workdir, "scent_analyses.sqlite3")
+    os.environ["SCENT_BATCH_CONCURRENCY"] = str(args.concurrency)
+    exit_code = asyncio.run(run(args.n))
+    stub_server.should_exit = True
+    sys.exit(exit_code)
@@ -0,0 +1,117 @@
+"""请求合并（single-flight）压测：N 个相同的 /api/analyze_scent 并发请求只触发一次上游调用
+
+在本地启动一个兼容 OpenAI 协议的桩服务（记录别名解析与数据提取各被调用几次），
+用计数的假 Tavily 客户端替换 tavily_client，然后并发发出 N 个相同的请求，
+断言别名解析、Tavily 搜索、数据提取各只调用了一次，且所有响应一致。
+
+    python benchmarks/coalescing_load_test.py -n 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+
+UPSTREAM_DELAY = 0.3  # 桩服务每次调用的耗时（秒），让并发请求在上游调用期间到达
+upstream_calls: Counter = Counter()
+
+stub = FastAPI()
+
+
+@stub.post("/v1/chat/completions")
+async def chat_completions(request: Request) -> dict:
+    body = await request.json()
+    system = body["messages"][0]["content"]
+    if "Perfume Translator" in system:
+        upstream_calls["alias_llm"] += 1
+        content = "Chanel No 5"
+    else:
+        upstream_calls["extract_llm"] += 1
+        content = json.dumps({"found": True, "brand": "Chanel", "name": "No 5 / 五号"})
+    await asyncio.sleep(UPSTREAM_DELAY)
+    return {
+        "id": "stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+
+class CountingTavily:
+    async def search(self, timeout=None, **params) -> dict:
+        upstream_calls["tavily"] += 1
+        await asyncio.sleep(UPSTREAM_DELAY)
+        return {"results": [{"title": "Chanel No 5", "content": "aldehydes, rose, jasmine", "url": "https://example.com/no5"}]}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run(n: int) -> int:
+    import server
+
+    server.tavily_client = CountingTavily()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post("/api/analyze_scent", json={"name": "雨后的小花园"}) for _ in range(n)
+        ])
+        elapsed = time.perf_counter() - start
+
+    bodies = [r.json() for r in responses]
+    print(f"[压测] {n} 个并发请求，耗时 {elapsed:.2f}s，上游调用: {dict(upstream_calls)}")
+    print(f"[压测] LLM single-flight: calls={server.llm_flight.calls} shared={server.llm_flight.shared}；"
+          f"搜索缓存: {server.search_cache.metrics()}")
+    failures = []
+    if any(r.status_code != 200 for r in responses):
+        failures.append("存在非 200 响应")
+    if any(body != bodies[0] for body in bodies):
+        failures.append("响应不一致")
+    for name in ("alias_llm", "tavily", "extract_llm"):
+        if upstream_calls[name] != 1:
+            failures.append(f"{name} 被调用 {upstream_calls[name]} 次（期望 1 次）")
+    for failure in failures:
+        print(f"[压测] ❌ {failure}")
+    if not failures:
+        print("[压测] ✅ 每个上游调用都只执行了一次")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="single-flight 压测")
+    parser.add_argument("-n", type=int, default=50, help="并发请求数")
+    args = parser.parse_args()
+
+    port = _free_port()
+    stub_server = uvicorn.Server(uvicorn.Config(stub, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=stub_server.run, daemon=True).start()
+    while not stub_server.started:
+        time.sleep(0.05)
+
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+    # 使用空的临时别名索引与分析结果库，确保别名解析、搜索与提取都走上游
+    workdir = tempfile.mkdtemp()
+    os.environ["ALIAS_INDEX_PATH"] = os.path.join(workdir, "aliases.json")
+    os.environ["SCENT_ANALYSIS_DB_PATH"] = os.path.join(workdir, "scent_analyses.sqlite3")
+    exit_code = asyncio.run(run(args.n))
+    stub_server.should_exit = True
+    sys.exit(exit_code)
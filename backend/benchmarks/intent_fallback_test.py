@@ -0,0 +1,75 @@
+"""意图识别无模型测试：intent_model.json 缺失或损坏时仍走关键词快速通道
+
+1. 模型文件不存在 / 不是合法 JSON：load_or_keywords 返回只有关键词规则的分类器
+2. 含搜索关键词的消息由规则直接判为需要搜索，其余消息返回 None（交给 LLM）
+3. 以缺失的 INTENT_MODEL_PATH 导入 server：detect_intent 对关键词消息不调用 LLM，
+   对其他消息才调用 LLM
+
+    python benchmarks/intent_fallback_test.py
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from intent_classifier import IntentClassifier  # noqa: E402
+
+SEARCH_MESSAGES = ["帮我查一下这款香水的价格", "你知道《晴天》的歌词吗", "Where to buy Chanel No 5?"]
+OTHER_MESSAGES = ["今天有点累", "推荐一款适合秋天的香"]
+
+
+def main() -> int:
+    failures = []
+
+    def check(label: str, ok: bool) -> None:
+        print(f"[意图回退测试] {label}: {'✅' if ok else '❌'}")
+        if not ok:
+            failures.append(label)
+
+    workdir = tempfile.mkdtemp(prefix="intent-test-")
+    try:
+        broken_path = os.path.join(workdir, "broken.json")
+        with open(broken_path, "w", encoding="utf-8") as f:
+            f.write("{not json")
+        for label, path in (("缺失", os.path.join(workdir, "missing.json")), ("损坏", broken_path)):
+            classifier = IntentClassifier.load_or_keywords(path)
+            check(f"模型文件{label}：退回关键词规则", not classifier.has_model)
+            check(
+                f"模型文件{label}：关键词消息判为需要搜索",
+                all(classifier.classify(m).should_search is True for m in SEARCH_MESSAGES),
+            )
+            check(
+                f"模型文件{label}：其他消息交给 LLM",
+                all(classifier.classify(m).should_search is None for m in OTHER_MESSAGES),
+            )
+
+        os.environ["INTENT_MODEL_PATH"] = os.path.join(workdir, "missing.json")
+        os.environ.setdefault("OPENAI_BASE_URL", "http://127.0.0.1:9")
+        os.environ.setdefault("OPENAI_API_KEY", "test")
+        import server  # noqa: E402
+
+        llm_calls = []
+
+        async def fake_llm_detect_intent(messages, last_user_message):
+            llm_calls.append(last_user_message)
+            return False
+
+        server._llm_detect_intent = fake_llm_detect_intent
+        results = [
+            asyncio.run(server.detect_intent([{"role": "user", "content": m}])) for m in SEARCH_MESSAGES
+        ]
+        check("server 无模型：关键词消息判为需要搜索", all(results))
+        check("server 无模型：关键词消息不调用 LLM", not llm_calls)
+        asyncio.run(server.detect_intent([{"role": "user", "content": OTHER_MESSAGES[0]}]))
+        check("server 无模型：其他消息调用 LLM", llm_calls == [OTHER_MESSAGES[0]])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""关键词匹配微基准：旧的逐类别 any() + 行内正则 vs 预编译的 KeywordMatcher
+
+对已保存会话中的用户消息（以及意图分类器的种子样本）做 _perform_searches 的分类阶段：
+判断 force_search / needs_verification / 各类别命中，并提取歌曲、引用、香水名候选。
+先核对两种实现的结果一致，再分别计时。
+
+    python benchmarks/keyword_matcher_bench.py --repeat 200
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from intent_classifier import iter_user_turns, read_labels  # noqa: E402
+from keyword_matcher import SEARCH_KEYWORD_MATCHER, VERIFICATION_KEYWORDS  # noqa: E402
+
+SONG_PATTERNS = [r'《([^》]+)》', r'"([^"]+)"', r'《([^》]+)', r'([^，。！？\s]+(?:的|之)?隐形人)', r'(隐形人)']
+QUOTE_PATTERNS = [r'《([^》]+)》', r'["""]([^"""]+)["""]', r"['']([^'']+)['']", r'([^，。！？\s]{4,})']
+PERFUME_PATTERNS = [r'([A-Z][a-zA-Z\s]+(?:\s+No\.\s*\d+)?)', r'([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)+)']
+
+COMPILED_SONG = [re.compile(p) for p in SONG_PATTERNS]
+COMPILED_QUOTE = [re.compile(p) for p in QUOTE_PATTERNS]
+COMPILED_PERFUME = [re.compile(p) for p in PERFUME_PATTERNS]
+QUOTE_MARK_RE = re.compile(r'["""''《》]')
+CAPITALIZED_RE = re.compile(r'[A-Z][a-z]+\s+[A-Z]')
+
+
+def legacy_classify(message: str) -> tuple:
+    """原实现：每次调用重建关键词表，逐类别 any()，正则在行内传字符串"""
+    search_request_keywords = ["搜索", "能否搜索", "帮我查", "查一下", "查找", "搜索一下", "search", "look up", "find", "知道", "你知道", "了解", "你了解"]
+    lower = message.lower()
+    force_search = any(kw in lower for kw in search_request_keywords)
+    verification_keywords = {name: list(keywords) for name, keywords in VERIFICATION_KEYWORDS.items()}
+    needs_verification = False
+    for category, keywords in verification_keywords.items():
+        if any(kw in lower for kw in keywords):
+            needs_verification = True
+            break
+    if re.search(r'["""''《》]', message) or re.search(r'[A-Z][a-z]+\s+[A-Z]', message):
+        needs_verification = True
+    is_literary = any(kw in lower for kw in verification_keywords["书籍作品"] + verification_keywords["典故"])
+    candidates = []
+    if (any(kw in lower for kw in verification_keywords["歌词"]) or force_search) and not is_literary:
+        for pattern in SONG_PATTERNS:
+            candidates.extend(re.findall(pattern, message))
+    if any(kw in lower for kw in verification_keywords["典故"] + verification_keywords["诗词古文"] + verification_keywords["人物"] + verification_keywords["书籍作品"]):
+        for pattern in QUOTE_PATTERNS:
+            candidates.extend(re.findall(pattern, message))
+    if any(kw in lower for kw in verification_keywords["香水品牌"] + verification_keywords["香水名称"]):
+        for pattern in PERFUME_PATTERNS:
+            candidates.extend(re.findall(pattern, message))
+    return force_search, needs_verification, is_literary, candidates
+
+
+def matcher_classify(message: str) -> tuple:
+    """新实现：一次扫描得到所有类别，正则预编译"""
+    matched = SEARCH_KEYWORD_MATCHER.classify(message.lower())
+    force_search = "搜索请求" in matched
+    needs_verification = any(category in matched for category in VERIFICATION_KEYWORDS)
+    if QUOTE_MARK_RE.search(message) or CAPITALIZED_RE.search(message):
+        needs_verification = True
+    is_literary = "书籍作品" in matched or "典故" in matched
+    candidates = []
+    if ("歌词" in matched or force_search) and not is_literary:
+        for pattern in COMPILED_SONG:
+            candidates.extend(pattern.findall(message))
+    if any(category in matched for category in ("典故", "诗词古文", "人物", "书籍作品")):
+        for pattern in COMPILED_QUOTE:
+            candidates.extend(pattern.findall(message))
+    if "香水品牌" in matched or "香水名称" in matched:
+        for pattern in COMPILED_PERFUME:
+            candidates.extend(pattern.findall(message))
+    return force_search, needs_verification, is_literary, candidates
+
+
+def bench(fn, messages, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            fn(message)
+    return (time.perf_counter() - start) / (repeat * len(messages)) * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="关键词匹配微基准")
+    parser.add_argument("--conversations", default=os.path.join(BACKEND_DIR, "conversations"))
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    messages = [history[-1]["content"] for _, history in iter_user_turns(args.conversations)]
+    messages += [row["text"] for row in read_labels([os.path.join(BACKEND_DIR, "intent_seed.jsonl")])]
+    mismatches = [m for m in messages if legacy_classify(m) != matcher_classify(m)]
+    if mismatches:
+        sys.exit(f"[基准] 两种实现结果不一致: {mismatches[:5]}")
+
+    legacy_us = bench(legacy_classify, messages, args.repeat)
+    matcher_us = bench(matcher_classify, messages, args.repeat)
+    scan_us = bench(lambda m: SEARCH_KEYWORD_MATCHER.classify(m.lower()), messages, args.repeat)
+    print(f"[基准] {len(messages)} 条消息 × {args.repeat} 轮，结果一致")
+    print(f"  旧实现（any + 行内正则）: {legacy_us:.2f} µs/条")
+    print(f"  KeywordMatcher + 预编译正则: {matcher_us:.2f} µs/条（{legacy_us / matcher_us:.2f}x）")
+    print(f"  其中单次关键词扫描（全部 {len(SEARCH_KEYWORD_MATCHER.categories)} 个类别）: {scan_us:.2f} µs/条")
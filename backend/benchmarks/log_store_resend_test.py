@@ -0,0 +1,83 @@
+"""LogConversationStore 全量重发测试：客户端历史与日志不一致时整体重写，而不是在旧前缀后追加
+
+在临时目录里依次保存：
+
+1. 正常的两轮对话：第二轮只追加新消息
+2. 同样长度、但第一条用户消息被编辑过的历史（delta 409 后的全量重发 / 编辑历史）：
+   读回的必须是新历史，而不是旧前缀 + 新尾部
+3. 在被编辑的历史后面再追加一轮：恢复为追加写
+4. 元数据里没有 log_sha256 的旧会话：第一次保存整体重写并补上哈希
+
+    python benchmarks/log_store_resend_test.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from storage import LogConversationStore, atomic_write_json, read_json  # noqa: E402
+
+NOW = "2026-01-01T00:00:00Z"
+
+
+def _turn(user: str, reply: str) -> list:
+    return [{"role": "user", "content": user}, {"role": "assistant", "content": reply}]
+
+
+def main() -> int:
+    workdir = tempfile.mkdtemp(prefix="log-store-test-")
+    try:
+        store = LogConversationStore(workdir)
+        log_path = store.log_path("c1")
+        failures = []
+
+        def check(label: str, expected: list) -> None:
+            loaded = store.load("c1")["messages"]
+            ok = loaded == expected
+            print(f"[日志存储测试] {label}: {'✅' if ok else '❌'}")
+            if not ok:
+                failures.append(label)
+                print(f"[日志存储测试]   期望 {expected}\n[日志存储测试]   实际 {loaded}")
+
+        history = _turn("你好", "你好呀")
+        store.save_turn("c1", history, None, NOW)
+        history = history + _turn("推荐一款木质香", "试试檀香")
+        size_before = os.path.getsize(log_path)
+        store.save_turn("c1", history, None, NOW)
+        check("两轮追加", history)
+        appended = os.path.getsize(log_path) > size_before
+
+        # 同样 4 条消息，但第一轮被编辑过
+        edited = _turn("晚上好", "晚上好呀") + _turn("推荐一款木质香", "试试雪松")
+        store.save_turn("c1", edited, None, NOW)
+        check("同长度不同内容的重发", edited)
+
+        edited = edited + _turn("再来一款花香", "试试鸢尾")
+        store.save_turn("c1", edited, None, NOW)
+        check("重发后继续追加", edited)
+
+        # 模拟升级前的元数据（没有 log_sha256）
+        meta_path = store.meta_path("c1")
+        meta = read_json(meta_path)
+        meta.pop("log_sha256")
+        atomic_write_json(meta_path, meta)
+        legacy = _turn("换个话题", "好的") + edited[2:]
+        store.save_turn("c1", legacy, None, NOW)
+        check("旧元数据整体重写", legacy)
+        has_hash = "log_sha256" in read_json(meta_path)
+        print(f"[日志存储测试] 旧元数据补上 log_sha256: {'✅' if has_hash else '❌'}")
+        print(f"[日志存储测试] 正常轮次为追加写: {'✅' if appended else '❌'}")
+        if not has_hash:
+            failures.append("log_sha256")
+        if not appended:
+            failures.append("append")
+        return 1 if failures else 0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
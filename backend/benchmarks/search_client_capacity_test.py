@@ -0,0 +1,86 @@
+"""TavilySearchClient 容量测试：并发槽位 + 排队上限内的请求全部接受，超出的才被拒绝
+
+用 httpx.MockTransport 模拟带固定耗时的 /search，不访问网络：
+
+1. 同时发出 max_concurrency + max_queue 个请求：全部完成，没有 SearchBusyError，上游峰值并发等于 max_concurrency
+2. 再多一个：恰好 1 个被拒绝
+
+    python benchmarks/search_client_capacity_test.py --concurrency 4 --queue 6
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx  # noqa: E402
+
+from search_client import SearchBusyError, TavilySearchClient  # noqa: E402
+
+UPSTREAM_DELAY = 0.2  # 模拟的 /search 耗时（秒）
+
+
+async def burst(concurrency: int, max_queue: int, calls: int) -> dict:
+    active = 0
+    peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        try:
+            await asyncio.sleep(UPSTREAM_DELAY)
+        finally:
+            active -= 1
+        return httpx.Response(200, json={"results": []})
+
+    client = TavilySearchClient(
+        "test", max_concurrency=concurrency, max_queue=max_queue, timeout=30, transport=httpx.MockTransport(handler)
+    )
+    try:
+        results = await asyncio.gather(
+            *[client.search(query=f"q{i}") for i in range(calls)], return_exceptions=True
+        )
+    finally:
+        await client.close()
+    return {
+        "completed": sum(isinstance(r, dict) for r in results),
+        "rejected": sum(isinstance(r, SearchBusyError) for r in results),
+        "peak": peak,
+        "metrics": client.metrics(),
+    }
+
+
+async def run(concurrency: int, max_queue: int) -> int:
+    capacity = concurrency + max_queue
+    failures = []
+
+    full = await burst(concurrency, max_queue, capacity)
+    print(f"[容量测试] {capacity} 个并发请求（{concurrency} 槽位 + {max_queue} 排队）: {full}")
+    if full["completed"] != capacity or full["rejected"]:
+        failures.append(f"槽位与队列恰好占满时应全部接受，实际完成 {full['completed']}、拒绝 {full['rejected']}")
+    if full["peak"] != concurrency:
+        failures.append(f"上游峰值并发 {full['peak']}（期望 {concurrency}）")
+    if full["metrics"]["waiting"] or full["metrics"]["running"]:
+        failures.append(f"结束后计数未归零: {full['metrics']}")
+
+    over = await burst(concurrency, max_queue, capacity + 1)
+    print(f"[容量测试] {capacity + 1} 个并发请求: {over}")
+    if over["completed"] != capacity or over["rejected"] != 1:
+        failures.append(f"超出 1 个时应恰好拒绝 1 个，实际完成 {over['completed']}、拒绝 {over['rejected']}")
+
+    for failure in failures:
+        print(f"[容量测试] ❌ {failure}")
+    if not failures:
+        print("[容量测试] ✅ 容量 = 并发槽位 + 排队上限")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TavilySearchClient 容量测试")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--queue", type=int, default=6)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.concurrency, args.queue)))
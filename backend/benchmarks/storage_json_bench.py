@@ -0,0 +1,115 @@
+"""存储 JSON 编解码基准：标准库 json + 缩进（旧格式）与 serialization 层（orjson + 紧凑格式）的对比
+
+把仓库里 conversations/ 与 recipes/ 的样例数据按原有比例复制扩充到 N 个文件（每个副本换一个 id），
+对每种编码方式分别测量：
+
+1. 编码：只把所有文档编码成字节串（不写盘）
+2. 保存：经 atomic_write_json 写入临时目录（与服务保存会话 / 配方的路径相同，含 fsync）
+3. 列表：解析全部文件生成列表数据（配方画廊 list_recipes 与会话清单对账时逐个读取会话摘要的路径）
+
+刚写完的文件在页缓存里，列表一项测的是解析而不是磁盘读取。
+
+    python benchmarks/storage_json_bench.py -n 100000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import serialization  # noqa: E402
+from storage import FileSystemBackend, JsonConversationStore, atomic_write_json, read_json  # noqa: E402
+
+
+def _samples(kind: str) -> list:
+    directory = os.path.join(BACKEND_DIR, kind)
+    docs = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".json") and not filename.startswith("."):
+            data = read_json(os.path.join(directory, filename))
+            if data is not None:
+                docs.append(data)
+    return docs
+
+
+def _scaled(conversations: list, recipes: list, n: int) -> list:
+    """按样例中会话与配方的比例扩充到 n 个 (目录, id, 文档)"""
+    n_conversations = round(n * len(conversations) / (len(conversations) + len(recipes)))
+    items = []
+    for i in range(n_conversations):
+        doc = {**conversations[i % len(conversations)], "id": f"bench-conv-{i:06d}"}
+        items.append(("conversations", doc["id"], doc))
+    for i in range(n - n_conversations):
+        doc = {**recipes[i % len(recipes)], "id": f"bench-recipe-{i:06d}"}
+        items.append(("recipes", doc["id"], doc))
+    return items
+
+
+def _report(label: str, count: int, elapsed: float, extra: str = "") -> float:
+    print(f"[存储基准]   {label}: {count} 个 {elapsed:.2f}s，{count / elapsed:,.0f} 个/秒{extra}")
+    return count / elapsed
+
+
+def run_mode(label: str, use_orjson: bool, pretty: bool, items: list) -> dict:
+    codec = serialization.orjson
+    serialization.orjson = codec if use_orjson else None
+    serialization.JSON_PRETTY = pretty
+    workdir = tempfile.mkdtemp(prefix="storage-bench-")
+    try:
+        conversations_dir = os.path.join(workdir, "conversations")
+        recipes_dir = os.path.join(workdir, "recipes")
+        os.makedirs(conversations_dir)
+        os.makedirs(recipes_dir)
+        print(f"[存储基准] {label}")
+        rates = {}
+
+        start = time.perf_counter()
+        encoded_bytes = sum(len(serialization.dumps_bytes(doc)) for _, _, doc in items)
+        rates["encode"] = _report("编码", len(items), time.perf_counter() - start,
+                                  f"，共 {encoded_bytes / 1024 / 1024:.1f} MB")
+
+        start = time.perf_counter()
+        for kind, doc_id, doc in items:
+            atomic_write_json(os.path.join(workdir, kind, f"{doc_id}.json"), doc)
+        rates["save"] = _report("保存", len(items), time.perf_counter() - start)
+
+        backend = FileSystemBackend(conversations_dir, recipes_dir, os.path.join(workdir, "index.sqlite3"))
+        store = JsonConversationStore(conversations_dir)
+        start = time.perf_counter()
+        recipes = backend.list_recipes()
+        summaries = [store.summary(conversation_id) for conversation_id, _ in store.scan()]
+        listed = len(recipes) + len(summaries)
+        assert listed == len(items), f"列表条目 {listed} != {len(items)}"
+        rates["list"] = _report("列表", listed, time.perf_counter() - start)
+        return rates
+    finally:
+        serialization.orjson = codec
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(n: int) -> int:
+    conversations = _samples("conversations")
+    recipes = _samples("recipes")
+    print(f"[存储基准] 样例：{len(conversations)} 个会话、{len(recipes)} 个配方，扩充到 {n} 个文件")
+    items = _scaled(conversations, recipes, n)
+
+    baseline = run_mode("标准库 json，indent=2（旧格式）", use_orjson=False, pretty=True, items=items)
+    if serialization.orjson is not None:
+        current = run_mode("serialization：orjson，紧凑格式（新默认）", use_orjson=True, pretty=False, items=items)
+    else:
+        print("[存储基准] 未安装 orjson，新默认为标准库 json 紧凑格式")
+        current = run_mode("serialization：标准库 json，紧凑格式（新默认）", use_orjson=False, pretty=False, items=items)
+    for name in ("encode", "save", "list"):
+        print(f"[存储基准] {name}: {current[name] / baseline[name]:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="存储 JSON 编解码基准")
+    parser.add_argument("-n", type=int, default=100000, help="扩充后的文件总数")
+    args = parser.parse_args()
+    sys.exit(main(args.n))
@@ -0,0 +1,48 @@
+"""chat_context.summary_cut 边界测试：保留轮数大于未摘要轮数时不抛异常
+
+    python benchmarks/summary_cut_test.py
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from chat_context import summary_cut  # noqa: E402
+
+
+def _history(turns: int) -> list:
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"问题 {i}"})
+        messages.append({"role": "assistant", "content": f"回答 {i}"})
+    return messages
+
+
+# (说明, 消息, summarized, after_turns, keep_turns, 期望)
+CASES = [
+    ("未超过 after_turns", _history(2), 0, 2, 1, None),
+    ("保留最近 1 轮", _history(3), 0, 2, 1, 4),
+    ("keep_turns > 轮数（KEEP > AFTER）", _history(3), 0, 2, 10, None),
+    ("keep_turns == 轮数", _history(3), 0, 2, 3, None),
+    ("已有摘要边界 + keep_turns 过大", _history(6), 4, 2, 10, None),
+    ("已有摘要边界 + 保留 2 轮", _history(6), 4, 2, 2, 8),
+    ("keep_turns = 0 摘要全部", _history(3), 0, 2, 0, 6),
+]
+
+
+def main() -> int:
+    failures = 0
+    for label, messages, summarized, after_turns, keep_turns, expected in CASES:
+        try:
+            result = summary_cut(messages, summarized, after_turns, keep_turns)
+        except Exception as e:  # noqa: BLE001
+            result = f"{type(e).__name__}: {e}"
+        ok = result == expected
+        failures += not ok
+        print(f"[摘要边界测试] {label}: {'✅' if ok else '❌'} (期望 {expected}，实际 {result})")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""进程内缓存工具
+
+- SingleFlight：相同 key 的并发调用只执行一次，其余调用方等待同一个结果
+- TTLCache：带过期时间的缓存，get_or_load 在未命中时通过 SingleFlight 加载，
+  并发的未命中只触发一次上游请求；可设条目上限（LRU 淘汰），
+  字符串 key 的缓存可以 save / load 到 JSON 文件，重启后继续使用
+- StaleWhileRevalidate：持久化结果的读取策略，新鲜结果直接返回，过期不久的结果先返回、
+  后台刷新，太旧或缺失时同步计算（同一个 key 同时只计算一次）
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class SingleFlight:
+    """合并相同 key 的并发调用
+
+    上游调用在独立的 Task 中执行：发起者被取消时，其他等待者仍能拿到结果。
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0  # 实际执行的上游调用次数
+        self.shared = 0  # 复用进行中调用的次数
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def running(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+
+class TTLCache:
+    """带过期时间的键值缓存
+
+    ttl_fn 可以按值决定过期时间（例如失败 / 空结果只缓存很短时间）；
+    max_entries 限制条目数，超出时淘汰最久未使用的条目。
+    过期时间使用墙上时钟，便于持久化后在重启时继续判断。
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        ttl_fn: Optional[Callable[[Any], float]] = None,
+        max_entries: Optional[int] = None,
+    ):
+        self.ttl = ttl
+        self._ttl_fn = ttl_fn
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if time.time() >= expires_at:
+            self._data.pop(key, None)
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            ttl = self._ttl_fn(value) if self._ttl_fn else self.ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (time.time() + ttl, value)
+        self._data.move_to_end(key)
+        if self.max_entries is not None:
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        hit, value = self.get(key)
+        if hit:
+            self.hits += 1
+            return value
+        self.misses += 1
+
+        async def load_and_store() -> Any:
+            result = await loader()
+            self.set(key, result)
+            return result
+
+        return await self._flight.do(key, load_and_store)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def save(self, path: str) -> int:
+        """把未过期的条目写入 JSON 文件（原子替换，按 LRU 顺序），返回写入条数；要求 key 为字符串"""
+        now = time.time()
+        entries = [[key, expires_at, value] for key, (expires_at, value) in self._data.items() if expires_at > now]
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".cache-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return len(entries)
+
+    def load(self, path: str) -> int:
+        """从 save 写出的文件恢复未过期的条目，返回恢复条数；文件缺失或损坏时返回 0"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        now = time.time()
+        loaded = 0
+        for key, expires_at, value in entries:
+            if expires_at > now:
+                self._data[key] = (expires_at, value)
+                self._data.move_to_end(key)
+                loaded += 1
+        if self.max_entries is not None:
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return loaded
+
+    def metrics(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "upstream_calls": self._flight.calls,
+            "shared_inflight": self._flight.shared,
+        }
+
+
+class StaleWhileRevalidate:
+    """stale-while-revalidate 读取
+
+    store 需提供线程安全的 get(key) -> Optional[(更新时间戳, 值)] 与 put(key, 值)；
+    age < fresh_ttl 直接返回，age < max_stale 返回旧值并在后台刷新，否则等待重新计算。
+    should_store 决定结果是否写入 store（例如“未找到”不保存）。
+    """
+
+    def __init__(
+        self,
+        store: Any,
+        fresh_ttl: float,
+        max_stale: float,
+        should_store: Optional[Callable[[Any], bool]] = None,
+    ):
+        self.store = store
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        self._should_store = should_store or (lambda value: True)
+        self._flight = SingleFlight()
+        self._background: set = set()
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    async def _load_and_store(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = await loader()
+        if self._should_store(value):
+            await asyncio.to_thread(self.store.put, key, value)
+        return value
+
+    async def get(self, key: str, loader: Callable[[], Awaitable[Any]], refresh: bool = False) -> Any:
+        """读取 key；refresh=True 时忽略已有结果、重新计算（预热用）"""
+        # store 的读写都是同步 I/O（SQLite），放到线程里执行，避免磁盘慢或 WAL 被锁时阻塞事件循环
+        entry = None if refresh else await asyncio.to_thread(self.store.get, key)
+        if entry is not None:
+            updated_at, value = entry
+            age = time.time() - updated_at
+            if age < self.fresh_ttl:
+                self.fresh_hits += 1
+                return value
+            if age < self.max_stale:
+                self.stale_hits += 1
+                self._refresh_in_background(key, loader)
+                return value
+        self.misses += 1
+        return await self._flight.do(key, lambda: self._load_and_store(key, loader))
+
+    def _refresh_in_background(self, key: str, loader: Callable[[], Awaitable[Any]]) -> None:
+        if self._flight.running(key):
+            return
+        self.refreshes += 1
+        task = asyncio.ensure_future(self._flight.do(key, lambda: self._load_and_store(key, loader)))
+        self._background.add(task)
+        task.add_done_callback(self._refresh_done)
+
+    def _refresh_done(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.refresh_failures += 1
+            print(f"[缓存刷新] 后台刷新失败: {task.exception()}")
+
+    async def close(self) -> None:
+        for task in list(self._background):
+            task.cancel()
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+
+    def metrics(self) -> dict:
+        total = self.fresh_hits + self.stale_hits + self.misses
+        return {
+            "fresh_hits": self.fresh_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.fresh_hits + self.stale_hits) / total, 4) if total else 0.0,
+            "background_refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "refreshing": len(self._background),
+        }
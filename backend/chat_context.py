@@ -0,0 +1,133 @@
+"""Salon 对话的上下文组装（滚动摘要 + token 预算）
+
+发给 LLM 的 messages = 固定的系统提示词前缀 + 少量动态系统消息（称呼、较早对话的摘要、搜索结果）+ 对话历史。
+
+- 滚动摘要：未摘要的部分超过 N 轮后，较早的轮次被压缩进会话里保存的摘要，只保留最近 K 轮原文
+  （summary_cut 计算新的摘要边界，摘要本身由 server 在后台调用 LLM 生成）；
+- token 预算：从最新的消息往前保留，超出预算的较早轮次被省略，
+  省略从完整的一轮（用户消息开头）处切开，最后一条用户消息总是保留。
+
+token 数是估算值（中日韩字符按 1 个 token、其他字符按 4 个字符 1 个 token、每条消息另加 4 个），
+用于预算和统计，不依赖具体模型的分词器。
+"""
+import re
+import threading
+from typing import List, NamedTuple, Optional, Tuple
+
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextStats(NamedTuple):
+    system_tokens: int  # 系统消息（固定前缀 + 动态部分）
+    history_tokens: int  # 实际发送的历史
+    history_sent: int  # 发送的历史消息数
+    history_dropped: int  # 因预算省略的历史消息数
+    history_summarized: int = 0  # 已被摘要代替的历史消息数
+
+    @property
+    def input_tokens(self) -> int:
+        return self.system_tokens + self.history_tokens
+
+
+def trim_history(history: List[dict], budget: int) -> Tuple[List[dict], int]:
+    """按 token 预算保留最近的历史，返回 (保留的消息, 保留部分的 token 数)"""
+    kept = 0
+    used = 0
+    for message in reversed(history):
+        cost = message_tokens(message)
+        if kept and used + cost > budget:
+            break
+        kept += 1
+        used += cost
+    start = len(history) - kept
+    # 不从一轮对话中间切开：保留部分以用户消息开头
+    while start < len(history) - 1 and history[start]["role"] != "user":
+        used -= message_tokens(history[start])
+        start += 1
+    return history[start:], used
+
+
+def summary_cut(messages: List[dict], summarized: int, after_turns: int, keep_turns: int) -> Optional[int]:
+    """摘要边界之后超过 after_turns 轮（用户消息数）时，返回新的边界（保留最近 keep_turns 轮原文）；否则 None"""
+    if after_turns <= 0:
+        return None
+    turn_starts = [i for i in range(summarized, len(messages)) if messages[i]["role"] == "user"]
+    if len(turn_starts) <= after_turns:
+        return None
+    # keep_turns 可能大于未摘要的轮数（CHAT_SUMMARY_KEEP_TURNS >= CHAT_SUMMARY_AFTER_TURNS），此时保留全部
+    cut = turn_starts[max(0, len(turn_starts) - keep_turns)] if keep_turns > 0 else len(messages)
+    return cut if cut > summarized else None
+
+
+def assemble_messages(
+    system_messages: List[dict], history: List[dict], history_budget: int, summarized: int = 0
+) -> Tuple[List[dict], ContextStats]:
+    """组装发给 LLM 的 messages；history 为摘要边界之后的历史，history_budget <= 0 时不限制"""
+    if history_budget > 0:
+        kept, history_tokens = trim_history(history, history_budget)
+    else:
+        kept, history_tokens = history, sum(message_tokens(m) for m in history)
+    stats = ContextStats(
+        system_tokens=sum(message_tokens(m) for m in system_messages),
+        history_tokens=history_tokens,
+        history_sent=len(kept),
+        history_dropped=len(history) - len(kept),
+        history_summarized=summarized,
+    )
+    return [*system_messages, *kept], stats
+
+
+class ContextMetrics:
+    """每次请求的输入 token 统计（/api/metrics）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.input_tokens = 0
+        self.max_input_tokens = 0
+        self.trimmed_requests = 0
+        self.dropped_messages = 0
+        self.summarized_requests = 0
+        self.summaries_generated = 0
+        self.summary_failures = 0
+
+    def record(self, stats: ContextStats) -> None:
+        with self._lock:
+            self.requests += 1
+            self.input_tokens += stats.input_tokens
+            self.max_input_tokens = max(self.max_input_tokens, stats.input_tokens)
+            if stats.history_dropped:
+                self.trimmed_requests += 1
+                self.dropped_messages += stats.history_dropped
+            if stats.history_summarized:
+                self.summarized_requests += 1
+
+    def record_summary(self, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.summaries_generated += 1
+            else:
+                self.summary_failures += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "avg_input_tokens": round(self.input_tokens / self.requests, 1) if self.requests else 0.0,
+                "max_input_tokens": self.max_input_tokens,
+                "trimmed_requests": self.trimmed_requests,
+                "dropped_messages": self.dropped_messages,
+                "summarized_requests": self.summarized_requests,
+                "summaries_generated": self.summaries_generated,
+                "summary_failures": self.summary_failures,
+            }
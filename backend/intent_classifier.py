@@ -0,0 +1,331 @@
+"""本地意图分类器（判断 Salon 消息是否需要联网搜索）
+
+detect_intent 先用本地分类器判断，只有低置信度的消息才调用 LLM：
+
+- 规则：intent_model.json 中的搜索关键词 / 正则命中 -> 需要搜索；
+  寒暄、应答类短句（chat_patterns）-> 不需要搜索
+- 线性模型：字符 n-gram 上的逻辑回归，概率 >= high 判为需要，<= low 判为不需要，
+  介于两者之间返回 None（交给 LLM）
+- 模型文件缺失或加载失败时只用 QUICK_SEARCH_KEYWORDS 关键词规则（原有的快速通道），其余消息交给 LLM
+
+模型文件由 train 命令生成，评估命令对比 LLM 标注并统计节省的延迟：
+
+    python intent_classifier.py label --conversations conversations --out intent_labels.jsonl
+    python intent_classifier.py train --labels intent_seed.jsonl intent_labels.jsonl
+    python intent_classifier.py evaluate --labels intent_labels.jsonl --folds 5
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_model.json")
+
+# 没有可用模型时的关键词快速通道（与 intent_model.json 的 search_keywords 初始值相同）
+QUICK_SEARCH_KEYWORDS = [
+    "搜索", "查一下", "查找", "帮我查", "能否搜索", "search", "lookup", "find",
+    "歌词", "lyrics", "是谁", "哪一年", "什么时候", "where", "when", "who",
+    "你知道", "知道", "了解", "你了解", "你听说过", "听说过",
+    "英文名", "全名", "叫什么", "哪里买", "价格", "多少钱", "how much", "price", "buy", "where to buy",
+]
+
+
+class IntentDecision(NamedTuple):
+    should_search: Optional[bool]  # None 表示本地无法确定，需要 LLM
+    confidence: float  # 模型给出的“需要搜索”概率；规则命中时为 1.0 / 0.0
+    source: str  # "rule" / "model"
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+
+def char_ngrams(text: str, n_min: int = 1, n_max: int = 3) -> Dict[str, int]:
+    """统计字符 n-gram（首尾加边界符 ^ $，便于区分整句寒暄）"""
+    padded = f"^{normalize(text)}$"
+    counts: Dict[str, int] = {}
+    for n in range(n_min, n_max + 1):
+        for i in range(len(padded) - n + 1):
+            gram = padded[i:i + n]
+            counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+def _sigmoid(z: float) -> float:
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+
+class IntentClassifier:
+    def __init__(self, model: dict):
+        self.model = model
+        keywords = [re.escape(kw.lower()) for kw in model.get("search_keywords", [])]
+        patterns = keywords + list(model.get("search_patterns", []))
+        self._search_re = re.compile("|".join(patterns)) if patterns else None
+        chat_patterns = model.get("chat_patterns", [])
+        self._chat_re = re.compile("|".join(f"(?:{p})" for p in chat_patterns)) if chat_patterns else None
+        self.n_min, self.n_max = model.get("ngram_range", [1, 3])
+        self.bias = float(model.get("bias", 0.0))
+        self.weights: Dict[str, float] = model.get("weights", {})
+        self.high = float(model.get("high", 0.85))
+        self.low = float(model.get("low", 0.15))
+        self.stats = {"rule": 0, "model": 0, "deferred": 0}
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> "IntentClassifier":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def keywords_only(cls) -> "IntentClassifier":
+        """只有关键词规则、没有线性模型：规则未命中的消息一律交给 LLM"""
+        return cls({"search_keywords": QUICK_SEARCH_KEYWORDS})
+
+    @classmethod
+    def load_or_keywords(cls, path: str = MODEL_PATH) -> "IntentClassifier":
+        """加载模型文件；缺失或无法解析时退回 keywords_only()"""
+        try:
+            classifier = cls.load(path)
+            print(f"[意图识别] 已加载本地分类器: {path}")
+            return classifier
+        except Exception as e:
+            print(f"[意图识别] ⚠️ 本地分类器加载失败，只使用关键词规则，其余交给 LLM: {e}")
+            return cls.keywords_only()
+
+    @property
+    def has_model(self) -> bool:
+        return bool(self.weights)
+
+    def probability(self, text: str) -> float:
+        z = self.bias
+        for gram, count in char_ngrams(text, self.n_min, self.n_max).items():
+            weight = self.weights.get(gram)
+            if weight is not None:
+                z += weight * count
+        return _sigmoid(z)
+
+    def classify(self, text: str) -> IntentDecision:
+        text_lower = normalize(text)
+        if self._search_re is not None and self._search_re.search(text_lower):
+            self.stats["rule"] += 1
+            return IntentDecision(True, 1.0, "rule")
+        if self._chat_re is not None and self._chat_re.fullmatch(text_lower):
+            self.stats["rule"] += 1
+            return IntentDecision(False, 0.0, "rule")
+        if not self.has_model:
+            self.stats["deferred"] += 1
+            return IntentDecision(None, 0.5, "rule")
+        p = self.probability(text)
+        if p >= self.high:
+            self.stats["model"] += 1
+            return IntentDecision(True, p, "model")
+        if p <= self.low:
+            self.stats["model"] += 1
+            return IntentDecision(False, p, "model")
+        self.stats["deferred"] += 1
+        return IntentDecision(None, p, "model")
+
+    def metrics(self) -> dict:
+        total = sum(self.stats.values())
+        local = self.stats["rule"] + self.stats["model"]
+        return {
+            **self.stats,
+            "has_model": self.has_model,
+            "local_ratio": round(local / total, 4) if total else 0.0,
+        }
+
+
+# ---- 训练 ----
+
+def train_weights(
+    examples: List[Tuple[str, bool]],
+    ngram_range: Tuple[int, int] = (1, 3),
+    epochs: int = 30,
+    learning_rate: float = 0.2,
+    l2: float = 1e-3,
+    seed: int = 7,
+) -> Tuple[float, Dict[str, float]]:
+    """SGD 训练逻辑回归，返回 (bias, weights)；固定随机种子保证结果可复现"""
+    n_min, n_max = ngram_range
+    data = [(char_ngrams(text, n_min, n_max), 1.0 if label else 0.0) for text, label in examples]
+    rng = random.Random(seed)
+    bias = 0.0
+    weights: Dict[str, float] = {}
+    for epoch in range(epochs):
+        rng.shuffle(data)
+        lr = learning_rate / (1 + epoch * 0.1)
+        for features, y in data:
+            z = bias + sum(weights.get(g, 0.0) * c for g, c in features.items())
+            grad = _sigmoid(z) - y
+            bias -= lr * grad
+            for gram, count in features.items():
+                w = weights.get(gram, 0.0)
+                weights[gram] = w - lr * (grad * count + l2 * w)
+    # 去掉接近 0 的权重，控制模型文件大小
+    pruned = {g: round(w, 4) for g, w in weights.items() if abs(w) >= 0.01}
+    return round(bias, 4), dict(sorted(pruned.items()))
+
+
+def read_labels(paths: Iterable[str]) -> List[dict]:
+    """读取 JSONL 标注（text / label，可选 latency_ms），同一文本以后出现的为准"""
+    rows: Dict[str, dict] = {}
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    row = json.loads(line)
+                    rows[row["text"]] = row
+    return list(rows.values())
+
+
+def iter_user_turns(conversations_dir: str) -> Iterator[Tuple[str, List[dict]]]:
+    """遍历已保存会话中的每条用户消息，返回 (会话 id, 截至该消息的历史)"""
+    from storage import LogConversationStore  # log 存储能同时读出旧 .json 与 JSONL 会话
+
+    store = LogConversationStore(conversations_dir)
+    for data in store.iter_documents():
+        messages = [
+            {"role": m.get("role"), "content": m.get("content", "")}
+            for m in data.get("messages", [])
+        ]
+        for i, msg in enumerate(messages):
+            if msg["role"] == "user" and msg["content"]:
+                yield data["id"], messages[:i + 1]
+
+
+async def label_conversations(conversations_dir: str, out_path: str) -> int:
+    """用 LLM 意图识别为已保存会话的用户消息打标，记录每次调用耗时（已标注的文本跳过）"""
+    from server import _llm_detect_intent  # 需要 .env 中的 LLM 配置
+
+    done = {row["text"] for row in read_labels([out_path])} if os.path.exists(out_path) else set()
+    labeled = 0
+    with open(out_path, "a", encoding="utf-8") as out:
+        for conversation_id, history in iter_user_turns(conversations_dir):
+            text = history[-1]["content"]
+            if text in done:
+                continue
+            start = time.perf_counter()
+            try:
+                label = await _llm_detect_intent(history, text)
+            except Exception as e:
+                print(f"[意图标注] 会话 {conversation_id} 调用失败，跳过: {e}")
+                continue
+            latency_ms = (time.perf_counter() - start) * 1000
+            out.write(json.dumps(
+                {"conversation_id": conversation_id, "text": text, "label": label, "latency_ms": round(latency_ms, 1)},
+                ensure_ascii=False,
+            ) + "\n")
+            done.add(text)
+            labeled += 1
+    return labeled
+
+
+def evaluate(model: dict, rows: List[dict], assumed_llm_ms: float, folds: int = 0) -> dict:
+    """本地判断与标注对比：覆盖率、本地判断准确率、节省的 LLM 调用与延迟
+
+    folds > 1 时做 k 折交叉验证：每折用其余样本重新训练线性模型，只在留出的样本上评估，
+    避免用训练集评估导致的虚高。
+    """
+    decisions: List[Tuple[dict, IntentDecision, float]] = []
+    if folds > 1:
+        shuffled = list(rows)
+        random.Random(7).shuffle(shuffled)
+        parts = [shuffled[i::folds] for i in range(folds)]
+        for k, held_out in enumerate(parts):
+            train_rows = [row for i, part in enumerate(parts) if i != k for row in part]
+            fold_model = dict(model)
+            fold_model["bias"], fold_model["weights"] = train_weights(
+                [(row["text"], bool(row["label"])) for row in train_rows],
+                tuple(model.get("ngram_range", [1, 3])),
+            )
+            classifier = IntentClassifier(fold_model)
+            for row in held_out:
+                start = time.perf_counter()
+                decision = classifier.classify(row["text"])
+                decisions.append((row, decision, (time.perf_counter() - start) * 1e6))
+    else:
+        classifier = IntentClassifier(model)
+        for row in rows:
+            start = time.perf_counter()
+            decision = classifier.classify(row["text"])
+            decisions.append((row, decision, (time.perf_counter() - start) * 1e6))
+
+    local = correct = 0
+    saved_ms = 0.0
+    local_us = 0.0
+    for row, decision, elapsed_us in decisions:
+        local_us += elapsed_us
+        if decision.should_search is None:
+            continue
+        local += 1
+        correct += decision.should_search == bool(row["label"])
+        saved_ms += float(row.get("latency_ms") or assumed_llm_ms)
+    total = len(rows)
+    return {
+        "messages": total,
+        "decided_locally": local,
+        "coverage": round(local / total, 4) if total else 0.0,
+        "local_accuracy": round(correct / local, 4) if local else 0.0,
+        # 交给 LLM 的消息与标注一致，整体准确率只受本地误判影响
+        "overall_accuracy": round((total - (local - correct)) / total, 4) if total else 0.0,
+        "llm_calls_saved": local,
+        "latency_saved_ms": round(saved_ms, 1),
+        "latency_saved_per_turn_ms": round(saved_ms / total, 1) if total else 0.0,
+        "local_classify_us_avg": round(local_us / total, 1) if total else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="本地意图分类器工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    label_parser = sub.add_parser("label", help="调用 LLM 为已保存会话的用户消息打标")
+    label_parser.add_argument("--conversations", default=os.path.join(base_dir, "conversations"))
+    label_parser.add_argument("--out", default=os.path.join(base_dir, "intent_labels.jsonl"))
+
+    train_parser = sub.add_parser("train", help="根据标注训练线性模型，写回模型文件")
+    train_parser.add_argument("--labels", nargs="+", required=True, help="JSONL 标注文件（text / label）")
+    train_parser.add_argument("--model", default=MODEL_PATH)
+    train_parser.add_argument("--epochs", type=int, default=30)
+
+    eval_parser = sub.add_parser("evaluate", help="对比标注评估本地分类器")
+    eval_parser.add_argument("--labels", nargs="+", default=[os.path.join(base_dir, "intent_labels.jsonl")])
+    eval_parser.add_argument("--model", default=MODEL_PATH)
+    eval_parser.add_argument("--folds", type=int, default=5, help="交叉验证折数（0 表示直接评估模型文件）")
+    eval_parser.add_argument(
+        "--assumed-llm-ms", type=float, default=800.0,
+        help="标注中没有 latency_ms 时，假定每次 LLM 意图识别的耗时",
+    )
+    args = parser.parse_args()
+
+    if args.command == "label":
+        n = asyncio.run(label_conversations(args.conversations, args.out))
+        print(f"[意图标注] 新增 {n} 条标注 -> {args.out}")
+    elif args.command == "train":
+        rows = read_labels(args.labels)
+        with open(args.model, "r", encoding="utf-8") as f:
+            model = json.load(f)
+        model["bias"], model["weights"] = train_weights(
+            [(row["text"], bool(row["label"])) for row in rows],
+            tuple(model.get("ngram_range", [1, 3])),
+            epochs=args.epochs,
+        )
+        with open(args.model, "w", encoding="utf-8") as f:
+            json.dump(model, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"[意图训练] {len(rows)} 条样本，{len(model['weights'])} 个特征 -> {args.model}")
+    elif args.command == "evaluate":
+        with open(args.model, "r", encoding="utf-8") as f:
+            model = json.load(f)
+        report = evaluate(model, read_labels(args.labels), args.assumed_llm_ms, args.folds)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
@@ -0,0 +1,127 @@
+"""多类别关键词匹配器
+
+把所有类别的关键词编译成一个前缀树形式的正则，对消息只扫描一遍，
+得到每个类别命中的关键词及其位置（span），替代逐类别、逐关键词的 `any(kw in text ...)`。
+
+匹配语义与逐个 `kw in text` 完全一致：
+- 正则放在零宽前瞻里，每个位置都会尝试匹配，重叠的关键词也能找到；
+- 同一位置只会得到最长的关键词，它的前缀关键词（如 "香水品牌" 之于 "香水"）在编译时预先展开。
+
+SEARCH_KEYWORD_MATCHER 汇总了联网搜索启发式用到的全部类别；与旧实现的对比基准：
+
+    python benchmarks/keyword_matcher_bench.py
+"""
+import re
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+
+class KeywordMatch(NamedTuple):
+    keyword: str
+    start: int
+    end: int
+    categories: Tuple[str, ...]
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """把关键词列表编译成前缀树正则（分支按字符合并，较长的分支优先）"""
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: dict) -> str:
+        terminal = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal:
+            # 贪婪的可选分组：能匹配更长的关键词时优先取更长的
+            return f"(?:{body})?"
+        return body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    def __init__(self, categories: Dict[str, Iterable[str]]):
+        self.categories = {name: tuple(keywords) for name, keywords in categories.items()}
+        owners: Dict[str, List[str]] = {}
+        for name, keywords in self.categories.items():
+            for keyword in keywords:
+                keyword = keyword.lower()
+                if keyword and name not in owners.setdefault(keyword, []):
+                    owners[keyword].append(name)
+        # 每个关键词展开为它自身及所有作为其前缀的关键词：[(关键词, 所属类别)]
+        self._expansions: Dict[str, List[Tuple[str, Tuple[str, ...]]]] = {
+            keyword: [
+                (prefix, tuple(owners[prefix]))
+                for prefix in owners
+                if keyword.startswith(prefix)
+            ]
+            for keyword in owners
+        }
+        self._pattern = re.compile(f"(?=({_trie_pattern(owners)}))") if owners else None
+
+    def scan(self, text: str) -> List[KeywordMatch]:
+        """返回文本（按小写匹配）中所有关键词出现的位置"""
+        if self._pattern is None:
+            return []
+        matches: List[KeywordMatch] = []
+        for m in self._pattern.finditer(text.lower()):
+            start = m.start()
+            for keyword, categories in self._expansions[m.group(1)]:
+                matches.append(KeywordMatch(keyword, start, start + len(keyword), categories))
+        return matches
+
+    def classify(self, text: str) -> Dict[str, List[Tuple[int, int]]]:
+        """一次扫描得到命中的类别：{类别: [(start, end), ...]}，未命中的类别不出现"""
+        spans: Dict[str, List[Tuple[int, int]]] = {}
+        for match in self.scan(text):
+            for category in match.categories:
+                spans.setdefault(category, []).append((match.start, match.end))
+        return spans
+
+    def matches(self, text: str, *categories: str) -> bool:
+        """文本是否命中任一给定类别（不传类别时为任一类别）"""
+        found = self.classify(text)
+        if not categories:
+            return bool(found)
+        return any(category in found for category in categories)
+
+
+# ---- 联网搜索启发式使用的关键词类别（_perform_searches / detect_intent / chat_endpoint） ----
+
+# 需要验证的关键词（扩展列表，覆盖更多情况）
+VERIFICATION_KEYWORDS = {
+    "歌词": ["歌词", "lyrics", "歌", "song", "歌曲", "哪句", "最喜欢"],
+    "典故": ["典故", "引用", "quote", "经典", "文学", "literature", "历史", "history", "形容", "是谁", "出自", "来源", "争议", "研究"],
+    "香水品牌": ["品牌", "brand", "perfume brand", "香水品牌", "香氛品牌"],
+    "香水名称": ["香水", "perfume", "fragrance", "香氛", "具体", "specific perfume"],
+    "香调": ["香调", "notes", "fragrance notes", "前调", "中调", "后调", "top notes", "base notes"],
+    "人物": ["是谁", "形容谁", "谁说的", "作者", "writer", "author"],
+    "诗词古文": ["诗词", "古诗", "古文", "诗句", "poem", "poetry", "quote", "引用"],
+    "书籍作品": ["书", "小说", "作品", "book", "novel", "红楼梦", "三国", "水浒", "西游记"]
+}
+
+SEARCH_KEYWORD_MATCHER = KeywordMatcher({
+    **VERIFICATION_KEYWORDS,
+    # 用户明确要求搜索
+    "搜索请求": ["搜索", "能否搜索", "帮我查", "查一下", "查找", "搜索一下", "search", "look up", "find", "知道", "你知道", "了解", "你了解"],
+    # 搜索词看起来仍是自然语言请求，需要 LLM 再次优化
+    "自然语言查询": ["帮我", "查一下", "搜索", "你可以", "能否", "帮我查", "查找"],
+    # LLM 意图识别失败时的回退关键词
+    "意图回退": [
+        "歌词", "lyrics", "是谁", "哪一年", "什么时候", "where", "when", "who",
+        "你知道", "知道", "了解", "你了解", "你听说过", "听说过",
+        "品牌", "brand", "香水", "perfume", "fragrance",
+        "英文名", "全名", "叫什么", "哪里买", "价格"
+    ],
+    # 意图识别超时或出错时 chat_endpoint 的回退关键词
+    "对话回退": [
+        "搜索", "search", "查", "查找", "帮我查", "能否搜索", "你知道",
+        "歌词", "lyrics", "是谁", "哪一年", "什么时候"
+    ],
+})
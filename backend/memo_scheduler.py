@@ -0,0 +1,101 @@
+"""手札调度器
+
+每个会话只保留一个计时器：有新消息时重置，空闲满 delay 秒后把会话放进生成队列，
+由固定数量的 worker 依次生成手札（限制同时进行的手札生成数）。
+服务重启后可根据会话的最后消息时间重建计时器；重建的计时器不带 locale（None），
+由 run_fn 使用会话里保存的界面语言。
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class MemoScheduler:
+    def __init__(
+        self,
+        run_fn: Callable[[str, Optional[str]], Awaitable[None]],
+        delay: float = 300.0,
+        max_concurrent: int = 2,
+    ):
+        self._run_fn = run_fn
+        self.delay = delay
+        self.max_concurrent = max_concurrent
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._queued: Dict[str, Optional[str]] = {}  # 已到期、等待生成的会话 -> locale
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list = []
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _ensure_workers(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [
+                asyncio.create_task(self._worker()) for _ in range(self.max_concurrent)
+            ]
+
+    def touch(self, conversation_id: str, locale: Optional[str] = "zh", last_activity: Optional[float] = None) -> None:
+        """会话有新活动：重置它的计时器
+
+        last_activity 为最后一条消息的 Unix 时间戳（重建时使用），默认为现在。
+        """
+        self._ensure_workers()
+        loop = asyncio.get_running_loop()
+        old = self._timers.pop(conversation_id, None)
+        if old is not None:
+            old.cancel()
+        elapsed = time.time() - last_activity if last_activity is not None else 0.0
+        remaining = max(0.0, self.delay - elapsed)
+        self._timers[conversation_id] = loop.call_later(
+            remaining, self._fire, conversation_id, locale
+        )
+
+    def _fire(self, conversation_id: str, locale: Optional[str]) -> None:
+        self._timers.pop(conversation_id, None)
+        if conversation_id in self._queued:
+            return
+        self._queued[conversation_id] = locale
+        self._queue.put_nowait(conversation_id)
+
+    async def _worker(self) -> None:
+        while True:
+            conversation_id = await self._queue.get()
+            locale = self._queued.pop(conversation_id, None)
+            self.running += 1
+            try:
+                await self._run_fn(conversation_id, locale)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"[手札调度] 会话 {conversation_id} 手札生成失败: {e}")
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+
+    def metrics(self) -> dict:
+        return {
+            "pending_timers": len(self._timers),
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "running": self.running,
+            "max_concurrent": self.max_concurrent,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    def rebuild(self, entries: List[Tuple[str, float]], locale: Optional[str] = None) -> int:
+        """根据 (会话 id, 最后消息时间戳) 重建计时器，返回重建数量；locale 默认取会话保存的值"""
+        for conversation_id, last_activity in entries:
+            self.touch(conversation_id, locale, last_activity)
+        return len(entries)
+
+    async def close(self) -> None:
+        for handle in self._timers.values():
+            handle.cancel()
+        self._timers.clear()
+        for task in self._workers:
+            task.cancel()
+        if self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
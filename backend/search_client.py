@@ -0,0 +1,106 @@
+"""Tavily 搜索的异步客户端（基于连接池化的 httpx）
+
+替代同步的 tavily-python SDK（同步调用会阻塞事件循环，放进线程池后超时也无法真正取消）：
+
+- 同时进行的请求数受 max_concurrency 限制，超出的请求排队等待；
+- 槽位占满且排队数达到 max_queue 时立即拒绝（SearchBusyError），而不是无限堆积；
+- 每次调用有截止时间（排队 + 请求总计），超时后排队或进行中的 HTTP 请求会被真正取消。
+"""
+import asyncio
+from typing import Optional
+
+import httpx
+
+
+class SearchBusyError(Exception):
+    """搜索排队已满"""
+
+
+class TavilySearchClient:
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://api.tavily.com",
+        max_concurrency: int = 8,
+        max_queue: int = 64,
+        timeout: float = 15.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            transport=transport,
+        )
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    async def search(self, timeout: Optional[float] = None, **params) -> dict:
+        """调用 /search；timeout 为本次调用的截止时间（秒，含排队），默认使用客户端超时"""
+        # 容量 = 并发槽位 + 排队上限；有空闲槽位的调用不占排队名额
+        if self.running + self.waiting >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise SearchBusyError(f"搜索排队已满（{self.waiting} 个请求等待中）")
+        self.waiting += 1
+        queued = True
+
+        async def run() -> dict:
+            nonlocal queued
+            try:
+                await self._semaphore.acquire()
+            finally:
+                self.waiting -= 1
+                queued = False
+            self.running += 1
+            try:
+                response = await self._http.post(
+                    "/search",
+                    json=params,
+                    headers={"Authorization": f"Bearer {self.api_key}"},
+                )
+                response.raise_for_status()
+                return response.json()
+            finally:
+                self.running -= 1
+                self._semaphore.release()
+
+        try:
+            # 超时后 wait_for 会取消 run()：排队中的调用放弃等待，进行中的 HTTP 请求被中断
+            result = await asyncio.wait_for(run(), timeout=timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            if queued:  # run() 还没开始执行就被取消
+                self.waiting -= 1
+        self.completed += 1
+        return result
+
+    def metrics(self) -> dict:
+        return {
+            "waiting": self.waiting,
+            "running": self.running,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+        }
+
+    async def close(self) -> None:
+        await self._http.aclose()
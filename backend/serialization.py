@@ -0,0 +1,45 @@
+"""会话 / 配方等存储数据的 JSON 编解码
+
+- 安装了 orjson 时用它编解码（比标准库 json 快数倍），否则回退到标准库；
+  两种实现都输出不转义非 ASCII 字符的 UTF-8，写出的文件可以互相读取
+- 写盘默认紧凑格式（无缩进、无多余空格），文件更小、编码更快；
+  设置 STORAGE_JSON_PRETTY=true 时缩进 2 格，便于手工查看和 diff
+- 已有的缩进格式文件照常读取，下次保存时按当前设置重写
+"""
+import json
+import os
+from typing import Any, Optional, Union
+
+# 尝试导入 orjson（可选依赖）
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
+JSON_PRETTY = os.getenv("STORAGE_JSON_PRETTY", "false").lower() in ("1", "true", "yes")
+
+
+def dumps_bytes(data: Any, pretty: Optional[bool] = None) -> bytes:
+    """编码为 UTF-8 字节串；pretty 为 None 时使用 STORAGE_JSON_PRETTY"""
+    if pretty is None:
+        pretty = JSON_PRETTY
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0))
+        except TypeError:
+            # orjson 不支持的类型（如超过 64 位的整数）交给标准库
+            pass
+    if pretty:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(data: Any) -> str:
+    """编码为紧凑的字符串（SQLite 的 TEXT 列）"""
+    return dumps_bytes(data, pretty=False).decode("utf-8")
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
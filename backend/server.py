@@ -1,28 +1,31 @@
 import os
 import json
-from datetime import datetime
-from typing import Literal, Optional, List
+import hashlib
+import asyncio
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Literal, Optional, List
 import re
 import requests
 import time
 import random
+import threading
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, BackgroundTasks  # type: ignore
+from fastapi import FastAPI, HTTPException, Request, Response  # type: ignore
 from fastapi.middleware.cors import CORSMiddleware  # type: ignore
 from fastapi.responses import StreamingResponse  # type: ignore
-from openai import OpenAI  # type: ignore
+from openai import AsyncOpenAI  # type: ignore
 from pydantic import BaseModel  # type: ignore
 import httpx
 
-# 尝试导入tavily（联网搜索）
-TAVILY_AVAILABLE = False
-TavilyClient = None
-try:
-    from tavily import TavilyClient  # type: ignore
-    TAVILY_AVAILABLE = True
-except ImportError:
-    pass
+from alias_index import ALIAS_INDEX_PATH as ALIAS_INDEX_DEFAULT_PATH, load_alias_index, normalize_alias
+from cache import SingleFlight, StaleWhileRevalidate, TTLCache
+from chat_context import ContextMetrics, assemble_messages, summary_cut
+from intent_classifier import MODEL_PATH as INTENT_MODEL_DEFAULT_PATH, IntentClassifier
+from keyword_matcher import SEARCH_KEYWORD_MATCHER, VERIFICATION_KEYWORDS
+from memo_scheduler import MemoScheduler
+from search_client import SearchBusyError, TavilySearchClient
+from storage import ConversationCache, ConversationWriteQueue, RecipeIndex, ScentAnalysisStore, create_backend
 
 # 尝试导入 duckduckgo-search
 DDGS_AVAILABLE = False
@@ -50,35 +53,122 @@ if not OPENAI_API_KEY or not OPENAI_BASE_URL:
 print(f"[配置] LLM_MODEL_ID: {LLM_MODEL_ID}")
 print(f"[配置] OPENAI_BASE_URL: {OPENAI_BASE_URL}")
 
-client = OpenAI(
+# 所有接口共用异步客户端（连接池复用），避免 LLM 往返阻塞事件循环
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))  # 同时进行的 LLM 调用上限
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))  # 连接池大小
+LLM_MAX_STREAMS = int(os.getenv("LLM_MAX_STREAMS", "2000"))  # 同时打开的 Salon 流式连接上限
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+async_client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    base_url=OPENAI_BASE_URL,
+    timeout=LLM_TIMEOUT,
+    http_client=httpx.AsyncClient(
+        timeout=LLM_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_CONNECTIONS,
+        ),
+    ),
+)
+_llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+# Salon 流式回复使用独立连接池：长连接不挤占短请求，也不受 LLM_MAX_CONCURRENCY 限制
+stream_client = AsyncOpenAI(
     api_key=OPENAI_API_KEY,
     base_url=OPENAI_BASE_URL,
+    timeout=LLM_TIMEOUT,
+    http_client=httpx.AsyncClient(
+        timeout=LLM_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_STREAMS,
+            max_keepalive_connections=LLM_MAX_CONNECTIONS,
+        ),
+    ),
 )
 
-# 初始化Tavily客户端（联网搜索）
+
+async def _llm_completion(**kwargs):
+    """异步调用 chat.completions.create，受 LLM_MAX_CONCURRENCY 限流"""
+    async with _llm_semaphore:
+        return await async_client.chat.completions.create(**kwargs)
+
+
+# 相同的 LLM 请求（模型、消息、参数完全一致）进行中时，后来的调用方等待同一个结果
+llm_flight = SingleFlight()
+
+
+async def _llm_completion_shared(**kwargs):
+    """与 _llm_completion 相同，但合并进行中的相同请求（用于别名解析、意图识别等查询类调用）"""
+    key = hashlib.sha256(
+        json.dumps(kwargs, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return await llm_flight.do(key, lambda: _llm_completion(**kwargs))
+
+# 初始化Tavily客户端（联网搜索）：异步 httpx 实现，限制并发与排队数，超时的请求会被取消
 TAVILY_API_KEY: Optional[str] = os.getenv("TAVILY_API_KEY")
-tavily_client = None
+TAVILY_BASE_URL = os.getenv("TAVILY_BASE_URL", "https://api.tavily.com")
+SEARCH_MAX_CONCURRENCY = int(os.getenv("SEARCH_MAX_CONCURRENCY", "8"))  # 同时进行的搜索请求上限
+SEARCH_MAX_QUEUE = int(os.getenv("SEARCH_MAX_QUEUE", "64"))  # 排队等待的搜索上限，超出时立即拒绝
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "15"))  # 单次搜索默认截止时间（含排队）
+tavily_client: Optional[TavilySearchClient] = None
 
-print(f"[Tavily初始化] TAVILY_AVAILABLE: {TAVILY_AVAILABLE}")
 print(f"[Tavily初始化] TAVILY_API_KEY 存在: {TAVILY_API_KEY is not None}")
 if TAVILY_API_KEY:
     print(f"[Tavily初始化] TAVILY_API_KEY 长度: {len(TAVILY_API_KEY)}")
     print(f"[Tavily初始化] TAVILY_API_KEY 前缀: {TAVILY_API_KEY[:10]}...")
-
-if TAVILY_AVAILABLE and TAVILY_API_KEY:
-    try:
-        tavily_client = TavilyClient(api_key=TAVILY_API_KEY)
-        print(f"[Tavily初始化] ✅ Tavily客户端初始化成功")
-    except Exception as e:
-        print(f"[Tavily初始化] ❌ Tavily初始化失败: {e}")
-        import traceback
-        traceback.print_exc()
-        tavily_client = None
+    tavily_client = TavilySearchClient(
+        api_key=TAVILY_API_KEY,
+        base_url=TAVILY_BASE_URL,
+        max_concurrency=SEARCH_MAX_CONCURRENCY,
+        max_queue=SEARCH_MAX_QUEUE,
+        timeout=SEARCH_TIMEOUT,
+    )
+    print(f"[Tavily初始化] ✅ Tavily客户端初始化成功（并发 {SEARCH_MAX_CONCURRENCY}，排队上限 {SEARCH_MAX_QUEUE}）")
 else:
-    if not TAVILY_AVAILABLE:
-        print(f"[Tavily初始化] ⚠️ Tavily库未安装，请运行: pip install tavily-python")
-    if not TAVILY_API_KEY:
-        print(f"[Tavily初始化] ⚠️ TAVILY_API_KEY 未在环境变量中设置，请检查 .env 文件")
+    print(f"[Tavily初始化] ⚠️ TAVILY_API_KEY 未在环境变量中设置，请检查 .env 文件")
+
+# 搜索结果缓存：Salon 与 Lab 共用，key 为规范化查询 + 搜索参数
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "86400"))  # 有结果的缓存秒数（默认1天）
+SEARCH_NEGATIVE_TTL = float(os.getenv("SEARCH_NEGATIVE_TTL", "600"))  # 空结果的缓存秒数
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "2000"))
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "")  # 设置后在关闭时落盘、启动时恢复
+search_cache = TTLCache(
+    ttl=SEARCH_CACHE_TTL,
+    ttl_fn=lambda response: SEARCH_CACHE_TTL if response and (response.get("results") or response.get("answer")) else SEARCH_NEGATIVE_TTL,
+    max_entries=SEARCH_CACHE_MAX_ENTRIES,
+)
+
+# 香水别名索引：get_official_name 先查本地字典（精确 / 拼音 / 模糊），未命中才调用 LLM
+ALIAS_INDEX_PATH = os.getenv("ALIAS_INDEX_PATH", ALIAS_INDEX_DEFAULT_PATH)
+alias_index = load_alias_index(ALIAS_INDEX_PATH)
+print(f"[别名索引] 已加载 {alias_index.metrics()['size']} 个别名: {ALIAS_INDEX_PATH}")
+
+# Lab 香水分析结果：按官方名称保存，新鲜期内直接返回，过期不久先返回旧结果再后台刷新
+SCENT_ANALYSIS_DB_PATH = os.getenv(
+    "SCENT_ANALYSIS_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "scent_analyses.sqlite3"),
+)
+SCENT_ANALYSIS_FRESH_SECONDS = float(os.getenv("SCENT_ANALYSIS_FRESH_SECONDS", str(7 * 86400)))
+SCENT_ANALYSIS_MAX_STALE_SECONDS = float(os.getenv("SCENT_ANALYSIS_MAX_STALE_SECONDS", str(90 * 86400)))
+scent_analysis_cache = StaleWhileRevalidate(
+    ScentAnalysisStore(SCENT_ANALYSIS_DB_PATH),
+    fresh_ttl=SCENT_ANALYSIS_FRESH_SECONDS,
+    max_stale=SCENT_ANALYSIS_MAX_STALE_SECONDS,
+    should_store=lambda result: bool(result.get("found")),  # 未找到 / 解析失败的结果不保存
+)
+
+# Lab 批量分析：单次请求的名称上限、同时进行的分析数、每次批量别名解析 LLM 调用包含的名称数
+SCENT_BATCH_MAX_NAMES = int(os.getenv("SCENT_BATCH_MAX_NAMES", "200"))
+SCENT_BATCH_CONCURRENCY = int(os.getenv("SCENT_BATCH_CONCURRENCY", "8"))
+SCENT_ALIAS_BATCH_SIZE = int(os.getenv("SCENT_ALIAS_BATCH_SIZE", "50"))
+
+# 推测搜索：意图识别与搜索同时启动，意图为 NO 时丢弃搜索结果（会多消耗搜索配额，默认关闭）
+SPECULATIVE_SEARCH = os.getenv("SPECULATIVE_SEARCH", "false").lower() in ("1", "true", "yes")
+
+# 本地意图分类器（关键词规则 + 字符 n-gram 线性模型），模型文件缺失时只保留关键词快速通道
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", INTENT_MODEL_DEFAULT_PATH)
+intent_classifier = IntentClassifier.load_or_keywords(INTENT_MODEL_PATH)
 
 
 class ChatMessage(BaseModel):
@@ -87,7 +177,11 @@ class ChatMessage(BaseModel):
 
 
 class ChatRequest(BaseModel):
-    messages: List[ChatMessage]
+    # 完整模式：messages 为全部历史；增量模式：只传 message（本轮用户消息）与 conversation_id，历史由服务端恢复
+    messages: List[ChatMessage] = []
+    message: Optional[str] = None
+    # 增量模式必填：客户端已有的历史消息数（不含本轮），与服务端不一致时返回 409，客户端改用完整模式重发
+    history_count: Optional[int] = None
     locale: Literal["zh", "en"] = "zh"
     conversation_id: Optional[str] = None
     user_name: Optional[str] = None
@@ -96,82 +190,95 @@ class ChatRequest(BaseModel):
 app = FastAPI(title="Scent Alchemist Chat API")
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CONVERSATIONS_DIR = os.path.join(BASE_DIR, "conversations")
-RECIPES_DIR = os.path.join(BASE_DIR, "recipes")
-os.makedirs(CONVERSATIONS_DIR, exist_ok=True)
-os.makedirs(RECIPES_DIR, exist_ok=True)
 
+# 存储后端：filesystem（默认，conversations/ 与 recipes/ 目录 + 会话清单）或 sqlite（WAL 模式，多 worker 共享）
+# filesystem 后端下 CONVERSATION_STORAGE_MODE 选择会话格式：json（整文件）或 log（追加写 JSONL）
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "filesystem").lower()
+storage_backend = create_backend(STORAGE_BACKEND, BASE_DIR)
+print(f"[配置] STORAGE_BACKEND: {storage_backend.name}")
+
+# 热会话缓存：对话、手札、会话详情读取同一份已解析的文档，写入时同步替换（write-through），
+# 命中时检查文件 mtime（SQLite 为会话行的 rev），其他进程或手工修改过的会话会重新读取
+HOT_CONVERSATION_CACHE_SIZE = int(os.getenv("HOT_CONVERSATION_CACHE_SIZE", "512"))
+HOT_CONVERSATION_CACHE_MB = float(os.getenv("HOT_CONVERSATION_CACHE_MB", "64"))
+conversation_cache = ConversationCache(
+    storage_backend,
+    max_entries=HOT_CONVERSATION_CACHE_SIZE,
+    max_bytes=int(HOT_CONVERSATION_CACHE_MB * 1024 * 1024),
+)
 
-def _conversation_path(conversation_id: str) -> str:
-    return os.path.join(CONVERSATIONS_DIR, f"{conversation_id}.json")
+# 配方摘要的内存索引：启动时预热，_save_recipe 同步更新，画廊列表不再遍历配方文件
+recipe_index = RecipeIndex()
+_recipe_index_sync_lock = threading.Lock()
 
 
-def _recipe_path(recipe_id: str) -> str:
-    return os.path.join(RECIPES_DIR, f"{recipe_id}.json")
+def _sync_recipe_index() -> None:
+    """多个 worker 共享 SQLite 时，其他 worker 保存的配方不经过本进程的 upsert：后端版本变化时重新预热"""
+    version = storage_backend.recipes_version()
+    if version is None or version == recipe_index.source_version:
+        return
+    with _recipe_index_sync_lock:
+        version = storage_backend.recipes_version()
+        if version != recipe_index.source_version:
+            # 先取版本再读取：读取期间的新写入会让下次检查再预热一次
+            warmed = recipe_index.warm(storage_backend.iter_recipes(), version)
+            print(f"[配方索引] 检测到其他进程保存的配方，重新预热，共 {warmed} 个配方")
 
 
 def _load_recipe(recipe_id: str) -> dict:
-    path = _recipe_path(recipe_id)
-    if not os.path.exists(path):
+    data = storage_backend.load_recipe(recipe_id)
+    if data is None:
         raise HTTPException(status_code=404, detail="Recipe not found")
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return data
 
 
 def _save_recipe(recipe_id: str, data: dict) -> None:
-    path = _recipe_path(recipe_id)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    storage_backend.save_recipe(recipe_id, data)
+    recipe_index.upsert(data)
 
 
-def _save_conversation(conversation_id: str, messages: List[dict], user_name: Optional[str] = None) -> None:
-    path = _conversation_path(conversation_id)
+def _save_conversation(
+    conversation_id: str, messages: List[dict], user_name: Optional[str] = None, locale: Optional[str] = None
+) -> None:
     now = datetime.utcnow().isoformat() + "Z"
-    if os.path.exists(path):
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception:
-            data = {}
-        created_at = data.get("created_at", now)
-        # 保留已有的用户名字，除非传入新的
-        if user_name is None:
-            user_name = data.get("user_name")
-    else:
-        created_at = now
-
-    payload = {
-        "id": conversation_id,
-        "created_at": created_at,
-        "updated_at": now,
-        "messages": messages,
-        "user_name": user_name,
-        "last_message_time": now,  # 记录最后一条消息的时间
-    }
-    # 保留已有的手札和上次生成手札时的消息数量
-    if os.path.exists(path):
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                old_data = json.load(f)
-            payload["memo"] = old_data.get("memo")
-            payload["memo_last_message_count"] = old_data.get("memo_last_message_count", 0)
-            payload["last_memo_time"] = old_data.get("last_memo_time")  # 保留上次生成手札的时间
-        except Exception:
-            pass
-    else:
-        # 新会话，初始化手札相关字段
-        payload["memo_last_message_count"] = 0
-    
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    conversation_cache.save(conversation_id, messages, user_name, now, locale)
+
+
+def _persist_turn(conversation_id: str, messages: List[dict], user_name: Optional[str], locale: Optional[str] = None) -> None:
+    """写入队列的落盘函数（在线程中执行）：补全用户名字后保存"""
+    # 保存用户名字：优先使用请求中的名字，其次从对话中提取
+    final_user_name = user_name or _extract_user_name(messages, None)
+    _save_conversation(conversation_id, messages, final_user_name, locale)
+
+
+# 对话轮次的后台写入队列：流式响应结束后只登记，由后台任务合并批量落盘
+CONVERSATION_WRITE_QUEUE_SIZE = int(os.getenv("CONVERSATION_WRITE_QUEUE_SIZE", "1000"))
+conversation_write_queue = ConversationWriteQueue(_persist_turn, max_pending=CONVERSATION_WRITE_QUEUE_SIZE)
+
+def _update_conversation_fields(conversation_id: str, fields: dict) -> dict:
+    """在会话锁内读取最新数据并只合并指定字段（手札写入用，不覆盖期间新增的消息）"""
+    data = conversation_cache.update_fields(conversation_id, fields)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return data
 
 
 def _load_conversation(conversation_id: str) -> dict:
-    path = _conversation_path(conversation_id)
-    if not os.path.exists(path):
+    data = conversation_cache.load(conversation_id)
+    # 合并写入队列里尚未落盘的最新轮次
+    pending = conversation_write_queue.pending(conversation_id)
+    if pending is not None:
+        messages, user_name, locale = pending
+        if data is None:
+            data = {"id": conversation_id, "created_at": datetime.utcnow().isoformat() + "Z"}
+        data["messages"] = messages
+        if user_name:
+            data["user_name"] = user_name
+        if locale:
+            data["locale"] = locale
+    if data is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return data
 
 
 def _extract_user_name(messages: List[dict], existing_name: Optional[str] = None) -> Optional[str]:
@@ -223,49 +330,70 @@ def _get_solar_term(year: int, month: int, day: int) -> str:
     return "冬至"
 
 
-async def _get_location_and_weather() -> dict:
+# 进程共享的外部 HTTP 客户端（连接池复用），用于 IP 定位、天气等轻量请求
+http_client = httpx.AsyncClient(
+    timeout=5.0,
+    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+)
+
+# 服务器所在位置和天气变化很慢：结果缓存一段时间，并发的手札生成共享同一次查询
+IP_LOCATION_URL = os.getenv("IP_LOCATION_URL", "https://ipapi.co/json/")
+WEATHER_URL = os.getenv("WEATHER_URL", "https://wttr.in/?format=j1")
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "1800"))  # 成功结果缓存秒数
+WEATHER_FAILURE_TTL = float(os.getenv("WEATHER_FAILURE_TTL", "60"))  # 查询失败时的缓存秒数
+_UNKNOWN_LOCATION = {"location": "Unknown", "timezone": "UTC", "temperature": None}
+location_weather_cache = TTLCache(
+    ttl=WEATHER_CACHE_TTL,
+    ttl_fn=lambda value: WEATHER_FAILURE_TTL if value.get("location") == "Unknown" else WEATHER_CACHE_TTL,
+)
+
+
+async def _fetch_location_and_weather() -> dict:
     """获取用户位置和天气信息（包括温度）"""
     try:
         # 使用免费的IP定位服务
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            # 获取IP和位置
-            ip_response = await client.get("https://ipapi.co/json/")
-            if ip_response.status_code == 200:
-                ip_data = ip_response.json()
-                lat = ip_data.get("latitude")
-                lon = ip_data.get("longitude")
-                city = ip_data.get("city", "Unknown")
-                country = ip_data.get("country_name", "Unknown")
-                timezone = ip_data.get("timezone", "UTC")
-                
-                temperature = None
-                # 尝试获取温度（使用免费的天气API）
-                if lat and lon:
-                    try:
-                        # 使用wttr.in免费天气API
-                        weather_url = f"https://wttr.in/?format=j1"
-                        weather_response = await client.get(weather_url, timeout=3.0)
-                        if weather_response.status_code == 200:
-                            weather_data = weather_response.json()
-                            if "current_condition" in weather_data:
-                                temp_c = weather_data["current_condition"][0].get("temp_C")
-                                if temp_c:
-                                    temperature = int(float(temp_c))
-                    except Exception:
-                        pass
-                
-                weather_info = {
-                    "location": f"{city}, {country}",
-                    "timezone": timezone,
-                    "temperature": temperature,
-                    "coordinates": {"lat": lat, "lon": lon} if lat and lon else None,
-                }
-                
-                return weather_info
+        ip_response = await http_client.get(IP_LOCATION_URL)
+        if ip_response.status_code == 200:
+            ip_data = ip_response.json()
+            lat = ip_data.get("latitude")
+            lon = ip_data.get("longitude")
+            city = ip_data.get("city", "Unknown")
+            country = ip_data.get("country_name", "Unknown")
+            timezone = ip_data.get("timezone", "UTC")
+            
+            temperature = None
+            # 尝试获取温度（使用免费的天气API）
+            if lat and lon:
+                try:
+                    # 使用wttr.in免费天气API
+                    weather_response = await http_client.get(WEATHER_URL, timeout=3.0)
+                    if weather_response.status_code == 200:
+                        weather_data = weather_response.json()
+                        if "current_condition" in weather_data:
+                            temp_c = weather_data["current_condition"][0].get("temp_C")
+                            if temp_c:
+                                temperature = int(float(temp_c))
+                except Exception:
+                    pass
+            
+            weather_info = {
+                "location": f"{city}, {country}",
+                "timezone": timezone,
+                "temperature": temperature,
+                "coordinates": {"lat": lat, "lon": lon} if lat and lon else None,
+            }
+            
+            return weather_info
     except Exception:
         pass
     
-    return {"location": "Unknown", "timezone": "UTC", "temperature": None}
+    return dict(_UNKNOWN_LOCATION)
+
+
+async def _get_location_and_weather() -> dict:
+    """获取位置和天气（带 TTL 缓存与并发去重）"""
+    result = await location_weather_cache.get_or_load("server", _fetch_location_and_weather)
+    return dict(result)
 
 
 async def _generate_memo_summary(conversation_data: dict, locale: str = "zh", is_update: bool = False) -> str:
@@ -359,7 +487,7 @@ async def _generate_memo_summary(conversation_data: dict, locale: str = "zh", is
 {"用中文" if locale == "zh" else "Use English"}"""
 
     try:
-        completion = client.chat.completions.create(
+        completion = await _llm_completion(
             model="deepseek-v3.2",
             messages=[
                 {"role": "system", "content": "You are Le Nez, a French perfumer writing personal notes. Write in a poetic, concise style."},
@@ -405,55 +533,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],  # 分页游标与缓存校验需要前端可读
 )
 
 
-async def detect_intent(messages: List[dict]) -> bool:
-    """
-    LLM 意图识别：判断用户是否需要外部知识（实时数据、歌词、新闻、事实等）
-    
-    接收完整的对话历史 messages，以便更准确判断意图
-    
-    返回 True 表示需要搜索，False 表示不需要
-    """
-    # 获取最后一条用户消息
-    last_user_message = ""
-    for msg in reversed(messages):
-        if msg.get("role") == "user":
-            last_user_message = msg.get("content", "")
-            break
-    
-    if not last_user_message:
-        return False
-    
-    # 关键词快速通道：减少 LLM 消耗（扩展关键词列表）
-    quick_search_keywords = [
-        "搜索", "查一下", "查找", "帮我查", "能否搜索", "search", "lookup", "find",
-        "歌词", "lyrics", "是谁", "哪一年", "什么时候", "where", "when", "who",
-        "你知道", "知道", "了解", "你了解", "你听说过", "听说过",
-        "英文名", "全名", "叫什么", "哪里买", "价格", "多少钱", "how much", "price", "buy", "where to buy"
-    ]
-    user_msg_lower = last_user_message.lower()
-    
-    # 如果包含明显的关键词，直接返回 True，跳过 LLM 判断
-    if any(kw in user_msg_lower for kw in quick_search_keywords):
-        print(f"[意图识别] 快速通道：检测到搜索关键词，直接返回 True")
-        return True
-    
-    # 使用 LLM 进行意图识别（使用上下文）
-    try:
-        # 构建上下文摘要（最近3条消息）
-        context_summary = ""
-        recent_messages = messages[-3:] if len(messages) > 3 else messages
-        for msg in recent_messages:
-            role = msg.get("role", "")
-            content = msg.get("content", "")[:100]  # 限制长度
-            if role == "user":
-                context_summary += f"User: {content}\n"
-            elif role == "assistant":
-                context_summary += f"Bot: {content}\n"
-        
-        intent_prompt = f"""You are an Intent Classifier. Analyze the user's latest message and conversation context.
+async def _llm_detect_intent(messages: List[dict], last_user_message: str) -> bool:
+    """调用 LLM 判断最后一条用户消息是否需要外部知识（结合最近3条上下文），失败时抛出异常"""
+    # 构建上下文摘要（最近3条消息）
+    context_summary = ""
+    recent_messages = messages[-3:] if len(messages) > 3 else messages
+    for msg in recent_messages:
+        role = msg.get("role", "")
+        content = msg.get("content", "")[:100]  # 限制长度
+        if role == "user":
+            context_summary += f"User: {content}\n"
+        elif role == "assistant":
+            context_summary += f"Bot: {content}\n"
+    
+    intent_prompt = f"""You are an Intent Classifier. Analyze the user's latest message and conversation context.
 Does the user need EXTERNAL KNOWLEDGE (real-time data, specific lyrics, news, facts, celebrity info) to get a good answer?
 
 Conversation Context:
@@ -473,23 +570,51 @@ Examples:
 - "它的英文名叫什么" -> YES (Needs to resolve pronoun from context)
 
 Return ONLY the word "YES" or "NO"."""
-        
-        response = client.chat.completions.create(
-            model=LLM_MODEL_ID,
-            messages=[
-                {"role": "system", "content": "You are an Intent Classifier. Return only 'YES' or 'NO'."},
-                {"role": "user", "content": intent_prompt}
-            ],
-            temperature=0,  # 确保稳定
-            max_tokens=10
-        )
-        
-        result = response.choices[0].message.content.strip().upper()
-        should_search = result == "YES"
-        
-        print(f"[意图识别] LLM 判断结果: {result} -> should_search: {should_search}")
-        return should_search
-        
+    
+    response = await _llm_completion_shared(
+        model=LLM_MODEL_ID,
+        messages=[
+            {"role": "system", "content": "You are an Intent Classifier. Return only 'YES' or 'NO'."},
+            {"role": "user", "content": intent_prompt}
+        ],
+        temperature=0,  # 确保稳定
+        max_tokens=10
+    )
+    
+    result = response.choices[0].message.content.strip().upper()
+    should_search = result == "YES"
+    print(f"[意图识别] LLM 判断结果: {result} -> should_search: {should_search}")
+    return should_search
+
+
+async def detect_intent(messages: List[dict]) -> bool:
+    """
+    意图识别：判断用户是否需要外部知识（实时数据、歌词、新闻、事实等）
+    
+    先用本地分类器判断，只有低置信度的消息才调用 LLM；
+    接收完整的对话历史 messages，以便 LLM 结合上下文判断
+    
+    返回 True 表示需要搜索，False 表示不需要
+    """
+    # 获取最后一条用户消息
+    last_user_message = ""
+    for msg in reversed(messages):
+        if msg.get("role") == "user":
+            last_user_message = msg.get("content", "")
+            break
+    
+    if not last_user_message:
+        return False
+    
+    # 本地快速通道：关键词规则 + 线性模型，只有低置信度的消息才调用 LLM
+    decision = intent_classifier.classify(last_user_message)
+    if decision.should_search is not None:
+        print(f"[意图识别] 本地快速通道（{decision.source}，p={decision.confidence:.2f}）: {decision.should_search}")
+        return decision.should_search
+    
+    # 使用 LLM 进行意图识别（使用上下文）
+    try:
+        return await _llm_detect_intent(messages, last_user_message)
     except Exception as e:
         error_msg = str(e)
         print(f"[意图识别] LLM 调用失败: {error_msg}")
@@ -497,13 +622,7 @@ Return ONLY the word "YES" or "NO"."""
             print(f"[意图识别] ❌ 401 错误：请检查 .env 中的 LLM_MODEL_ID 是否正确，当前值: {LLM_MODEL_ID}")
         # 如果 LLM 调用失败，回退到关键词匹配
         # 检查是否包含明显的搜索需求关键词
-        fallback_keywords = [
-            "歌词", "lyrics", "是谁", "哪一年", "什么时候", "where", "when", "who",
-            "你知道", "知道", "了解", "你了解", "你听说过", "听说过",
-            "品牌", "brand", "香水", "perfume", "fragrance",
-            "英文名", "全名", "叫什么", "哪里买", "价格"
-        ]
-        fallback_result = any(kw in user_msg_lower for kw in fallback_keywords)
+        fallback_result = SEARCH_KEYWORD_MATCHER.matches(last_user_message, "意图回退")
         print(f"[意图识别] 回退到关键词匹配: {fallback_result}")
         return fallback_result
 
@@ -572,7 +691,7 @@ Your goal is to generate a **single, precise search keyword** based on the user'
 
 Generate the search keyword now:"""
 
-        response = client.chat.completions.create(
+        response = await _llm_completion(
             model=LLM_MODEL_ID,
             messages=[
                 {"role": "system", "content": "You are a Search Query Refiner. Your goal is to generate a single, precise search keyword based on the user's latest request and the conversation context. Resolve pronouns by looking at previous messages. Return ONLY the keyword string. No quotes, no explanations."},
@@ -634,6 +753,32 @@ Generate the search keyword now:"""
         return fallback_query if fallback_query else last_user_message
 
 
+# ---- 搜索启发式：正则在导入时编译一次（关键词类别见 keyword_matcher.py） ----
+
+_QUOTE_MARK_RE = re.compile(r'["""''《》]')
+_CAPITALIZED_PHRASE_RE = re.compile(r'[A-Z][a-z]+\s+[A-Z]')
+_SONG_PATTERNS = [
+    re.compile(r'《([^》]+)》'),
+    re.compile(r'"([^"]+)"'),
+    re.compile(r'《([^》]+)'),
+    re.compile(r'([^，。！？\s]+(?:的|之)?隐形人)'),  # 匹配"孙燕姿的隐形人"等
+    re.compile(r'(隐形人)'),  # 直接匹配"隐形人"
+]
+_QUOTE_PATTERNS = [
+    re.compile(r'《([^》]+)》'),  # 书名号（优先匹配，可能是书籍）
+    re.compile(r'["""]([^"""]+)["""]'),  # 双引号
+    re.compile(r"['']([^'']+)['']"),  # 单引号
+    re.compile(r'([^，。！？\s]{4,})'),  # 4字以上的短语（可能是古文）
+]
+_PERFUME_NAME_PATTERNS = [
+    re.compile(r'([A-Z][a-zA-Z\s]+(?:\s+No\.\s*\d+)?)'),
+    re.compile(r'([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)+)'),
+]
+_KEY_PHRASE_RE = re.compile(r'[^，。！？\s]{3,}')
+_LITERARY_TITLES = ("红楼梦", "三国", "水浒", "西游记", "聊斋", "金瓶梅", "儒林外史")
+_LITERARY_HINTS = _LITERARY_TITLES + ("梦", "楼")
+
+
 async def _perform_searches(messages: List[dict]) -> str:
     """执行联网搜索验证（对所有可能涉及事实的内容都进行搜索）
     
@@ -656,60 +801,30 @@ async def _perform_searches(messages: List[dict]) -> str:
     
     search_queries = []
     search_context = ""
-    force_search = False  # 用户是否明确要求搜索
-    
-    # 检测用户明确要求搜索的关键词
-    search_request_keywords = ["搜索", "能否搜索", "帮我查", "查一下", "查找", "搜索一下", "search", "look up", "find", "知道", "你知道", "了解", "你了解"]
     user_msg_lower = last_user_message.lower()
     
-    if any(kw in user_msg_lower for kw in search_request_keywords):
-        force_search = True
-    
-    # 需要验证的关键词（扩展列表，覆盖更多情况）
-    verification_keywords = {
-        "歌词": ["歌词", "lyrics", "歌", "song", "歌曲", "哪句", "最喜欢"],
-        "典故": ["典故", "引用", "quote", "经典", "文学", "literature", "历史", "history", "形容", "是谁", "出自", "来源", "争议", "研究"],
-        "香水品牌": ["品牌", "brand", "perfume brand", "香水品牌", "香氛品牌"],
-        "香水名称": ["香水", "perfume", "fragrance", "香氛", "具体", "specific perfume"],
-        "香调": ["香调", "notes", "fragrance notes", "前调", "中调", "后调", "top notes", "base notes"],
-        "人物": ["是谁", "形容谁", "谁说的", "作者", "writer", "author"],
-        "诗词古文": ["诗词", "古诗", "古文", "诗句", "poem", "poetry", "quote", "引用"],
-        "书籍作品": ["书", "小说", "作品", "book", "novel", "红楼梦", "三国", "水浒", "西游记"]
-    }
+    # 一次扫描得到消息命中的所有关键词类别
+    matched = SEARCH_KEYWORD_MATCHER.classify(user_msg_lower)
+    force_search = "搜索请求" in matched  # 用户是否明确要求搜索
     
     # 检测是否包含需要验证的内容（更宽松的检测）
-    needs_verification = False
-    for category, keywords in verification_keywords.items():
-        if any(kw in user_msg_lower for kw in keywords):
-            needs_verification = True
-            break
+    needs_verification = any(category in matched for category in VERIFICATION_KEYWORDS)
     
     # 检测是否包含引号、书名号等，通常表示引用
-    import re
-    if re.search(r'["""''《》]', last_user_message) or re.search(r'[A-Z][a-z]+\s+[A-Z]', last_user_message):
+    if _QUOTE_MARK_RE.search(last_user_message) or _CAPITALIZED_PHRASE_RE.search(last_user_message):
         needs_verification = True
     
     # 先检测是否是书籍/文学作品（优先级高于歌词）
-    is_literary_work = False
-    if any(kw in user_msg_lower for kw in verification_keywords["书籍作品"] + verification_keywords["典故"]):
-        is_literary_work = True
+    is_literary_work = "书籍作品" in matched or "典故" in matched
     
     # 检测歌词相关（只在明确提到歌词相关关键词时）
-    if (any(kw in user_msg_lower for kw in verification_keywords["歌词"]) or force_search) and not is_literary_work:
-        song_patterns = [
-            r'《([^》]+)》',
-            r'"([^"]+)"',
-            r'《([^》]+)',
-            r'([^，。！？\s]+(?:的|之)?隐形人)',  # 匹配"孙燕姿的隐形人"等
-            r'(隐形人)',  # 直接匹配"隐形人"
-        ]
-        for pattern in song_patterns:
-            matches = re.findall(pattern, last_user_message)
+    if ("歌词" in matched or force_search) and not is_literary_work:
+        for pattern in _SONG_PATTERNS:
+            matches = pattern.findall(last_user_message)
             for match in matches:
                 if len(match) > 1:
                     # 排除已知的文学作品
-                    literary_keywords = ["红楼梦", "三国", "水浒", "西游记", "聊斋", "金瓶梅", "儒林外史"]
-                    if any(lit in match for lit in literary_keywords):
+                    if any(lit in match for lit in _LITERARY_TITLES):
                         break  # 跳过，这是文学作品不是歌曲
                     # 如果提到歌手，一起搜索
                     if "孙燕姿" in last_user_message or "Stefanie Sun" in last_user_message:
@@ -723,21 +838,14 @@ async def _perform_searches(messages: List[dict]) -> str:
                 search_queries.append("孙燕姿 隐形人 歌词 lyrics")
     
     # 检测典故、诗词、古文、书籍等（优先级最高）
-    if any(kw in user_msg_lower for kw in verification_keywords["典故"] + verification_keywords["诗词古文"] + verification_keywords["人物"] + verification_keywords["书籍作品"]):
+    if any(category in matched for category in ("典故", "诗词古文", "人物", "书籍作品")):
         # 提取可能的引用内容
-        quote_patterns = [
-            r'《([^》]+)》',  # 书名号（优先匹配，可能是书籍）
-            r'["""]([^"""]+)["""]',  # 双引号
-            r"['']([^'']+)['']",  # 单引号
-            r'([^，。！？\s]{4,})',  # 4字以上的短语（可能是古文）
-        ]
-        for pattern in quote_patterns:
-            matches = re.findall(pattern, last_user_message)
+        for pattern in _QUOTE_PATTERNS:
+            matches = pattern.findall(last_user_message)
             for match in matches:
                 if len(match) >= 2 and match not in ["你知道", "你知道的", "你知道吗"]:
                     # 检测是否是书籍/文学作品
-                    literary_keywords = ["红楼梦", "三国", "水浒", "西游记", "聊斋", "金瓶梅", "儒林外史", "梦", "楼"]
-                    if any(lit in match for lit in literary_keywords) or "争议" in last_user_message or "研究" in last_user_message:
+                    if any(lit in match for lit in _LITERARY_HINTS) or "争议" in last_user_message or "研究" in last_user_message:
                         # 这是文学作品，搜索相关内容
                         if "争议" in last_user_message:
                             search_queries.append(f"{match} 争议")
@@ -755,14 +863,9 @@ async def _perform_searches(messages: List[dict]) -> str:
                     break
     
     # 检测香水品牌和名称
-    if any(kw in user_msg_lower for kw in verification_keywords["香水品牌"] + verification_keywords["香水名称"]):
-        import re
-        perfume_patterns = [
-            r'([A-Z][a-zA-Z\s]+(?:\s+No\.\s*\d+)?)',
-            r'([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)+)',
-        ]
-        for pattern in perfume_patterns:
-            matches = re.findall(pattern, last_user_message)
+    if "香水品牌" in matched or "香水名称" in matched:
+        for pattern in _PERFUME_NAME_PATTERNS:
+            matches = pattern.findall(last_user_message)
             for match in matches:
                 if len(match) > 3:
                     search_queries.append(f"{match} perfume fragrance")
@@ -785,59 +888,48 @@ async def _perform_searches(messages: List[dict]) -> str:
                 # 如果没有特定搜索词，但需要验证，搜索整个问题
                 elif needs_verification:
                     # 提取问题中的关键短语进行搜索
-                    key_phrases = re.findall(r'[^，。！？\s]{3,}', last_user_message)
+                    key_phrases = _KEY_PHRASE_RE.findall(last_user_message)
                     for phrase in key_phrases[:2]:  # 最多取前2个短语
                         if len(phrase) >= 3 and phrase not in ["你知道", "你知道的", "你知道吗", "调香师"]:
                             search_queries.append(phrase)
         
         search_results = []
         # 优化：减少并行搜索数量，提高单个搜索的超时时间
-        import asyncio
-        search_tasks = []
         query_list = list(set(search_queries[:2]))  # 减少到最多2个搜索，提高速度
         
-        # 对每个查询进行进一步优化（如果还没有优化过）
-        optimized_query_list = []
-        for query in query_list:
-            # 如果查询看起来像是自然语言（包含请求词），再次优化（使用上下文）
-            if any(kw in query.lower() for kw in ["帮我", "查一下", "搜索", "你可以", "能否", "帮我查", "查找"]):
+        async def refine_and_search(query: str) -> Optional[str]:
+            # 如果查询看起来像是自然语言（包含请求词），先结合上下文再次优化
+            if SEARCH_KEYWORD_MATCHER.matches(query, "自然语言查询"):
                 print(f"[搜索优化] 检测到自然语言查询，进一步优化: {query}")
                 # 创建一个临时消息列表，将查询作为最后一条用户消息
                 temp_messages = messages.copy()
                 temp_messages.append({"role": "user", "content": query})
                 optimized_query = await generate_search_query(temp_messages)
-                optimized_query_list.append(optimized_query if optimized_query else query)
-            else:
-                optimized_query_list.append(query)
+                query = optimized_query if optimized_query else query
+            print(f"[搜索优化] 最终搜索查询: {query}")
+            return await search_and_verify(query, timeout=8.0)  # 增加单个搜索超时到8秒
         
-        print(f"[搜索优化] 最终搜索查询列表: {optimized_query_list}")
-        
-        for query in optimized_query_list:
-            search_tasks.append(search_and_verify(query, timeout=8.0))  # 增加单个搜索超时到8秒
-        
-        # 等待所有搜索完成，但最多等待12秒
-        if search_tasks:
-            try:
-                results = await asyncio.wait_for(
-                    asyncio.gather(*search_tasks, return_exceptions=True),
-                    timeout=12.0  # 增加总体超时时间
-                )
-                for i, result in enumerate(results):
-                    if result and not isinstance(result, Exception):
-                        search_results.append(f"搜索查询: {query_list[i]}\n{result}")
-                    elif isinstance(result, Exception):
-                        print(f"搜索查询 {query_list[i]} 失败: {result}")
-            except asyncio.TimeoutError:
-                print("搜索总体超时，使用已完成的搜索结果")
-                # 收集已经完成的搜索结果
+        # 各查询的优化与搜索并行进行：不需要优化的关键词查询立即开始搜索
+        search_tasks = [asyncio.ensure_future(refine_and_search(query)) for query in query_list]
+        try:
+            # 等待所有搜索完成，但最多等待12秒
+            if search_tasks:
+                done, pending = await asyncio.wait(search_tasks, timeout=12.0)  # 增加总体超时时间
+                if pending:
+                    print("搜索总体超时，使用已完成的搜索结果")
                 for i, task in enumerate(search_tasks):
-                    if task.done():
-                        try:
-                            result = task.result()
-                            if result:
-                                search_results.append(f"搜索查询: {query_list[i]}\n{result}")
-                        except:
-                            pass
+                    if task not in done:
+                        continue
+                    if task.exception() is not None:
+                        print(f"搜索查询 {query_list[i]} 失败: {task.exception()}")
+                        continue
+                    result = task.result()
+                    if result:
+                        search_results.append(f"搜索查询: {query_list[i]}\n{result}")
+        finally:
+            # 超时或本次搜索被放弃（推测搜索被丢弃）时，取消仍在进行的查询
+            for task in search_tasks:
+                task.cancel()
         
         if search_results:
             search_context = "\n\n=== 联网验证结果（必须使用，禁止编造） ===\n" + "\n\n---\n\n".join(search_results) + "\n\n⚠️ 强制要求：\n1. 你必须基于以上搜索结果回答，不能编造任何内容\n2. 如果搜索结果中有具体信息，你必须准确引用\n3. 如果搜索结果中没有相关信息，你必须明确说明'根据搜索结果，我没有找到相关信息'\n4. 禁止假装搜索或编造搜索结果\n5. 禁止说'我查了网页'或类似的话，除非你真的使用了上面的搜索结果\n"
@@ -848,73 +940,65 @@ async def _perform_searches(messages: List[dict]) -> str:
     return search_context
 
 
+def _search_cache_key(params: dict) -> str:
+    """搜索缓存 key：查询去掉多余空白并转小写，其余参数按名称排序"""
+    query = " ".join(str(params.get("query", "")).split()).lower()
+    options = {k: v for k, v in params.items() if k != "query"}
+    return json.dumps([query, options], sort_keys=True, ensure_ascii=False)
+
+
+async def _tavily_search(deadline: Optional[float] = None, **params) -> dict:
+    """调用 Tavily 搜索（经过搜索缓存；并发的相同查询只调用一次，空结果也会短暂缓存）
+
+    deadline 为上游请求的截止时间（秒，含排队），默认 SEARCH_TIMEOUT；排队已满时抛出 SearchBusyError。
+    """
+    async def load() -> dict:
+        print(f"[搜索] 🔍 开始调用 Tavily API，查询: {params.get('query')}")
+        response = await tavily_client.search(timeout=deadline, **params)
+        print(f"[搜索] ✅ Tavily API 调用成功，查询: {params.get('query')}")
+        return response
+
+    return await search_cache.get_or_load(_search_cache_key(params), load)
+
+
 async def search_and_verify(query: str, timeout: float = 8.0) -> Optional[str]:
-    """联网搜索并验证内容（带超时，优化参数）"""
+    """联网搜索并验证内容（带超时，优化参数，结果经过搜索缓存）"""
     if not tavily_client:
         return None
     try:
-        import asyncio
-        # 使用超时控制，将同步调用转换为异步
-        # 优化：使用basic搜索深度以提高速度，设置include_answer获取更准确的结果
-        loop = asyncio.get_event_loop()
+        # 优化查询：确保查询字符串格式正确
+        clean_query = query.strip()
+        if not clean_query:
+            print(f"[搜索] 查询字符串为空，跳过: {query}")
+            return None
         
-        def perform_search():
-            try:
-                # 根据官方文档，使用search_depth="basic"可以提高速度
-                # include_answer=True可以获取AI生成的答案摘要，这通常比原始搜索结果更快更准确
-                # 优化查询：确保查询字符串格式正确
-                clean_query = query.strip()
-                if not clean_query:
-                    print(f"[搜索] 查询字符串为空，跳过: {query}")
-                    return None
-                
-                print(f"[搜索] 🔍 开始调用 Tavily API，查询: {clean_query}")
-                response = tavily_client.search(
+        # 使用超时控制；缓存命中时直接返回
+        # 优化：使用basic搜索深度以提高速度，设置include_answer获取更准确的结果
+        try:
+            response = await asyncio.wait_for(
+                _tavily_search(
+                    deadline=timeout,
                     query=clean_query,
                     search_depth="basic",  # 使用basic模式提高速度（advanced会更慢）
                     max_results=3,  # 减少结果数量以提高速度
                     include_answer=True,  # 包含AI生成的答案摘要，更快更准确
                     include_raw_content=False,  # 不包含原始内容，减少响应大小和传输时间
-                    include_domains=None,  # 不限制域名，提高搜索范围
-                    exclude_domains=None
-                )
-                print(f"[搜索] ✅ Tavily API 调用成功，查询: {clean_query}")
-                print(f"[搜索] 响应类型: {type(response)}")
-                if isinstance(response, dict):
-                    print(f"[搜索] 响应键: {list(response.keys())}")
-                    if "answer" in response:
-                        answer = response.get('answer', '')
-                        print(f"[搜索] 答案摘要长度: {len(answer)}")
-                        print(f"[搜索] 答案摘要预览: {answer[:100] if answer else 'None'}...")
-                    if "results" in response:
-                        results = response.get('results', [])
-                        print(f"[搜索] 结果数量: {len(results)}")
-                        if results:
-                            print(f"[搜索] 第一个结果标题: {results[0].get('title', 'N/A')}")
-                return response
-            except Exception as e:
-                print(f"[搜索] Tavily搜索执行错误 (查询: {query}): {e}")
-                import traceback
-                traceback.print_exc()
-                # 不抛出异常，返回None，让调用者处理
-                return None
-        
-        # 使用异步执行搜索，带超时控制
-        try:
-            response = await asyncio.wait_for(
-                loop.run_in_executor(None, perform_search),
+                ),
                 timeout=timeout
             )
         except asyncio.TimeoutError:
             print(f"[搜索] 搜索超时 (查询: {query}, 超时时间: {timeout}秒)")
             return None
         except Exception as e:
-            print(f"[搜索] 搜索异步执行错误 (查询: {query}): {e}")
+            print(f"[搜索] Tavily搜索执行错误 (查询: {query}): {e}")
             import traceback
             traceback.print_exc()
             # 不抛出异常，返回None，让调用者处理
             return None
         
+        if isinstance(response, dict):
+            print(f"[搜索] 结果数量: {len(response.get('results', []))}，答案摘要长度: {len(response.get('answer') or '')}")
+        
         if response:
             # 优先使用AI生成的答案（如果可用）
             if response.get("answer"):
@@ -950,40 +1034,22 @@ async def search_and_verify(query: str, timeout: float = 8.0) -> Optional[str]:
     return None
 
 
-@app.post("/api/chat")
-async def chat_endpoint(payload: ChatRequest, background_tasks: BackgroundTasks):
-    """调用真实 LLM（百度千帆 DeepSeek-V3.2）生成流式回复。
-
-    - 接收前端传入的用户文本
-    - 在 messages 开头插入系统提示词（Le Nez 的人格与任务）
-    - 将组合后的 messages 发送给兼容 OpenAI 协议的千帆网关
-    - 以纯文本流的形式持续返回生成内容
-    """
-
-    # 获取用户名字：优先使用请求中的名字，其次从已有会话中获取
-    user_name = payload.user_name
-    if not user_name and payload.conversation_id:
-        try:
-            existing_conv = _load_conversation(payload.conversation_id)
-            user_name = existing_conv.get("user_name")
-        except HTTPException:
-            pass
-
-    # 检查是否是首次对话（只有一条用户消息，且没有历史对话）
-    is_first_message = len(payload.messages) == 1 and payload.messages[0].role == "user" and not user_name
-
-    # 构建系统提示词
-    name_context = ""
-    if user_name:
-        name_context = f"\n\nIMPORTANT: The user's name is {user_name}. Always address them by name in your responses. Use their name naturally in conversation."
-    elif is_first_message:
-        # 首次对话时，agent需要自我介绍并询问名字
-        name_context = "\n\nIMPORTANT: This is the first message from the user. You MUST:\n1. First introduce yourself: '我是 Le Nez，一位来自法国的调香师。' (in Chinese) or 'I am Le Nez, a perfumer from France.' (in English)\n2. Then say: '像在巴黎沙龙写一封信，告诉我你的此刻心情与想携带的香气。' (in Chinese) or 'As if writing a letter in a Parisian salon—tell me your mood and the scent you wish to carry.' (in English)\n3. Then immediately ask for their name: '请问，我该如何称呼你？' (in Chinese) or 'May I ask, how should I address you?' (in English)\n4. After they provide their name, remember it and use it in all future responses."
-    elif len(payload.messages) == 1 and payload.messages[0].role == "user":
-        # 如果这是第一条消息但没有名字，也应该自我介绍并询问
-        name_context = "\n\nIMPORTANT: This appears to be the first message. You MUST:\n1. First introduce yourself: '我是 Le Nez，一位来自法国的调香师。' (in Chinese) or 'I am Le Nez, a perfumer from France.' (in English)\n2. Then say: '像在巴黎沙龙写一封信，告诉我你的此刻心情与想携带的香气。' (in Chinese) or 'As if writing a letter in a Parisian salon—tell me your mood and the scent you wish to carry.' (in English)\n3. Then immediately ask for their name: '请问，我该如何称呼你？' (in Chinese) or 'May I ask, how should I address you?' (in English)"
+# Salon 发送给 LLM 的对话历史的 token 预算（估算值），超出时省略较早的轮次；0 表示不限制
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "6000"))
+# 滚动摘要：摘要之后的原文超过 N 轮时，在后台把较早的轮次压缩进摘要，只保留最近 K 轮原文；N 为 0 时关闭
+CHAT_SUMMARY_AFTER_TURNS = int(os.getenv("CHAT_SUMMARY_AFTER_TURNS", "12"))
+CHAT_SUMMARY_KEEP_TURNS = int(os.getenv("CHAT_SUMMARY_KEEP_TURNS", "4"))
+if CHAT_SUMMARY_AFTER_TURNS > 0 and CHAT_SUMMARY_KEEP_TURNS >= CHAT_SUMMARY_AFTER_TURNS:
+    print(
+        f"[上下文] ⚠️ CHAT_SUMMARY_KEEP_TURNS ({CHAT_SUMMARY_KEEP_TURNS}) 应小于 "
+        f"CHAT_SUMMARY_AFTER_TURNS ({CHAT_SUMMARY_AFTER_TURNS})，否则只有原文超过 KEEP 轮时才会摘要"
+    )
+chat_context_metrics = ContextMetrics()
+context_summary_tasks: Dict[str, asyncio.Task] = {}  # 会话 ID -> 进行中的摘要任务
 
-    system_prompt = f"""
+# Le Nez 的系统提示词：导入时构建一次，每次请求逐字节相同，作为 messages 的固定前缀
+# 便于上游的前缀缓存（prompt caching）命中；称呼等按请求变化的内容放在其后的单独系统消息中
+LE_NEZ_SYSTEM_PROMPT = """
 You are "Le Nez" (The Nose), a top-tier French perfumer with a background in organic chemistry.
 
 Core Persona (The "Real" Human Expert):
@@ -999,7 +1065,6 @@ GOOD: "That sounds suffocating. Like being stuck in a room full of dust and old
 Vulnerability: Occasionally (rarely) drop a short, personal remark that shows you are human, e.g.,
 - "I hate that feeling too."
 - "Reminds me of a long winter in Lyon."
-{name_context}
 
 CRITICAL: You MUST follow these three stages in order. Do NOT skip stages or rush to the solution.
 
@@ -1074,53 +1139,116 @@ EXAMPLES:
 Remember: It's better to be vague and honest than to make up specific content that doesn't exist. The search results will be provided to you when needed.
 """.strip()
 
+
+@app.post("/api/chat")
+async def chat_endpoint(payload: ChatRequest):
+    """调用真实 LLM（百度千帆 DeepSeek-V3.2）生成流式回复。
+
+    - 接收前端传入的用户文本
+    - 在 messages 开头插入固定的系统提示词（Le Nez 的人格与任务），对话历史按 token 预算截取
+    - 将组合后的 messages 发送给兼容 OpenAI 协议的千帆网关
+    - 以纯文本流的形式持续返回生成内容
+    """
+
+    # 读取已有会话（用户名字、滚动摘要，增量模式下还有历史消息），热会话直接从内存取
+    existing_conv: dict = {}
+    if payload.conversation_id:
+        try:
+            existing_conv = await asyncio.to_thread(_load_conversation, payload.conversation_id)
+        except HTTPException:
+            pass
+
+    # 获取用户名字：优先使用请求中的名字，其次从已有会话中获取
+    user_name = payload.user_name or existing_conv.get("user_name")
+
+    # 将对话历史转换为兼容 OpenAI 的 messages 结构
+    if payload.message is not None:
+        # 增量模式：客户端只发送本轮消息，历史从会话存储中恢复（与缓存共享消息对象，只复制列表）
+        stored_history = existing_conv.get("messages") or []
+        if payload.history_count is None:
+            raise HTTPException(status_code=400, detail="history_count is required with message")
+        if payload.history_count != len(stored_history):
+            # 上一轮可能还在其他 worker 的写入队列里（或该 worker 落盘前退出）：
+            # 按较短的历史继续会丢掉那一轮，让客户端带完整历史重发
+            raise HTTPException(
+                status_code=409,
+                detail=f"history out of sync: client has {payload.history_count} messages, server has {len(stored_history)}",
+            )
+        history_messages: List[dict] = [*stored_history, {"role": "user", "content": payload.message}]
+    else:
+        history_messages = [
+            {"role": msg.role, "content": msg.content} for msg in payload.messages
+        ]
+    if not history_messages:
+        raise HTTPException(status_code=400, detail="messages or message is required")
+
+    # 检查是否是首次对话（只有一条用户消息，且没有历史对话）
+    is_first_message = len(history_messages) == 1 and history_messages[0]["role"] == "user" and not user_name
+
+    # 构建称呼相关的动态系统提示（固定前缀 LE_NEZ_SYSTEM_PROMPT 之后的一条系统消息）
+    name_context = ""
+    if user_name:
+        name_context = f"IMPORTANT: The user's name is {user_name}. Always address them by name in your responses. Use their name naturally in conversation."
+    elif is_first_message:
+        # 首次对话时，agent需要自我介绍并询问名字
+        name_context = "IMPORTANT: This is the first message from the user. You MUST:\n1. First introduce yourself: '我是 Le Nez，一位来自法国的调香师。' (in Chinese) or 'I am Le Nez, a perfumer from France.' (in English)\n2. Then say: '像在巴黎沙龙写一封信，告诉我你的此刻心情与想携带的香气。' (in Chinese) or 'As if writing a letter in a Parisian salon—tell me your mood and the scent you wish to carry.' (in English)\n3. Then immediately ask for their name: '请问，我该如何称呼你？' (in Chinese) or 'May I ask, how should I address you?' (in English)\n4. After they provide their name, remember it and use it in all future responses."
+    elif len(history_messages) == 1 and history_messages[0]["role"] == "user":
+        # 如果这是第一条消息但没有名字，也应该自我介绍并询问
+        name_context = "IMPORTANT: This appears to be the first message. You MUST:\n1. First introduce yourself: '我是 Le Nez，一位来自法国的调香师。' (in Chinese) or 'I am Le Nez, a perfumer from France.' (in English)\n2. Then say: '像在巴黎沙龙写一封信，告诉我你的此刻心情与想携带的香气。' (in Chinese) or 'As if writing a letter in a Parisian salon—tell me your mood and the scent you wish to carry.' (in English)\n3. Then immediately ask for their name: '请问，我该如何称呼你？' (in Chinese) or 'May I ask, how should I address you?' (in English)"
+
+
     # 会话 ID：前端可传入；如果为空则由后端按时间戳生成一个简单 ID
     conversation_id = payload.conversation_id or datetime.utcnow().strftime(
         "conv-%Y%m%d%H%M%S%f"
     )
 
-    # 将前端传入的对话历史转换为兼容 OpenAI 的 messages 结构
-    history_messages: List[dict] = [
-        {"role": msg.role, "content": msg.content} for msg in payload.messages
-    ]
+    # 滚动摘要：已保存的摘要代替其覆盖的较早消息（历史比摘要覆盖的还短时，说明客户端重新开始，摘要作废）
+    context_summary = existing_conv.get("context_summary")
+    summarized = existing_conv.get("context_summary_count", 0) if context_summary else 0
+    if summarized >= len(history_messages):
+        context_summary, summarized = None, 0
 
     # 检测用户消息中是否需要验证的内容，并执行搜索（带超时）
     # 重要：搜索必须在生成回答之前完成，确保先检索验证再回答
-    user_messages = [msg.content for msg in payload.messages if msg.role == "user"]
+    user_messages = [m["content"] for m in history_messages if m["role"] == "user"]
     last_user_message = user_messages[-1] if user_messages else ""
     search_context = ""
     search_attempted = False  # 标记是否尝试了搜索
     search_failed = False  # 标记搜索是否失败
     has_search_results = False  # 标记是否有实际的搜索结果
     
+    # 推测搜索：不等意图识别结果，先在后台开始搜索
+    speculative_search: Optional[asyncio.Task] = None
+    if SPECULATIVE_SEARCH and tavily_client and last_user_message:
+        print("[推测搜索] 与意图识别并行启动搜索")
+        speculative_search = asyncio.create_task(_perform_searches(history_messages))
+
     # 第一步：使用 LLM 意图识别判断是否需要搜索
     should_search = False
     if last_user_message:
         try:
-            import asyncio
             should_search = await asyncio.wait_for(
-                detect_intent(last_user_message),
+                detect_intent(history_messages),
                 timeout=5.0  # 意图识别超时时间
             )
             print(f"[意图识别] 最终判断: should_search = {should_search}")
         except asyncio.TimeoutError:
             print("[意图识别] ⏱️ 意图识别超时，回退到关键词匹配")
             # 超时回退到关键词匹配
-            should_search = any(kw in last_user_message.lower() for kw in [
-                "搜索", "search", "查", "查找", "帮我查", "能否搜索", "你知道",
-                "歌词", "lyrics", "是谁", "哪一年", "什么时候"
-            ])
+            should_search = SEARCH_KEYWORD_MATCHER.matches(last_user_message, "对话回退")
         except Exception as e:
             print(f"[意图识别] ❌ 意图识别出错: {e}")
             # 出错回退到关键词匹配
-            should_search = any(kw in last_user_message.lower() for kw in [
-                "搜索", "search", "查", "查找", "帮我查", "能否搜索", "你知道",
-                "歌词", "lyrics", "是谁", "哪一年", "什么时候"
-            ])
+            should_search = SEARCH_KEYWORD_MATCHER.matches(last_user_message, "对话回退")
     
     print(f"[搜索检查] 用户消息: {last_user_message[:50]}...")
     print(f"[搜索检查] tavily_client 可用: {tavily_client is not None}")
     print(f"[搜索检查] 意图识别结果: should_search = {should_search}")
+
+    if speculative_search is not None and not should_search:
+        speculative_search.cancel()
+        print("[推测搜索] 意图识别判断不需要搜索，已丢弃推测搜索")
+        speculative_search = None
     
     # 第二步：如果意图识别返回 YES，强制开启搜索
     if tavily_client and last_user_message and should_search:
@@ -1129,12 +1257,13 @@ Remember: It's better to be vague and honest than to make up specific content th
         print(f"[搜索执行] tavily_client 状态: {tavily_client is not None}")
         print(f"[搜索执行] 用户消息: {last_user_message}")
         try:
-            import asyncio
             # 搜索最多等待15秒，超时则继续响应
             # 重要：这里使用 await，确保搜索完成后再继续
             print(f"[搜索执行] 调用 _perform_searches（传入完整对话历史）...")
+            if speculative_search is not None:
+                print("[推测搜索] 复用已在进行的搜索")
             search_context = await asyncio.wait_for(
-                _perform_searches(history_messages),
+                speculative_search or _perform_searches(history_messages),
                 timeout=15.0  # 增加超时时间，给搜索更多时间
             )
             print(f"[搜索结果] 搜索返回内容长度: {len(search_context) if search_context else 0}")
@@ -1181,17 +1310,22 @@ Remember: It's better to be vague and honest than to make up specific content th
     else:
         print(f"[搜索检查] 跳过搜索（意图识别判断不需要搜索）")
 
-    def stream():
-        try:
-            # 构建消息列表，如果有搜索结果，添加到系统提示词中
-            messages_to_send = [{"role": "system", "content": system_prompt}]
-            
-            # 如果有搜索结果，添加为额外的系统消息（使用更强的语气）
-            if search_context and has_search_results:
-                print("[系统提示] ✅ 添加搜索结果到系统提示")
-                messages_to_send.append({
-                    "role": "system",
-                    "content": f"""⚠️ 强制要求：以下是联网搜索验证的结果。
+    # 构建消息列表：固定前缀 + 称呼 + 较早对话的摘要 + 搜索结果（如果有，使用更强的语气），再加上预算内的对话历史
+    system_messages = [{"role": "system", "content": LE_NEZ_SYSTEM_PROMPT}]
+    if name_context:
+        system_messages.append({"role": "system", "content": name_context})
+    if context_summary:
+        system_messages.append({
+            "role": "system",
+            "content": f"Summary of the earlier part of this conversation (the original messages are omitted; continue naturally from it):\n{context_summary}"
+        })
+
+    # 如果有搜索结果，添加为额外的系统消息（使用更强的语气）
+    if search_context and has_search_results:
+        print("[系统提示] ✅ 添加搜索结果到系统提示")
+        system_messages.append({
+            "role": "system",
+            "content": f"""⚠️ 强制要求：以下是联网搜索验证的结果。
 
 {search_context}
 
@@ -1203,13 +1337,13 @@ Remember: It's better to be vague and honest than to make up specific content th
 5. 如果搜索结果不完整，明确说明，但必须使用已有的搜索结果
 
 这是强制要求，不能忽略。"""
-                })
-            elif search_context and not has_search_results:
-                # 搜索执行了但没有结果，明确告知模型
-                print("[系统提示] ⚠️ 搜索执行了但没有结果，添加禁止撒谎的提示")
-                messages_to_send.append({
-                    "role": "system",
-                    "content": f"""⚠️ 重要：你刚才尝试执行搜索，但搜索没有返回任何结果。
+        })
+    elif search_context and not has_search_results:
+        # 搜索执行了但没有结果，明确告知模型
+        print("[系统提示] ⚠️ 搜索执行了但没有结果，添加禁止撒谎的提示")
+        system_messages.append({
+            "role": "system",
+            "content": f"""⚠️ 重要：你刚才尝试执行搜索，但搜索没有返回任何结果。
 
 {search_context}
 
@@ -1225,12 +1359,12 @@ Remember: It's better to be vague and honest than to make up specific content th
 4. 基于你的知识库回答，但必须诚实说明这是基于你的知识，不是搜索结果
 
 记住：诚实比撒谎更重要。"""
-                })
-            elif search_attempted and search_failed:
-                # 尝试了搜索但失败了，明确告知模型
-                messages_to_send.append({
-                    "role": "system",
-                    "content": f"""⚠️ 重要：你刚才尝试执行搜索，但搜索失败了或没有返回结果。
+        })
+    elif search_attempted and search_failed:
+        # 尝试了搜索但失败了，明确告知模型
+        system_messages.append({
+            "role": "system",
+            "content": f"""⚠️ 重要：你刚才尝试执行搜索，但搜索失败了或没有返回结果。
 
 **严格禁止：**
 1. 绝对不能说"我已经执行了搜索"或"我搜索了"或"我查了网页"等类似的话
@@ -1243,12 +1377,12 @@ Remember: It's better to be vague and honest than to make up specific content th
 3. 基于你的知识库回答，但必须诚实说明这是基于你的知识，不是搜索结果
 
 记住：诚实比撒谎更重要。"""
-                })
-            elif should_search and not search_attempted:
-                # 意图识别要求搜索但没有尝试（可能是检测逻辑问题或搜索服务不可用）
-                messages_to_send.append({
-                    "role": "system",
-                    "content": """⚠️ 重要：系统判断需要搜索，但搜索功能没有被触发。
+        })
+    elif should_search and not search_attempted:
+        # 意图识别要求搜索但没有尝试（可能是检测逻辑问题或搜索服务不可用）
+        system_messages.append({
+            "role": "system",
+            "content": """⚠️ 重要：系统判断需要搜索，但搜索功能没有被触发。
 
 **严格禁止：**
 1. 绝对不能说"我已经执行了搜索"或"我搜索了"等
@@ -1258,18 +1392,30 @@ Remember: It's better to be vague and honest than to make up specific content th
 明确告知用户："抱歉，我无法执行搜索功能。但我可以基于我的知识来回答你的问题。"
 
 记住：诚实比撒谎更重要。"""
-                })
-            
-            messages_to_send.extend(history_messages)
-            
-            completion_stream = client.chat.completions.create(
+        })
+
+    messages_to_send, context_stats = assemble_messages(
+        system_messages, history_messages[summarized:], CHAT_CONTEXT_TOKEN_BUDGET, summarized
+    )
+    chat_context_metrics.record(context_stats)
+    print(
+        f"[上下文] 输入约 {context_stats.input_tokens} tokens（系统 {context_stats.system_tokens}，"
+        f"历史 {context_stats.history_tokens}，发送 {context_stats.history_sent} 条，"
+        f"摘要代替 {summarized} 条，因预算省略 {context_stats.history_dropped} 条）"
+    )
+
+    async def stream():
+        try:
+            # 异步流式读取：不占用线程池，客户端断开时 Starlette 取消本生成器，
+            # finally 中关闭上游流，放弃的标签页不再继续消耗 token
+            completion_stream = await stream_client.chat.completions.create(
                 model="deepseek-v3.2",
                 messages=messages_to_send,
                 stream=True,
             )
             collected_chunks: List[str] = []
             try:
-                for chunk in completion_stream:
+                async for chunk in completion_stream:
                     if not chunk or not hasattr(chunk, 'choices') or not chunk.choices:
                         continue
                     choice = chunk.choices[0]
@@ -1278,6 +1424,9 @@ Remember: It's better to be vague and honest than to make up specific content th
                         # 直接把内容片段写回给前端，由前端累积
                         collected_chunks.append(delta.content)
                         yield delta.content
+            except (asyncio.CancelledError, GeneratorExit):
+                print(f"[流式响应] 客户端已断开，停止读取上游 (会话: {conversation_id})")
+                raise
             except Exception as stream_error:
                 print(f"[流式响应] 流式读取错误: {stream_error}")
                 import traceback
@@ -1287,42 +1436,136 @@ Remember: It's better to be vague and honest than to make up specific content th
                     yield "".join(collected_chunks)
                 # 重新抛出异常，让外层 catch 处理
                 raise
+            finally:
+                await completion_stream.close()
 
             # 流式结束后，将完整对话保存到会话存储中
             assistant_text = "".join(collected_chunks)
             if assistant_text:
-                stored_messages = [
-                    {"role": m["role"], "content": m["content"]}
-                    for m in history_messages
-                ]
-                stored_messages.append(
-                    {"role": "assistant", "content": assistant_text}
-                )
+                stored_messages = [*history_messages, {"role": "assistant", "content": assistant_text}]
                 
-                # 保存用户名字：优先使用请求中的名字，其次从对话中提取
+                # 交给后台写入队列落盘，不阻塞连接关闭；落盘前的读取会合并队列里的这一轮，
+                # 落盘后热会话缓存被直接替换，下一轮增量请求不读盘
+                # 用户名字：优先使用请求中的名字，其次从对话中提取
                 final_user_name = user_name or _extract_user_name(stored_messages, None)
-                _save_conversation(conversation_id, stored_messages, final_user_name)
+                await conversation_write_queue.submit(conversation_id, stored_messages, final_user_name, payload.locale)
                 
-                # 检查是否需要取消之前的延迟任务（如果用户继续对话）
-                # 然后启动新的5分钟延迟检查任务
-                background_tasks.add_task(_check_and_generate_memo, conversation_id, stored_messages, final_user_name, payload.locale)
+                # 重置该会话的手札计时器（用户继续对话时推迟手札生成）
+                memo_scheduler.touch(conversation_id, payload.locale)
+
+                # 原文轮次过多时在后台更新滚动摘要
+                _schedule_context_summary(
+                    conversation_id, stored_messages, context_summary, summarized, user_name, payload.locale
+                )
         except Exception as e:
             # 遇到异常时立即中止，并让前端走兜底逻辑
             raise HTTPException(status_code=500, detail=f"LLM 流式调用失败: {e}") from e
 
-    return StreamingResponse(stream(), media_type="text/plain; charset=utf-8")
+    return StreamingResponse(
+        stream(),
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "X-Input-Tokens": str(context_stats.input_tokens),
+            "X-Conversation-Id": conversation_id,
+        },
+    )
+
+
+def _schedule_context_summary(
+    conversation_id: str,
+    messages: List[dict],
+    previous_summary: Optional[str],
+    summarized: int,
+    user_name: Optional[str],
+    locale: str,
+) -> None:
+    """摘要边界之后超过 CHAT_SUMMARY_AFTER_TURNS 轮时，在后台更新滚动摘要（同一会话同时只有一个摘要任务）"""
+    cut = summary_cut(messages, summarized, CHAT_SUMMARY_AFTER_TURNS, CHAT_SUMMARY_KEEP_TURNS)
+    if cut is None or conversation_id in context_summary_tasks:
+        return
+    task = asyncio.create_task(_update_context_summary(
+        conversation_id, messages[summarized:cut], previous_summary, cut, user_name, locale
+    ))
+    context_summary_tasks[conversation_id] = task
+    task.add_done_callback(lambda _t: context_summary_tasks.pop(conversation_id, None))
+
+
+async def _update_context_summary(
+    conversation_id: str,
+    messages: List[dict],
+    previous_summary: Optional[str],
+    cut: int,
+    user_name: Optional[str],
+    locale: str,
+) -> None:
+    """把 messages（上次摘要之后、新边界之前的消息）并入摘要，保存到会话的 context_summary 字段"""
+    try:
+        summary = await _generate_context_summary(previous_summary, messages, user_name, locale)
+        # 只合并摘要字段，不覆盖期间新增的消息（与手札写入相同）
+        fields = {"context_summary": summary, "context_summary_count": cut}
+        await asyncio.to_thread(_update_conversation_fields, conversation_id, fields)
+        chat_context_metrics.record_summary(True)
+        print(f"[对话摘要] 会话 {conversation_id} 的前 {cut} 条消息已压缩为摘要（{len(summary)} 字）")
+    except Exception as e:
+        # 摘要失败不影响对话，下一轮会再次尝试
+        chat_context_metrics.record_summary(False)
+        print(f"[对话摘要] 会话 {conversation_id} 摘要失败: {e}")
 
 
-async def _check_and_generate_memo(conversation_id: str, messages: List[dict], user_name: Optional[str], locale: str):
-    """检查是否需要生成手札（5分钟无响应后生成）"""
-    import asyncio
-    # 等待5分钟
-    await asyncio.sleep(300)  # 300秒 = 5分钟
-    
+async def _generate_context_summary(
+    previous_summary: Optional[str], messages: List[dict], user_name: Optional[str], locale: str
+) -> str:
+    """生成滚动摘要：已有摘要 + 新压缩的轮次 -> 新摘要（客观、供 Le Nez 续接对话，不同于手札）"""
+    transcript = "\n".join(
+        f"{'用户' if m['role'] == 'user' else 'Le Nez'}: {m['content']}" for m in messages
+    )
+    summary_prompt = f"""你在为调香师 Le Nez 压缩一段较长的对话，让他在看不到这些原文的情况下也能自然地继续对话。
+
+{f"之前的摘要：{chr(10)}{previous_summary}{chr(10)}{chr(10)}" if previous_summary else ""}需要并入摘要的对话：
+{transcript}
+
+请把之前的摘要与上面的对话合并成一份新的摘要，要求：
+1. 保留用户的名字（{user_name or "未知"}）、心情与故事中的关键细节、已确认的香气偏好和生活习惯
+2. 注明对话目前进行到哪个阶段（情感疗愈 / 香型偏好 / 方案选择），以及已经给出的配方或推荐
+3. 记下尚未回答的问题或用户的请求
+4. 客观、简洁，不添加对话中没有的信息，不超过300字
+
+只输出摘要本身。{"用中文" if locale == "zh" else "Use English"}"""
+
+    completion = await _llm_completion(
+        model="deepseek-v3.2",
+        messages=[
+            {"role": "system", "content": "You condense conversations into faithful, concise summaries."},
+            {"role": "user", "content": summary_prompt}
+        ],
+        temperature=0.3,
+        max_tokens=600,
+    )
+    summary = (completion.choices[0].message.content or "").strip()
+    if not summary:
+        raise ValueError("empty summary")
+    return summary
+
+
+def _conversation_locale(data: dict) -> str:
+    """会话保存的界面语言；记录 locale 之前保存的会话按用户消息里是否有汉字推断"""
+    locale = data.get("locale")
+    if locale in ("zh", "en"):
+        return locale
+    user_text = "".join(m.get("content", "") for m in data.get("messages", []) if m.get("role") == "user")
+    return "zh" if re.search(r"[一-鿿]", user_text) or not user_text else "en"
+
+
+async def _check_and_generate_memo(conversation_id: str, locale: Optional[str]):
+    """计时器到期后检查是否需要生成手札（5分钟无响应后生成）
+
+    locale 为 None（重启后重建的计时器）时使用会话保存的界面语言。
+    """
     try:
-        path = _conversation_path(conversation_id)
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = await asyncio.to_thread(conversation_cache.load, conversation_id)
+        if data is None:
+            return
+        locale = locale or _conversation_locale(data)
         
         # 检查最后一条消息的时间
         last_message_time_str = data.get("last_message_time")
@@ -1335,26 +1578,49 @@ async def _check_and_generate_memo(conversation_id: str, messages: List[dict], u
             time_diff = (now - last_message_time).total_seconds()
             
             # 如果距离最后一条消息已经超过5分钟，且没有新消息，生成手札
-            if time_diff >= 300:  # 5分钟 = 300秒
+            if time_diff >= MEMO_IDLE_SECONDS:
                 current_message_count = len(data.get("messages", []))
                 last_message_count = data.get("memo_last_message_count", 0)
                 
                 # 如果消息数量没有增加，说明确实暂停了，生成手札
                 if current_message_count > last_message_count:
-                    await _generate_and_save_memo(conversation_id, data.get("messages", []), user_name, locale, data)
+                    await _generate_and_save_memo(conversation_id, data.get("messages", []), data.get("user_name"), locale, data)
+            else:
+                # 期间有新消息（例如其他 worker 写入），按最后消息时间重新计时
+                memo_scheduler.touch(conversation_id, locale, last_message_time.timestamp())
         except Exception as e:
             print(f"检查手札生成时间失败: {e}")
     except Exception as e:
         print(f"检查手札生成失败: {e}")
 
 
+# 手札调度：每个会话一个计时器，新消息重置；到期后由有限个 worker 生成手札
+MEMO_IDLE_SECONDS = float(os.getenv("MEMO_IDLE_SECONDS", "300"))  # 空闲多久后生成手札（默认5分钟）
+MEMO_MAX_CONCURRENCY = int(os.getenv("MEMO_MAX_CONCURRENCY", "2"))  # 同时生成手札的上限
+MEMO_REBUILD_LOOKBACK_HOURS = float(os.getenv("MEMO_REBUILD_LOOKBACK_HOURS", "24"))  # 重启时回溯多久内的会话
+memo_scheduler = MemoScheduler(_check_and_generate_memo, delay=MEMO_IDLE_SECONDS, max_concurrent=MEMO_MAX_CONCURRENCY)
+
+
+def _rebuild_memo_timers() -> int:
+    """重启后根据最后消息时间重建手札计时器（只回溯最近一段时间内、尚未生成手札的会话）"""
+    since = (datetime.utcnow() - timedelta(hours=MEMO_REBUILD_LOOKBACK_HOURS)).isoformat() + "Z"
+    entries = []
+    for conversation_id, updated_at in storage_backend.memo_candidates(since):
+        try:
+            last_activity = datetime.fromisoformat(updated_at.replace("Z", "+00:00")).timestamp()
+        except (AttributeError, ValueError):
+            continue
+        entries.append((conversation_id, last_activity))
+    return memo_scheduler.rebuild(entries)
+
+
 async def _generate_and_save_memo(conversation_id: str, messages: List[dict], user_name: Optional[str], locale: str, data: Optional[dict] = None):
     """异步生成并保存手札（支持追加更新，基于会话段）"""
     try:
-        path = _conversation_path(conversation_id)
         if data is None:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            data = await asyncio.to_thread(conversation_cache.load, conversation_id)
+            if data is None:
+                return
         
         existing_memo = data.get("memo")
         last_message_count = data.get("memo_last_message_count", 0)
@@ -1392,12 +1658,13 @@ async def _generate_and_save_memo(conversation_id: str, messages: List[dict], us
             else:
                 data["memo"] = f"{existing_memo}\n\n{new_memo_section}"
         
-        # 更新消息数量记录和手札生成时间
-        data["memo_last_message_count"] = current_message_count
-        data["last_memo_time"] = datetime.utcnow().isoformat() + "Z"
-        
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # 更新消息数量记录和手札生成时间（只合并手札字段，不覆盖生成期间新增的消息）
+        fields = {
+            "memo": data["memo"],
+            "memo_last_message_count": current_message_count,
+            "last_memo_time": datetime.utcnow().isoformat() + "Z",
+        }
+        await asyncio.to_thread(_update_conversation_fields, conversation_id, fields)
     except Exception as e:
         # 手札生成失败不影响主流程
         print(f"手札生成失败: {e}")
@@ -1409,54 +1676,110 @@ async def health_check() -> dict:
     return {"status": "ok", "service": "scent-alchemist-chat-api"}
 
 
+@app.get("/api/metrics")
+async def metrics() -> dict:
+    """运行指标：后台队列、计时器等"""
+    return {
+        "memo_scheduler": memo_scheduler.metrics(),
+        "location_weather_cache": location_weather_cache.metrics(),
+        "search_cache": search_cache.metrics(),
+        "search_client": tavily_client.metrics() if tavily_client is not None else None,
+        "alias_index": alias_index.metrics(),
+        "scent_analysis_cache": {
+            **scent_analysis_cache.metrics(),
+            "stored": scent_analysis_cache.store.count(),
+        },
+        "llm_single_flight": {
+            "calls": llm_flight.calls,
+            "shared": llm_flight.shared,
+            "inflight": llm_flight.inflight,
+        },
+        "intent_classifier": intent_classifier.metrics(),
+        "hot_conversations": conversation_cache.metrics(),
+        "chat_context": {
+            **chat_context_metrics.metrics(),
+            "token_budget": CHAT_CONTEXT_TOKEN_BUDGET,
+            "summarizing": len(context_summary_tasks),
+        },
+        "write_queue": {
+            "depth": conversation_write_queue.depth,
+            "max_pending": conversation_write_queue.max_pending,
+            "written": conversation_write_queue.written,
+        },
+    }
+
+
+@app.on_event("startup")
+async def _startup_storage() -> None:
+    """启动时准备存储后端（文件系统后端会对账会话清单，只解析新增或被外部修改过的会话），并预热配方索引"""
+    storage_backend.startup()
+    warmed = recipe_index.warm(storage_backend.iter_recipes(), storage_backend.recipes_version())
+    print(f"[配方索引] 预热完成，共 {warmed} 个配方")
+    rebuilt = _rebuild_memo_timers()
+    print(f"[手札调度] 已重建 {rebuilt} 个会话的手札计时器")
+    if SEARCH_CACHE_PATH:
+        restored = search_cache.load(SEARCH_CACHE_PATH)
+        print(f"[搜索缓存] 从 {SEARCH_CACHE_PATH} 恢复 {restored} 条")
+
+
+@app.on_event("shutdown")
+async def _shutdown() -> None:
+    """停止手札调度、后台分析刷新与对话摘要，清空会话写入队列、保存搜索缓存，再关闭外部 HTTP 与 LLM 客户端的连接池"""
+    await memo_scheduler.close()
+    await scent_analysis_cache.close()
+    for task in list(context_summary_tasks.values()):
+        task.cancel()
+    await asyncio.gather(*context_summary_tasks.values(), return_exceptions=True)
+    await conversation_write_queue.close()
+    if SEARCH_CACHE_PATH:
+        saved = await asyncio.to_thread(search_cache.save, SEARCH_CACHE_PATH)
+        print(f"[搜索缓存] 已保存 {saved} 条到 {SEARCH_CACHE_PATH}")
+    await http_client.aclose()
+    if tavily_client is not None:
+        await tavily_client.close()
+    await async_client.close()
+    await stream_client.close()
+
+
 @app.get("/api/conversations")
-async def list_conversations(locale: str = "zh") -> List[dict]:
-    """列出已保存的会话，返回原始标题和手札摘要。"""
-    items: List[dict] = []
-    for filename in os.listdir(CONVERSATIONS_DIR):
-        if not filename.endswith(".json"):
-            continue
-        path = os.path.join(CONVERSATIONS_DIR, filename)
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception:
-            continue
-        
-        messages = data.get("messages") or []
-        # 使用原始对话的第一条用户消息作为标题
-        first_user = next(
-            (m.get("content", "") for m in messages if m.get("role") == "user"), ""
-        )
-        title = first_user[:40] if first_user else (locale == "zh" and "未命名会话" or "Untitled")
-        
-        items.append(
-            {
-                "id": data.get("id"),
-                "created_at": data.get("created_at"),
-                "updated_at": data.get("updated_at"),
-                "title": title,
-                "memo": data.get("memo"),  # 可选的手札摘要
-            }
-        )
-    # 按更新时间倒序
-    items.sort(key=lambda x: x.get("updated_at") or "", reverse=True)
+async def list_conversations(
+    response: Response,
+    locale: str = "zh",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> List[dict]:
+    """列出已保存的会话，返回原始标题和手札摘要。
+
+    - 数据来自会话清单，按 updated_at 倒序，不读取消息正文
+    - 传入 limit 时分页，下一页游标通过响应头 X-Next-Cursor 返回
+    """
+    if limit is not None and limit <= 0:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+
+    items, next_cursor = storage_backend.list_conversations(limit=limit, cursor=cursor)
+    for item in items:
+        if not item.get("title"):
+            item["title"] = locale == "zh" and "未命名会话" or "Untitled"
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return items
 
 
 @app.get("/api/conversations/{conversation_id}")
 async def get_conversation(conversation_id: str, locale: str = "zh") -> dict:
     """获取单个会话的完整内容，如果还没有手札则生成。"""
-    data = _load_conversation(conversation_id)
+    # 会话读写会等待会话锁与磁盘（写入队列落盘时持有），放到线程里执行，不阻塞事件循环
+    data = await asyncio.to_thread(_load_conversation, conversation_id)
     
     # 如果还没有手札摘要，生成一个
     if not data.get("memo"):
-        memo = await _generate_memo_summary(data, locale)
-        data["memo"] = memo
-        # 保存到文件
-        path = _conversation_path(conversation_id)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # 新会话的第一轮可能还只在写入队列里：尚未落盘时写不进手札，先不生成（空闲计时器稍后会生成）
+        persisted = await asyncio.to_thread(conversation_cache.load, conversation_id)
+        if persisted is not None:
+            memo = await _generate_memo_summary(data, locale)
+            data["memo"] = memo
+            # 保存到文件
+            await asyncio.to_thread(_update_conversation_fields, conversation_id, {"memo": memo})
     
     return data
 
@@ -1501,7 +1824,7 @@ CRITICAL RULES:
 
     try:
         # 调用 DeepSeek 生成提示词
-        completion = client.chat.completions.create(
+        completion = await _llm_completion(
             model="deepseek-v3.2",
             messages=[
                 {"role": "system", "content": "You are a visual prompt engineer for FLUX specializing in Vintage Botanical Alchemist style. You create prompts focused on botanical illustrations and atmospheric elements. NEVER use chemistry-related terms like molecular structures or chemical formulas. Do NOT include any signatures or text in the image (signatures will be added separately). Always output only the final prompt text, no explanations."},
@@ -1623,8 +1946,9 @@ CRITICAL RULES:
     }
     
     try:
-        # 发送 POST 请求到百度千帆
-        response = requests.post(
+        # 发送 POST 请求到百度千帆（同步 requests 放到线程里，图像生成的几十秒不阻塞事件循环）
+        response = await asyncio.to_thread(
+            requests.post,
             QIANFAN_API_URL,
             headers=headers,
             json=request_body,
@@ -1709,7 +2033,7 @@ CRITICAL REQUIREMENTS:
             
             try:
                 # 生成描述
-                desc_completion = client.chat.completions.create(
+                desc_completion = await _llm_completion(
                     model="deepseek-v3.2",
                     messages=[
                         {"role": "system", "content": f"You are a poetic writer specializing in perfume descriptions. Your descriptions focus on emotions, memories, and atmospheres rather than scent notes themselves. Write concise, evocative descriptions that capture the feeling and mood. {'严格控制在40字以内（包括标点符号）' if is_zh else 'Strictly no more than 40 characters (including punctuation)'}."},
@@ -1740,7 +2064,7 @@ CRITICAL REQUIREMENTS:
                             description = description[:40]
                 
                 # 解析前中后调（必须使用具体的香味专业词语）
-                notes_completion = client.chat.completions.create(
+                notes_completion = await _llm_completion(
                     model="deepseek-v3.2",
                     messages=[
                         {"role": "system", "content": "You are a perfume expert. Analyze scent keywords and classify them into perfume notes. CRITICAL: You MUST use specific perfume note terminology (e.g., rose, jasmine, sandalwood, musk, vanilla, citrus, etc.). ABSOLUTELY FORBIDDEN: abstract terms like 'subtle', 'elegant', 'mysterious', 'rich layers', 'oriental aesthetics', etc. Always return valid JSON only."},
@@ -1786,7 +2110,7 @@ CRITICAL REQUIREMENTS:
                 "locale": payload.locale,
                 "notes": notes_data,  # 添加前中后调信息
             }
-            _save_recipe(recipe_id, recipe_data)
+            await asyncio.to_thread(_save_recipe, recipe_id, recipe_data)
             
             return {
                 "image_url": image_url,
@@ -1862,7 +2186,7 @@ Requirements:
 Do not include any explanation or additional text, only the JSON object."""
 
     try:
-        completion = client.chat.completions.create(
+        completion = await _llm_completion(
             model="deepseek-v3.2",
             messages=[
                 {"role": "system", "content": "You are a helpful assistant that extracts structured information from text. Always return valid JSON only."},
@@ -1903,30 +2227,49 @@ Do not include any explanation or additional text, only the JSON object."""
         )
 
 
+# If-None-Match 中的实体标签：可选的弱标记 W/ + 双引号内容（内容中可以有逗号，不能按逗号直接切分）
+_ENTITY_TAG_RE = re.compile(r'(?:W/)?"[^"]*"')
+
+
+def _if_none_match(header: str, etag: str) -> bool:
+    """If-None-Match 是否命中当前 ETag（RFC 9110：* 匹配任意表示，其余按弱比较，忽略 W/ 前缀）"""
+    header = header.strip()
+    if not header:
+        return False
+    if header == "*":
+        return True
+    return any(tag.removeprefix("W/") == etag for tag in _ENTITY_TAG_RE.findall(header))
+
+
 @app.get("/api/recipes")
-async def list_recipes(locale: str = "zh") -> List[dict]:
-    """列出已保存的香水配方"""
-    items: List[dict] = []
-    for filename in os.listdir(RECIPES_DIR):
-        if not filename.endswith(".json"):
-            continue
-        path = os.path.join(RECIPES_DIR, filename)
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                items.append({
-                    "id": data.get("id", filename.replace(".json", "")),
-                    "name": data.get("name", ""),
-                    "description": data.get("description", ""),
-                    "created_at": data.get("created_at", ""),
-                })
-        except Exception as e:
-            print(f"Error loading recipe {filename}: {e}")
-            continue
-    
-    # 按创建时间倒序排列
-    items.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-    return items
+async def list_recipes(
+    request: Request,
+    locale: str = "zh",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    recipe_locale: Optional[str] = None,
+):
+    """列出已保存的香水配方
+
+    - 数据来自内存中的配方索引，按创建时间倒序；SQLite 后端下先检查其他 worker 是否保存过新配方
+    - 传入 limit 时分页，下一页游标通过响应头 X-Next-Cursor 返回
+    - recipe_locale 按配方创建时的语言过滤（locale 仍是界面语言，保持兼容）
+    - 支持 ETag / If-None-Match，画廊内容未变化时返回 304
+    """
+    if limit is not None and limit <= 0:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+
+    await asyncio.to_thread(_sync_recipe_index)
+    items, next_cursor = recipe_index.page(limit=limit, cursor=cursor, locale=recipe_locale)
+    body = json.dumps(items, ensure_ascii=False)
+    etag = '"' + hashlib.sha1(f"{body}|{next_cursor}".encode("utf-8")).hexdigest() + '"'
+
+    headers = {"ETag": etag}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if _if_none_match(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @app.get("/api/recipes/{recipe_id}")
@@ -1939,7 +2282,11 @@ class ScentRequest(BaseModel):
     name: str
 
 
-def get_official_name(user_input: str) -> str:
+class ScentBatchRequest(BaseModel):
+    names: List[str]
+
+
+async def get_official_name(user_input: str) -> str:
     """Step 1: 智能别名解析 - 将用户输入（可能是昵称或中文名）转换为官方英文/法文名
     
     Args:
@@ -1948,6 +2295,13 @@ def get_official_name(user_input: str) -> str:
     Returns:
         官方英文/法文名称，如果转换失败则返回原始输入
     """
+    # 未命中时会做模糊匹配（持有索引锁），放到线程里执行
+    hit = await asyncio.to_thread(alias_index.lookup, user_input)
+    if hit:
+        official_name, match_type = hit
+        print(f"[智能别名解析] 别名索引命中（{match_type}）: {user_input} -> {official_name}")
+        return official_name
+    
     try:
         name_prompt = f"""You are a Perfume Translator. Convert the user's input (which might be a nickname or Chinese name) into the Official English/French Name.
 
@@ -1957,7 +2311,7 @@ Return ONLY the official perfume name in English or French (e.g., "Louis Vuitton
 If you cannot determine the official name, return the original input unchanged.
 Do not include any explanations, just the name."""
 
-        completion = client.chat.completions.create(
+        completion = await _llm_completion_shared(
             model=LLM_MODEL_ID,
             messages=[
                 {"role": "system", "content": "You are a Perfume Translator. Convert perfume names to official English/French names."},
@@ -1981,6 +2335,73 @@ Do not include any explanations, just the name."""
         return user_input
 
 
+async def get_official_names(user_inputs: List[str]) -> Dict[str, str]:
+    """批量别名解析：先查别名索引，未命中的名称合并成一次 LLM 调用（每次最多 SCENT_ALIAS_BATCH_SIZE 个）
+
+    Returns:
+        {用户输入: 官方名称}，解析失败的名称映射为原始输入
+    """
+    resolved: Dict[str, str] = {}
+    misses: List[str] = []
+    hits = await asyncio.to_thread(alias_index.lookup_many, dict.fromkeys(user_inputs))
+    for user_input, hit in hits.items():
+        if hit:
+            resolved[user_input] = hit[0]
+        else:
+            misses.append(user_input)
+    print(f"[智能别名解析] 批量解析 {len(resolved) + len(misses)} 个名称，别名索引命中 {len(resolved)} 个")
+
+    chunks = [misses[i:i + SCENT_ALIAS_BATCH_SIZE] for i in range(0, len(misses), SCENT_ALIAS_BATCH_SIZE)]
+    for mapping in await asyncio.gather(*(_llm_official_names(chunk) for chunk in chunks)):
+        resolved.update(mapping)
+    return resolved
+
+
+async def _llm_official_names(user_inputs: List[str]) -> Dict[str, str]:
+    """用一次 LLM 调用解析一组名称"""
+    try:
+        name_prompt = f"""You are a Perfume Translator. Convert each user input (which might be a nickname or Chinese name) into the Official English/French Name.
+
+User Inputs (JSON array): {json.dumps(user_inputs, ensure_ascii=False)}
+
+Return ONLY a JSON object mapping every input string exactly as given to its official perfume name in English or French (e.g., {{"路易威登 雷暴": "Louis Vuitton Orage"}}).
+If you cannot determine the official name for an input, map it to the original input unchanged.
+Do not include any explanations or markdown."""
+
+        completion = await _llm_completion_shared(
+            model=LLM_MODEL_ID,
+            messages=[
+                {"role": "system", "content": "You are a Perfume Translator. Convert perfume names to official English/French names. Always return valid JSON only."},
+                {"role": "user", "content": name_prompt}
+            ],
+            temperature=0.2,
+            max_tokens=100 + 40 * len(user_inputs),
+        )
+
+        response_text = completion.choices[0].message.content.strip()
+        if "```json" in response_text:
+            response_text = response_text.split("```json")[1].split("```")[0].strip()
+        elif "```" in response_text:
+            response_text = response_text.split("```")[1].split("```")[0].strip()
+        data = json.loads(response_text)
+        if not isinstance(data, dict):
+            raise ValueError("response is not a JSON object")
+
+        mapping: Dict[str, str] = {}
+        for user_input in user_inputs:
+            official_name = data.get(user_input)
+            if isinstance(official_name, str) and official_name.strip().strip('"\''):
+                mapping[user_input] = official_name.strip().strip('"\'')
+            else:
+                mapping[user_input] = user_input
+        print(f"[智能别名解析] 批量 LLM 解析 {len(user_inputs)} 个名称")
+        return mapping
+
+    except Exception as e:
+        print(f"[智能别名解析] 批量转换失败: {str(e)}, 使用原始输入")
+        return {user_input: user_input for user_input in user_inputs}
+
+
 @app.post("/api/analyze_scent")
 async def analyze_scent(payload: ScentRequest):
     """分析香水成分 - 使用智能别名解析 + 全网搜索 + DeepSeek 智能验证的 RAG 流程
@@ -1990,17 +2411,142 @@ async def analyze_scent(payload: ScentRequest):
     2. 全网搜索：使用官方名称进行无限制搜索
     3. 智能验证：使用 DeepSeek 提取数据并翻译回中文
     4. 返回结果和参考 URL 列表
+    
+    找到的分析结果按官方名称保存，之后的请求直接读取（过期后先返回旧结果再后台刷新）
+    """
+    # Step 1: 智能别名解析 (Name Standardization)
+    official_name = await get_official_name(payload.name)
+    print(f"[Step 1] 智能别名解析完成: {payload.name} -> {official_name}")
+    return await analyze_perfume(payload.name, official_name)
+
+
+@app.post("/api/analyze_scent/stream")
+async def analyze_scent_stream(payload: ScentRequest):
+    """分析香水成分的流式版本（NDJSON，每完成一个阶段输出一行）
+
+    1. {"stage": "official_name", "name": ..., "official_name": ...}
+    2. {"stage": "references", "reference_urls": [...]}  搜索完成、开始提取之前
+    3. {"stage": "result", "data": {...}}  与 /api/analyze_scent 的返回值相同
+    出错时输出 {"stage": "error", "status_code": ..., "detail": ...} 并结束
+    """
+    async def stream():
+        try:
+            official_name = await get_official_name(payload.name)
+            print(f"[Step 1] 智能别名解析完成: {payload.name} -> {official_name}")
+            yield _ndjson_line({"stage": "official_name", "name": payload.name, "official_name": official_name})
+
+            references: asyncio.Queue = asyncio.Queue()
+            task = asyncio.ensure_future(analyze_perfume(
+                payload.name, official_name, on_references=references.put_nowait
+            ))
+            getter = asyncio.ensure_future(references.get())
+            try:
+                await asyncio.wait({task, getter}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield _ndjson_line({"stage": "references", "reference_urls": getter.result()})
+                else:
+                    # 命中已保存的结果（或复用了其他请求进行中的计算），参考 URL 随结果一起给出
+                    result = await task
+                    yield _ndjson_line({"stage": "references", "reference_urls": result.get("reference_urls", [])})
+                result = await task
+            finally:
+                # 客户端断开时不再等待；上游计算在 single-flight 中继续，完成后照常保存
+                getter.cancel()
+                task.cancel()
+            yield _ndjson_line({"stage": "result", "data": result})
+        except HTTPException as e:
+            yield _ndjson_line({"stage": "error", "status_code": e.status_code, "detail": e.detail})
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.post("/api/analyze_scent/batch")
+async def analyze_scent_batch(payload: ScentBatchRequest):
+    """批量分析香水（NDJSON，按完成顺序逐个输出）
+
+    别名先批量解析（一次 LLM 调用），再以 SCENT_BATCH_CONCURRENCY 的并发分析；
+    已保存的分析结果直接复用，重复的名称只计算一次。
+    每款输出 {"stage": "item", "index": ..., "name": ..., "official_name": ..., "data": {...}}
+    （失败时没有 data，带 status_code 与 detail），最后输出 {"stage": "done", ...}
+    """
+    names = [name.strip() for name in payload.names if name.strip()]
+    if not names:
+        raise HTTPException(status_code=400, detail="names must not be empty")
+    if len(names) > SCENT_BATCH_MAX_NAMES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many names ({len(names)}), at most {SCENT_BATCH_MAX_NAMES} per request"
+        )
+
+    async def stream():
+        start = time.perf_counter()
+        official_names = await get_official_names(names)
+        semaphore = asyncio.Semaphore(SCENT_BATCH_CONCURRENCY)
+
+        async def analyze_one(index: int, name: str) -> dict:
+            official_name = official_names.get(name, name)
+            event = {"stage": "item", "index": index, "name": name, "official_name": official_name}
+            try:
+                async with semaphore:
+                    event["data"] = await analyze_perfume(name, official_name)
+            except HTTPException as e:
+                event.update(status_code=e.status_code, detail=e.detail)
+            except Exception as e:
+                print(f"[批量分析] {name} 分析失败: {e}")
+                event.update(status_code=500, detail=f"Analysis failed: {e}")
+            return event
+
+        tasks = [asyncio.ensure_future(analyze_one(i, name)) for i, name in enumerate(names)]
+        found = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                event = await next_done
+                found += bool(event.get("data", {}).get("found"))
+                yield _ndjson_line(event)
+        finally:
+            # 客户端断开时取消剩余的分析（进行中的上游计算由 single-flight 继续完成并保存）
+            for task in tasks:
+                task.cancel()
+
+        elapsed = time.perf_counter() - start
+        print(f"[批量分析] 完成 {len(names)} 款（找到 {found} 款），耗时 {elapsed:.1f}s")
+        yield _ndjson_line({"stage": "done", "count": len(names), "found": found, "elapsed_seconds": round(elapsed, 2)})
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+def _ndjson_line(event: dict) -> str:
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+
+async def analyze_perfume(
+    name: str,
+    official_name: str,
+    refresh: bool = False,
+    on_references: Optional[Callable[[List[str]], None]] = None,
+) -> dict:
+    """读取或计算某款香水的分析结果（refresh=True 时强制重新计算，用于预热）
+
+    on_references 在本次请求实际执行搜索时、提取开始前收到参考 URL（流式接口用）
     """
-    if not TAVILY_AVAILABLE or not tavily_client:
+    key = normalize_alias(official_name) or official_name
+    return await scent_analysis_cache.get(
+        key, lambda: _analyze_scent_uncached(name, official_name, on_references), refresh=refresh
+    )
+
+
+async def _analyze_scent_uncached(
+    name: str,
+    official_name: str,
+    on_references: Optional[Callable[[List[str]], None]] = None,
+) -> dict:
+    """Step 2-3：全网搜索 + LLM 提取结构化数据"""
+    if not tavily_client:
         raise HTTPException(
             status_code=500,
-            detail="Tavily Search is not available. Please install tavily-python and set TAVILY_API_KEY"
+            detail="Tavily Search is not available. Please set TAVILY_API_KEY"
         )
     
-    # Step 1: 智能别名解析 (Name Standardization)
-    official_name = get_official_name(payload.name)
-    print(f"[Step 1] 智能别名解析完成: {payload.name} -> {official_name}")
-    
     # Step 2: 混合全网搜索 (Hybrid Global Search)
     search_results = []
     search_content = ""
@@ -2012,8 +2558,8 @@ async def analyze_scent(payload: ScentRequest):
         
         print(f"[Tavily搜索] 开始全网搜索: {query_en}")
         
-        # 调用 Tavily API（使用 advanced 深度搜索）
-        response = tavily_client.search(
+        # 调用 Tavily API（使用 advanced 深度搜索，与 Salon 共用搜索缓存）
+        response = await _tavily_search(
             query=query_en,
             search_depth="advanced",
             max_results=8  # 增加结果数量以提高覆盖率
@@ -2043,6 +2589,10 @@ async def analyze_scent(payload: ScentRequest):
         print(f"[Tavily搜索] 提取到 {len(search_results)} 条有效结果")
         print(f"[Tavily搜索] 参考 URL 数量: {len(reference_urls)}")
     
+    except SearchBusyError as e:
+        # 搜索排队已满：明确告诉前端稍后重试，而不是当作“未找到”
+        print(f"[Tavily搜索] 搜索繁忙: {e}")
+        raise HTTPException(status_code=503, detail="Search is busy, please retry later")
     except Exception as e:
         # 如果搜索完全失败，不返回错误，而是标记为使用兜底方案
         print(f"[Tavily搜索] 搜索错误: {str(e)}, 将使用空结果")
@@ -2050,6 +2600,9 @@ async def analyze_scent(payload: ScentRequest):
         traceback.print_exc()
         search_results = []  # 清空结果，触发兜底逻辑
     
+    if on_references:
+        on_references(reference_urls[:5] if search_results else [])
+    
     # Step 3: 宽松验证 (Relaxed Validation with Translation)
     # 将 Tavily 的搜索结果喂给 DeepSeek 进行验证和提取
     
@@ -2065,7 +2618,7 @@ async def analyze_scent(payload: ScentRequest):
     # 构建验证提示词（支持英文结果并翻译回中文）
     verification_prompt = f"""You are a knowledgeable Perfume Data Analyst.
 
-**Task:** Analyze the search snippets to identify the perfume described by the user's query: "{payload.name}" (official name: "{official_name}").
+**Task:** Analyze the search snippets to identify the perfume described by the user's query: "{name}" (official name: "{official_name}").
 
 **CRITICAL RULES:**
 
@@ -2134,7 +2687,7 @@ Return ONLY valid JSON, no explanations, no markdown code blocks."""
 Always return valid JSON only."""
     
     try:
-        completion = client.chat.completions.create(
+        completion = await _llm_completion_shared(
             model=LLM_MODEL_ID,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -2174,6 +2727,10 @@ Always return valid JSON only."""
                 "reference_urls": reference_urls[:5]
             }
         
+        # 分析确认找到了这款香水：把别名解析结果写回别名索引
+        alias_index.add(name, official_name)
+        await asyncio.to_thread(alias_index.save)
+        
         # 返回结果
         return result
         
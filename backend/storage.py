@@ -0,0 +1,1272 @@
+"""会话存储辅助模块
+
+- ConversationIndex：在 conversations/ 旁维护一份 SQLite 清单（id / 时间 / 标题 / 手札），
+  列表接口只查清单，不再逐个解析会话文件的消息正文。
+- atomic_write_json / conversation_lock：临时文件 + os.replace 原子写入（编解码见 serialization.py，默认紧凑格式），
+  按会话加锁，避免并发的对话轮次与后台手札写入互相覆盖字段。
+- JsonConversationStore / LogConversationStore：会话存储格式。
+  json 为原有的单文件格式；log 为追加写的 JSONL 消息日志 + 元数据小文件，
+  每轮只追加新消息，旧 .json 会话在首次访问时透明迁移。
+- RecipeIndex：进程内的配方摘要索引，启动时预热一次，保存配方时同步更新，
+  画廊列表支持 limit / cursor / locale 过滤而不必遍历配方文件。
+- ConversationWriteQueue：对话轮次的后台写入队列（write-behind），按会话合并后批量落盘，
+  流式响应结束时不再同步等待磁盘写入；队列有上限，关闭时会清空。
+- ConversationCache：已解析会话文档的 LRU（按条目数与估算字节数限制），读写都经过它；
+  写入时直接替换缓存（write-through），命中时用文件 mtime / SQLite 会话行的 rev 发现外部修改。
+- ScentAnalysisStore：Lab 香水分析结果（SQLite），按官方名称的规范化 key 保存结构化 JSON 与更新时间，
+  配合 cache.StaleWhileRevalidate 使用。
+- FileSystemBackend / SqliteBackend：可插拔的持久化后端（会话 + 配方），
+  由环境变量 STORAGE_BACKEND 选择；SQLite 后端使用 WAL 模式，可供多个 uvicorn worker 共享。
+
+迁移命令（把 backend/conversations 和 backend/recipes 批量导入 SQLite）：
+
+    python storage.py migrate --db storage.sqlite3
+"""
+import argparse
+import asyncio
+import base64
+import bisect
+import hashlib
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import serialization
+
+
+TITLE_MAX_LENGTH = 40  # 列表标题取第一条用户消息的前40个字符
+
+
+def conversation_title(messages: List[dict]) -> str:
+    """使用第一条用户消息作为标题（不含 locale 兜底，由列表接口处理）"""
+    first_user = next(
+        (m.get("content", "") for m in messages if m.get("role") == "user"), ""
+    )
+    return (first_user or "")[:TITLE_MAX_LENGTH]
+
+
+def read_json(path: str) -> Optional[dict]:
+    """读取 JSON 文件，文件不存在或损坏时返回 None"""
+    try:
+        with open(path, "rb") as f:
+            return serialization.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[存储] 读取 {path} 失败: {e}")
+        return None
+
+
+def _file_version(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _default_file_mode() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# mkstemp 创建的临时文件权限为 0600，os.replace 后会保留下来；改成普通 open() 新建文件时的权限
+NEW_FILE_MODE = _default_file_mode()
+
+
+def atomic_write_json(path: str, data: dict, pretty: Optional[bool] = None) -> None:
+    """先写同目录临时文件再 os.replace，读者永远看不到写了一半的文件
+
+    默认写紧凑格式，pretty 为 None 时由 STORAGE_JSON_PRETTY 决定
+    """
+    directory = os.path.dirname(path) or "."
+    encoded = serialization.dumps_bytes(data, pretty=pretty)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        os.fchmod(fd, NEW_FILE_MODE)
+        with os.fdopen(fd, "wb") as f:
+            f.write(encoded)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+# 固定数量的分段锁：按会话 id 的哈希取锁，锁的数量不随会话数增长（不同会话偶尔共用一把锁，只是多等一会儿）
+LOCK_STRIPES = 256
+_conversation_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+def striped_lock(locks: List[threading.Lock], key: str) -> threading.Lock:
+    return locks[hash(key) % len(locks)]
+
+
+@contextmanager
+def conversation_lock(conversation_id: str) -> Iterator[None]:
+    """单个会话的读-改-写临界区（流式线程与事件循环里的手札任务共用）
+
+    临界区内只做本地文件读写，不要 await 网络调用，也不要再获取其他会话的锁（可能是同一把分段锁）。
+    """
+    with striped_lock(_conversation_locks, conversation_id):
+        yield
+
+
+def _encode_cursor(updated_at: str, conversation_id: str) -> str:
+    raw = f"{updated_at}|{conversation_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Optional[Tuple[str, str]]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        updated_at, conversation_id = raw.split("|", 1)
+        return updated_at, conversation_id
+    except Exception:
+        return None
+
+
+def _page_conversations(
+    conn: sqlite3.Connection,
+    lock: threading.Lock,
+    limit: Optional[int],
+    cursor: Optional[str],
+) -> Tuple[List[dict], Optional[str]]:
+    """在 conversations 表上按 updated_at 倒序做游标分页"""
+    sql = "SELECT id, created_at, updated_at, title, memo FROM conversations"
+    params: list = []
+    decoded = _decode_cursor(cursor) if cursor else None
+    if decoded:
+        sql += " WHERE (updated_at < ?) OR (updated_at = ? AND id < ?)"
+        params.extend([decoded[0], decoded[0], decoded[1]])
+    sql += " ORDER BY updated_at DESC, id DESC"
+    if limit is not None:
+        # 多取一条，用于判断是否还有下一页
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    with lock:
+        rows = conn.execute(sql, params).fetchall()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_cursor(last[2] or "", last[0])
+
+    items = [
+        {"id": r[0], "created_at": r[1], "updated_at": r[2], "title": r[3], "memo": r[4]}
+        for r in rows
+    ]
+    return items, next_cursor
+
+
+def _ensure_column(conn: sqlite3.Connection, table: str, column: str, declaration: str) -> None:
+    """旧数据库缺少新列时补上"""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+def _memo_candidates(conn: sqlite3.Connection, lock: threading.Lock, since: str) -> List[Tuple[str, str]]:
+    """since 之后有新消息、且之后还没生成过手札的会话 (id, updated_at)"""
+    with lock:
+        return conn.execute(
+            """
+            SELECT id, updated_at FROM conversations
+            WHERE updated_at > ? AND (last_memo_time IS NULL OR last_memo_time < updated_at)
+            """,
+            (since,),
+        ).fetchall()
+
+
+class ConversationIndex:
+    """会话清单（SQLite），由 _save_conversation 和手札写入路径保持同步"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                created_at TEXT,
+                updated_at TEXT,
+                title TEXT,
+                memo TEXT,
+                file_mtime REAL DEFAULT 0,
+                last_memo_time TEXT
+            )
+            """
+        )
+        _ensure_column(self._conn, "conversations", "last_memo_time", "TEXT")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations (updated_at DESC, id DESC)"
+        )
+        self._conn.commit()
+
+    def upsert(
+        self,
+        conversation_id: str,
+        created_at: Optional[str],
+        updated_at: Optional[str],
+        title: str,
+        memo: Optional[str],
+        file_mtime: float = 0.0,
+        last_memo_time: Optional[str] = None,
+    ) -> None:
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO conversations (id, created_at, updated_at, title, memo, file_mtime, last_memo_time)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    created_at = excluded.created_at,
+                    updated_at = excluded.updated_at,
+                    title = excluded.title,
+                    memo = excluded.memo,
+                    file_mtime = excluded.file_mtime,
+                    last_memo_time = excluded.last_memo_time
+                """,
+                (conversation_id, created_at, updated_at or "", title, memo, file_mtime, last_memo_time),
+            )
+            self._conn.commit()
+
+    def update_memo(
+        self,
+        conversation_id: str,
+        memo: Optional[str],
+        file_mtime: float = 0.0,
+        last_memo_time: Optional[str] = None,
+    ) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE conversations SET memo = ?, file_mtime = ?, last_memo_time = ? WHERE id = ?",
+                (memo, file_mtime, last_memo_time, conversation_id),
+            )
+            self._conn.commit()
+
+    def remove(self, conversation_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+            self._conn.commit()
+
+    def page(self, limit: Optional[int] = None, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """按 updated_at 倒序分页，返回 (条目, 下一页游标)"""
+        return _page_conversations(self._conn, self._lock, limit, cursor)
+
+    def memo_candidates(self, since: str) -> List[Tuple[str, str]]:
+        return _memo_candidates(self._conn, self._lock, since)
+
+    def sync_with_store(self, store: "JsonConversationStore") -> int:
+        """启动时对账：补录清单中缺失或文件已被外部修改的会话，移除已删除的会话
+
+        只对 mtime 变化的会话读取摘要，返回重新索引的会话数量。
+        """
+        with self._lock:
+            known = {
+                row[0]: row[1]
+                for row in self._conn.execute("SELECT id, file_mtime FROM conversations")
+            }
+
+        seen = set()
+        reindexed = 0
+        for conversation_id, mtime in store.scan():
+            seen.add(conversation_id)
+            if known.get(conversation_id) == mtime:
+                continue
+            summary = store.summary(conversation_id)
+            if summary is None:
+                continue
+            self.upsert(
+                conversation_id,
+                summary.get("created_at"),
+                summary.get("updated_at"),
+                summary.get("title") or "",
+                summary.get("memo"),
+                mtime,
+                summary.get("last_memo_time"),
+            )
+            reindexed += 1
+
+        for conversation_id in set(known) - seen:
+            self.remove(conversation_id)
+        return reindexed
+
+
+def _new_conversation_payload(
+    conversation_id: str,
+    messages: List[dict],
+    user_name: Optional[str],
+    now: str,
+    existing: Optional[dict],
+    locale: Optional[str] = None,
+) -> dict:
+    created_at = (existing or {}).get("created_at", now)
+    # 保留已有的用户名字和界面语言，除非传入新的
+    if user_name is None and existing:
+        user_name = existing.get("user_name")
+    if locale is None and existing:
+        locale = existing.get("locale")
+
+    payload = {
+        "id": conversation_id,
+        "created_at": created_at,
+        "updated_at": now,
+        "messages": messages,
+        "user_name": user_name,
+        "locale": locale,  # 最近一轮的界面语言，重启后重建手札计时器时使用
+        "last_message_time": now,  # 记录最后一条消息的时间
+    }
+    if existing is not None:
+        # 保留已有的手札和上次生成手札时的消息数量
+        payload["memo"] = existing.get("memo")
+        payload["memo_last_message_count"] = existing.get("memo_last_message_count", 0)
+        payload["last_memo_time"] = existing.get("last_memo_time")  # 保留上次生成手札的时间
+        if existing.get("context_summary"):
+            # 保留滚动摘要（较早轮次的压缩内容）及其覆盖的消息数
+            payload["context_summary"] = existing["context_summary"]
+            payload["context_summary_count"] = existing.get("context_summary_count", 0)
+    else:
+        # 新会话，初始化手札相关字段
+        payload["memo_last_message_count"] = 0
+    return payload
+
+
+class JsonConversationStore:
+    """每个会话一个 JSON 文件（conversations/<id>.json），每轮整体重写"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, conversation_id: str) -> str:
+        return os.path.join(self.directory, f"{conversation_id}.json")
+
+    def load(self, conversation_id: str) -> Optional[dict]:
+        return read_json(self.path(conversation_id))
+
+    def save_turn(
+        self, conversation_id: str, messages: List[dict], user_name: Optional[str], now: str, locale: Optional[str] = None
+    ) -> dict:
+        """保存一轮对话，返回写入后的会话元数据"""
+        path = self.path(conversation_id)
+        with conversation_lock(conversation_id):
+            # 已有会话只读取一次，同时取出 created_at / user_name / 手札字段
+            existing = read_json(path) if os.path.exists(path) else None
+            payload = _new_conversation_payload(conversation_id, messages, user_name, now, existing, locale)
+            atomic_write_json(path, payload)
+        return payload
+
+    def update_fields(self, conversation_id: str, fields: dict) -> Optional[dict]:
+        """在会话锁内读取最新文件并只合并指定字段"""
+        path = self.path(conversation_id)
+        with conversation_lock(conversation_id):
+            data = read_json(path)
+            if data is None:
+                return None
+            data.update(fields)
+            atomic_write_json(path, data)
+        return data
+
+    def mtime(self, conversation_id: str) -> float:
+        try:
+            return os.path.getmtime(self.path(conversation_id))
+        except OSError:
+            return 0.0
+
+    def version(self, conversation_id: str) -> Optional[Tuple[int, int]]:
+        """会话文件的 (mtime_ns, 大小)，文件被改写后变化；文件不存在时返回 None"""
+        return _file_version(self.path(conversation_id))
+
+    def scan(self) -> Iterator[Tuple[str, float]]:
+        """列出所有会话 (id, mtime)，不读取文件内容"""
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json") or filename.startswith("."):
+                continue
+            try:
+                mtime = os.path.getmtime(os.path.join(self.directory, filename))
+            except OSError:
+                continue
+            yield filename[:-len(".json")], mtime
+
+    def iter_documents(self) -> Iterator[dict]:
+        """逐个读出完整会话文档（迁移用）"""
+        for conversation_id, _ in self.scan():
+            data = self.load(conversation_id)
+            if data is not None:
+                data.setdefault("id", conversation_id)
+                yield data
+
+    def summary(self, conversation_id: str) -> Optional[dict]:
+        data = self.load(conversation_id)
+        if data is None:
+            print(f"[会话索引] 跳过无法解析的会话 {conversation_id}")
+            return None
+        return {
+            "created_at": data.get("created_at"),
+            "updated_at": data.get("updated_at"),
+            "title": conversation_title(data.get("messages") or []),
+            "memo": data.get("memo"),
+            "last_memo_time": data.get("last_memo_time"),
+        }
+
+
+# 元数据小文件里仅供存储层使用的字段，不出现在返回给接口的会话文档里
+_LOG_INTERNAL_KEYS = ("message_count", "log_size", "log_sha256", "title")
+
+
+class LogConversationStore(JsonConversationStore):
+    """追加写格式：<id>.jsonl 每行一条消息，<id>.meta.json 保存手札 / 用户名 / 时间等元数据
+
+    每轮只把新增的消息追加到日志末尾，写入量与本轮消息成正比，而不是整段历史。
+    元数据里记录 message_count 和 log_size：log_size 与实际文件大小不一致时
+    （上次追加后进程中断），先截断掉未确认的尾部再追加。
+    log_sha256 是日志内容的哈希：客户端发来的前 message_count 条消息与日志不一致时
+    （全量重发、编辑或重新生成了历史），整体重写日志而不是在旧前缀后面追加。
+    """
+
+    META_SUFFIX = ".meta.json"
+    LOG_SUFFIX = ".jsonl"
+
+    def meta_path(self, conversation_id: str) -> str:
+        return os.path.join(self.directory, f"{conversation_id}{self.META_SUFFIX}")
+
+    def log_path(self, conversation_id: str) -> str:
+        return os.path.join(self.directory, f"{conversation_id}{self.LOG_SUFFIX}")
+
+    def _read_messages(self, conversation_id: str, log_size: Optional[int] = None) -> List[dict]:
+        messages: List[dict] = []
+        try:
+            with open(self.log_path(conversation_id), "rb") as f:
+                raw = f.read() if log_size is None else f.read(log_size)
+        except FileNotFoundError:
+            return messages
+        for line in raw.splitlines():
+            if not line.strip():
+                continue
+            try:
+                messages.append(serialization.loads(line))
+            except ValueError:
+                # 写了一半的尾行，忽略
+                continue
+        return messages
+
+    @staticmethod
+    def _encode_log(messages: List[dict]) -> bytes:
+        return b"".join(serialization.dumps_bytes(m, pretty=False) + b"\n" for m in messages)
+
+    def _write_log(self, conversation_id: str, data: bytes, append: bool) -> int:
+        """追加（或整体重写）编码后的消息日志，返回写入后的日志字节数"""
+        path = self.log_path(conversation_id)
+        if not append:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-", suffix=self.LOG_SUFFIX)
+            os.fchmod(fd, NEW_FILE_MODE)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            return len(data)
+        with open(path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    def _migrate_legacy(self, conversation_id: str) -> Optional[dict]:
+        """把旧的 <id>.json 转换成 日志 + 元数据，返回元数据；没有旧文件时返回 None"""
+        legacy_path = self.path(conversation_id)
+        data = read_json(legacy_path) if os.path.exists(legacy_path) else None
+        if data is None:
+            return None
+        messages = data.pop("messages", None) or []
+        meta = dict(data)
+        data = self._encode_log(messages)
+        meta["log_size"] = self._write_log(conversation_id, data, append=False)
+        meta["log_sha256"] = hashlib.sha256(data).hexdigest()
+        meta["message_count"] = len(messages)
+        meta["title"] = conversation_title(messages)
+        atomic_write_json(self.meta_path(conversation_id), meta)
+        os.remove(legacy_path)
+        print(f"[会话存储] 已迁移旧会话 {conversation_id} 为追加写格式")
+        return meta
+
+    def _load_meta(self, conversation_id: str) -> Optional[dict]:
+        """调用方需持有会话锁"""
+        meta = read_json(self.meta_path(conversation_id))
+        if meta is None:
+            meta = self._migrate_legacy(conversation_id)
+        return meta
+
+    @staticmethod
+    def _document(meta: dict, messages: List[dict]) -> dict:
+        """元数据 + 消息 -> 接口使用的会话文档"""
+        doc = {k: v for k, v in meta.items() if k not in _LOG_INTERNAL_KEYS}
+        doc["messages"] = messages
+        return doc
+
+    def load(self, conversation_id: str) -> Optional[dict]:
+        with conversation_lock(conversation_id):
+            meta = self._load_meta(conversation_id)
+            if meta is None:
+                return None
+            messages = self._read_messages(conversation_id, meta.get("log_size"))
+        return self._document(meta, messages)
+
+    def save_turn(
+        self, conversation_id: str, messages: List[dict], user_name: Optional[str], now: str, locale: Optional[str] = None
+    ) -> dict:
+        with conversation_lock(conversation_id):
+            existing = self._load_meta(conversation_id)
+            payload = _new_conversation_payload(conversation_id, messages, user_name, now, existing, locale)
+            payload.pop("messages")
+
+            count = (existing or {}).get("message_count", 0)
+            log_size = (existing or {}).get("log_size", 0)
+            log_path = self.log_path(conversation_id)
+            if existing is not None and os.path.exists(log_path) and os.path.getsize(log_path) != log_size:
+                # 上次追加没有被元数据确认，丢弃未确认的尾部
+                with open(log_path, "r+b") as f:
+                    f.truncate(log_size)
+
+            prefix = None
+            if existing is not None and len(messages) >= count:
+                # 只有客户端历史的前 count 条与日志逐字节一致时才能追加
+                encoded = self._encode_log(messages[:count])
+                if hashlib.sha256(encoded).hexdigest() == existing.get("log_sha256"):
+                    prefix = encoded
+
+            if prefix is None:
+                # 新会话、客户端历史被截短或与日志不一致：整体重写日志
+                data = self._encode_log(messages)
+                payload["log_size"] = self._write_log(conversation_id, data, append=False)
+                payload["title"] = conversation_title(messages)
+            else:
+                data = prefix + self._encode_log(messages[count:])
+                payload["log_size"] = self._write_log(conversation_id, data[len(prefix):], append=True)
+                payload["title"] = existing.get("title") or conversation_title(messages)
+            payload["log_sha256"] = hashlib.sha256(data).hexdigest()
+            payload["message_count"] = len(messages)
+            atomic_write_json(self.meta_path(conversation_id), payload)
+        return self._document(payload, messages)
+
+    def update_fields(self, conversation_id: str, fields: dict) -> Optional[dict]:
+        fields = {k: v for k, v in fields.items() if k != "messages"}
+        with conversation_lock(conversation_id):
+            meta = self._load_meta(conversation_id)
+            if meta is None:
+                return None
+            meta.update(fields)
+            atomic_write_json(self.meta_path(conversation_id), meta)
+            # 返回完整文档（含消息），供会话缓存直接替换
+            messages = self._read_messages(conversation_id, meta.get("log_size"))
+        return self._document(meta, messages)
+
+    def mtime(self, conversation_id: str) -> float:
+        try:
+            return os.path.getmtime(self.meta_path(conversation_id))
+        except OSError:
+            return super().mtime(conversation_id)
+
+    def version(self, conversation_id: str) -> Optional[Tuple[int, int]]:
+        # 每次追加消息或修改字段都会原子替换元数据文件；尚未迁移时看旧 .json 文件
+        return _file_version(self.meta_path(conversation_id)) or super().version(conversation_id)
+
+    def scan(self) -> Iterator[Tuple[str, float]]:
+        """列出所有会话：元数据文件，以及尚未迁移的旧 .json 文件"""
+        seen = set()
+        legacy: List[Tuple[str, float]] = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith("."):
+                continue
+            path = os.path.join(self.directory, filename)
+            if filename.endswith(self.META_SUFFIX):
+                conversation_id = filename[:-len(self.META_SUFFIX)]
+            elif filename.endswith(".json"):
+                try:
+                    legacy.append((filename[:-len(".json")], os.path.getmtime(path)))
+                except OSError:
+                    pass
+                continue
+            else:
+                continue
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            seen.add(conversation_id)
+            yield conversation_id, mtime
+        for conversation_id, mtime in legacy:
+            if conversation_id not in seen:
+                yield conversation_id, mtime
+
+    def iter_documents(self) -> Iterator[dict]:
+        """逐个读出完整会话文档（迁移用，不触发旧文件迁移）"""
+        for conversation_id, _ in self.scan():
+            meta = read_json(self.meta_path(conversation_id))
+            if meta is None:
+                data = JsonConversationStore.load(self, conversation_id)
+            else:
+                data = {k: v for k, v in meta.items() if k not in _LOG_INTERNAL_KEYS}
+                data["messages"] = self._read_messages(conversation_id, meta.get("log_size"))
+            if data is not None:
+                data.setdefault("id", conversation_id)
+                yield data
+
+    def summary(self, conversation_id: str) -> Optional[dict]:
+        meta = read_json(self.meta_path(conversation_id))
+        if meta is None:
+            # 尚未迁移的旧文件，按原格式读取摘要（列表对账不触发迁移）
+            return super().summary(conversation_id)
+        return {
+            "created_at": meta.get("created_at"),
+            "updated_at": meta.get("updated_at"),
+            "title": meta.get("title") or "",
+            "memo": meta.get("memo"),
+            "last_memo_time": meta.get("last_memo_time"),
+        }
+
+
+class ConversationWriteQueue:
+    """对话轮次的后台写入队列
+
+    - submit() 只把本轮的完整消息列表登记到待写表里，立即返回
+    - 同一会话在一个批次内多次提交只保留最新的消息列表（每轮都是完整历史），
+      user_name / locale 取最近一次非空值
+    - 后台任务每 batch_delay 秒取出一批，在线程里依次调用 write_fn 落盘
+    - 待写会话数达到 max_pending 时 submit() 等待，形成背压
+    - close() 写完所有待写内容后退出，用于服务关闭时不丢轮次
+    """
+
+    def __init__(
+        self,
+        write_fn: Callable[[str, List[dict], Optional[str], Optional[str]], None],
+        max_pending: int = 1000,
+        batch_delay: float = 0.05,
+    ):
+        self._write_fn = write_fn
+        self.max_pending = max_pending
+        self.batch_delay = batch_delay
+        self._pending: Dict[str, Tuple[List[dict], Optional[str], Optional[str]]] = {}
+        self._inflight: Dict[str, Tuple[List[dict], Optional[str], Optional[str]]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._closing = False
+        self.written = 0
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._space = asyncio.Condition()
+            self._closing = False
+            self._worker = asyncio.create_task(self._run())
+
+    async def submit(
+        self, conversation_id: str, messages: List[dict], user_name: Optional[str], locale: Optional[str] = None
+    ) -> None:
+        self._ensure_worker()
+        async with self._space:
+            while conversation_id not in self._pending and len(self._pending) >= self.max_pending:
+                await self._space.wait()
+            previous = self._pending.get(conversation_id)
+            if previous is not None:
+                user_name = user_name if user_name is not None else previous[1]
+                locale = locale if locale is not None else previous[2]
+            self._pending[conversation_id] = (messages, user_name, locale)
+        self._wakeup.set()
+
+    def pending(self, conversation_id: str) -> Optional[Tuple[List[dict], Optional[str], Optional[str]]]:
+        """尚未落盘的最新 (消息列表, user_name, locale)，供读取方合并，保证读到自己刚写的内容"""
+        return self._pending.get(conversation_id) or self._inflight.get(conversation_id)
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending) + len(self._inflight)
+
+    def _write_batch(self, batch: Dict[str, Tuple[List[dict], Optional[str], Optional[str]]]) -> None:
+        for conversation_id, (messages, user_name, locale) in batch.items():
+            try:
+                self._write_fn(conversation_id, messages, user_name, locale)
+                self.written += 1
+            except Exception as e:
+                print(f"[写入队列] 会话 {conversation_id} 保存失败: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._closing:
+                # 稍等片刻，把同一时间段的提交合并成一批
+                await asyncio.sleep(self.batch_delay)
+            async with self._space:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+                self._space.notify_all()
+            if batch:
+                await asyncio.to_thread(self._write_batch, batch)
+            self._inflight = {}
+            if self._closing and not self._pending:
+                return
+
+    async def close(self) -> None:
+        """写完所有待写内容后停止后台任务"""
+        if self._worker is None or self._worker.done():
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._worker
+        print(f"[写入队列] 已清空，共写入 {self.written} 次会话保存")
+
+
+def recipe_summary(data: dict, fallback_id: str = "") -> dict:
+    """配方列表条目"""
+    return {
+        "id": data.get("id", fallback_id),
+        "name": data.get("name", ""),
+        "description": data.get("description", ""),
+        "created_at": data.get("created_at", ""),
+        "locale": data.get("locale"),
+    }
+
+
+class RecipeIndex:
+    """配方摘要的内存索引，按 (created_at, id) 倒序分页"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items: Dict[str, dict] = {}
+        self._order: List[Tuple[str, str]] = []  # 升序的 (created_at, id)，遍历时倒序
+        self.source_version = None  # 预热时后端配方的版本（recipes_version），用于发现其他 worker 的写入
+
+    def warm(self, recipes: Iterator[dict], source_version=None) -> int:
+        items = {}
+        for data in recipes:
+            summary = recipe_summary(data)
+            items[summary["id"]] = summary
+        with self._lock:
+            self._items = items
+            self._order = sorted((v["created_at"] or "", k) for k, v in items.items())
+            self.source_version = source_version
+        return len(items)
+
+    def upsert(self, data: dict) -> None:
+        summary = recipe_summary(data)
+        key = (summary["created_at"] or "", summary["id"])
+        with self._lock:
+            old = self._items.get(summary["id"])
+            if old is not None:
+                old_key = (old["created_at"] or "", old["id"])
+                pos = bisect.bisect_left(self._order, old_key)
+                if pos < len(self._order) and self._order[pos] == old_key:
+                    del self._order[pos]
+            self._items[summary["id"]] = summary
+            bisect.insort(self._order, key)
+
+    def page(
+        self,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        locale: Optional[str] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """按创建时间倒序分页，返回 (条目, 下一页游标)"""
+        decoded = _decode_cursor(cursor) if cursor else None
+        items: List[dict] = []
+        next_cursor = None
+        with self._lock:
+            # 游标之后的位置（不含游标本身）
+            end = bisect.bisect_left(self._order, decoded) if decoded else len(self._order)
+            for i in range(end - 1, -1, -1):
+                summary = self._items[self._order[i][1]]
+                if locale and summary.get("locale") != locale:
+                    continue
+                if limit is not None and len(items) >= limit:
+                    last = items[-1]
+                    next_cursor = _encode_cursor(last["created_at"] or "", last["id"])
+                    break
+                items.append(dict(summary))
+        return items, next_cursor
+
+
+class FileSystemBackend:
+    """文件系统后端：conversations/ 与 recipes/ 目录下的 JSON 文件 + 会话清单"""
+
+    name = "filesystem"
+
+    def __init__(self, conversations_dir: str, recipes_dir: str, index_path: str, conversation_mode: str = "json"):
+        self.recipes_dir = recipes_dir
+        if conversation_mode == "log":
+            self.conversations = LogConversationStore(conversations_dir)
+        else:
+            self.conversations = JsonConversationStore(conversations_dir)
+        self.index = ConversationIndex(index_path)
+
+    def startup(self) -> None:
+        reindexed = self.index.sync_with_store(self.conversations)
+        print(f"[会话索引] 启动对账完成，重新索引 {reindexed} 个会话")
+
+    # ---- 会话 ----
+    def load_conversation(self, conversation_id: str) -> Optional[dict]:
+        return self.conversations.load(conversation_id)
+
+    def conversation_version(self, conversation_id: str) -> Optional[Tuple[int, int]]:
+        return self.conversations.version(conversation_id)
+
+    def save_conversation(
+        self, conversation_id: str, messages: List[dict], user_name: Optional[str], now: str, locale: Optional[str] = None
+    ) -> dict:
+        payload = self.conversations.save_turn(conversation_id, messages, user_name, now, locale)
+        self.index.upsert(
+            conversation_id,
+            payload.get("created_at"),
+            now,
+            conversation_title(messages),
+            payload.get("memo"),
+            self.conversations.mtime(conversation_id),
+            payload.get("last_memo_time"),
+        )
+        return payload
+
+    def update_conversation_fields(self, conversation_id: str, fields: dict) -> Optional[dict]:
+        data = self.conversations.update_fields(conversation_id, fields)
+        if data is not None:
+            self.index.update_memo(
+                conversation_id,
+                data.get("memo"),
+                self.conversations.mtime(conversation_id),
+                data.get("last_memo_time"),
+            )
+        return data
+
+    # 会话缓存写入用：返回 (文档, 写入后的文件版本)；文件后端只在单进程下使用，写完再取版本即可
+    def save_conversation_versioned(
+        self, conversation_id: str, messages: List[dict], user_name: Optional[str], now: str, locale: Optional[str] = None
+    ) -> Tuple[dict, Optional[Tuple[int, int]]]:
+        payload = self.save_conversation(conversation_id, messages, user_name, now, locale)
+        return payload, self.conversations.version(conversation_id)
+
+    def update_conversation_fields_versioned(
+        self, conversation_id: str, fields: dict
+    ) -> Tuple[Optional[dict], Optional[Tuple[int, int]]]:
+        data = self.update_conversation_fields(conversation_id, fields)
+        return data, self.conversations.version(conversation_id)
+
+    def list_conversations(self, limit: Optional[int] = None, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        return self.index.page(limit=limit, cursor=cursor)
+
+    def memo_candidates(self, since: str) -> List[Tuple[str, str]]:
+        return self.index.memo_candidates(since)
+
+    def iter_conversations(self) -> Iterator[dict]:
+        return self.conversations.iter_documents()
+
+    # ---- 配方 ----
+    def _recipe_path(self, recipe_id: str) -> str:
+        return os.path.join(self.recipes_dir, f"{recipe_id}.json")
+
+    def load_recipe(self, recipe_id: str) -> Optional[dict]:
+        return read_json(self._recipe_path(recipe_id))
+
+    def save_recipe(self, recipe_id: str, data: dict) -> None:
+        atomic_write_json(self._recipe_path(recipe_id), data)
+
+    def recipes_version(self) -> None:
+        """文件后端只在单进程下使用，配方索引由本进程的保存同步更新，不需要检查"""
+        return None
+
+    def iter_recipes(self) -> Iterator[dict]:
+        for filename in os.listdir(self.recipes_dir):
+            if not filename.endswith(".json") or filename.startswith("."):
+                continue
+            data = read_json(os.path.join(self.recipes_dir, filename))
+            if data is None:
+                print(f"Error loading recipe {filename}")
+                continue
+            data.setdefault("id", filename[:-len(".json")])
+            yield data
+
+    def list_recipes(self) -> List[dict]:
+        items = [recipe_summary(data) for data in self.iter_recipes()]
+        # 按创建时间倒序排列
+        items.sort(key=lambda x: x.get("created_at", ""), reverse=True)
+        return items
+
+
+class SqliteBackend:
+    """SQLite 后端（WAL 模式）：会话与配方存在同一个数据库文件里
+
+    写入在 BEGIN IMMEDIATE 事务内完成读-改-写，多个 worker 进程共享同一数据库时
+    也不会互相覆盖字段；列表查询只读取索引列，不解析消息正文。
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # isolation_level=None：手动控制事务
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                created_at TEXT,
+                updated_at TEXT,
+                title TEXT,
+                memo TEXT,
+                last_memo_time TEXT,
+                meta TEXT NOT NULL,
+                messages TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations (updated_at DESC, id DESC);
+            CREATE TABLE IF NOT EXISTS recipes (
+                id TEXT PRIMARY KEY,
+                created_at TEXT,
+                locale TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_recipes_created ON recipes (created_at DESC);
+            """
+        )
+        _ensure_column(self._conn, "conversations", "last_memo_time", "TEXT")
+        _ensure_column(self._conn, "conversations", "rev", "INTEGER NOT NULL DEFAULT 0")
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def startup(self) -> None:
+        pass
+
+    # ---- 会话 ----
+    def _read_conversation(self, conn: sqlite3.Connection, conversation_id: str) -> Optional[dict]:
+        row = conn.execute(
+            "SELECT meta, messages FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        data = serialization.loads(row[0])
+        data["messages"] = serialization.loads(row[1])
+        return data
+
+    def _write_conversation(self, conn: sqlite3.Connection, data: dict) -> int:
+        """写入一行会话，返回新的 rev（每次写入加一，会话缓存用它判断这一行是否被其他连接改过）"""
+        meta = {k: v for k, v in data.items() if k != "messages"}
+        messages = data.get("messages") or []
+        row = conn.execute("SELECT rev FROM conversations WHERE id = ?", (data["id"],)).fetchone()
+        rev = (row[0] if row else 0) + 1
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO conversations (id, created_at, updated_at, title, memo, last_memo_time, meta, messages, rev)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                data["id"],
+                data.get("created_at"),
+                data.get("updated_at") or "",
+                conversation_title(messages),
+                data.get("memo"),
+                data.get("last_memo_time"),
+                serialization.dumps(meta),
+                serialization.dumps(messages),
+                rev,
+            ),
+        )
+        return rev
+
+    def load_conversation(self, conversation_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._read_conversation(self._conn, conversation_id)
+
+    def conversation_version(self, conversation_id: str) -> Optional[int]:
+        """会话行的 rev：任何连接（其他 worker / 迁移命令）写入这一行后变化，其他会话的写入不影响"""
+        with self._lock:
+            row = self._conn.execute("SELECT rev FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row[0] if row else None
+
+    def save_conversation_versioned(
+        self, conversation_id: str, messages: List[dict], user_name: Optional[str], now: str, locale: Optional[str] = None
+    ) -> Tuple[dict, int]:
+        """保存并返回 (文档, 写入时的 rev)；rev 在同一事务内得到，不会混入其他连接随后的写入"""
+        with self._transaction() as conn:
+            existing = self._read_conversation(conn, conversation_id)
+            payload = _new_conversation_payload(conversation_id, messages, user_name, now, existing, locale)
+            rev = self._write_conversation(conn, payload)
+        return payload, rev
+
+    def save_conversation(
+        self, conversation_id: str, messages: List[dict], user_name: Optional[str], now: str, locale: Optional[str] = None
+    ) -> dict:
+        return self.save_conversation_versioned(conversation_id, messages, user_name, now, locale)[0]
+
+    def update_conversation_fields_versioned(self, conversation_id: str, fields: dict) -> Tuple[Optional[dict], Optional[int]]:
+        with self._transaction() as conn:
+            data = self._read_conversation(conn, conversation_id)
+            if data is None:
+                return None, None
+            data.update(fields)
+            rev = self._write_conversation(conn, data)
+        return data, rev
+
+    def update_conversation_fields(self, conversation_id: str, fields: dict) -> Optional[dict]:
+        return self.update_conversation_fields_versioned(conversation_id, fields)[0]
+
+    def import_conversation(self, data: dict) -> None:
+        with self._transaction() as conn:
+            self._write_conversation(conn, data)
+
+    def list_conversations(self, limit: Optional[int] = None, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        return _page_conversations(self._conn, self._lock, limit, cursor)
+
+    def memo_candidates(self, since: str) -> List[Tuple[str, str]]:
+        return _memo_candidates(self._conn, self._lock, since)
+
+    # ---- 配方 ----
+    def load_recipe(self, recipe_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM recipes WHERE id = ?", (recipe_id,)).fetchone()
+        return serialization.loads(row[0]) if row else None
+
+    def save_recipe(self, recipe_id: str, data: dict) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO recipes (id, created_at, locale, data) VALUES (?, ?, ?, ?)",
+                (recipe_id, data.get("created_at", ""), data.get("locale"), serialization.dumps(data)),
+            )
+
+    def recipes_version(self) -> Tuple[int, int]:
+        """(配方数, 最大 rowid)：任何连接新增或覆盖（INSERT OR REPLACE 会分配新 rowid）配方后变化"""
+        with self._lock:
+            count, max_rowid = self._conn.execute("SELECT COUNT(*), MAX(rowid) FROM recipes").fetchone()
+        return count, max_rowid or 0
+
+    def iter_recipes(self) -> Iterator[dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM recipes").fetchall()
+        for row in rows:
+            yield serialization.loads(row[0])
+
+    def list_recipes(self) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id, data FROM recipes ORDER BY created_at DESC").fetchall()
+        return [recipe_summary(serialization.loads(data), recipe_id) for recipe_id, data in rows]
+
+
+def _document_bytes(doc: dict) -> int:
+    """会话文档常驻内存的估算：字典与其中字符串等对象的 sys.getsizeof 之和"""
+    size = sys.getsizeof(doc)
+    for key, value in doc.items():
+        size += sys.getsizeof(value)
+        if key == "messages" and isinstance(value, list):
+            for message in value:
+                size += sys.getsizeof(message) + sum(sys.getsizeof(v) for v in message.values())
+    return size
+
+
+class ConversationCache:
+    """已解析会话文档的进程内 LRU（会话的读写都经过它）
+
+    - load：命中时用后端的版本号（文件的 mtime_ns + 大小 / SQLite 会话行的 rev）确认没有被外部修改，
+      变了就重新读取；返回文档的浅拷贝，调用方可以改顶层字段，消息列表与缓存共享、不要原地修改
+    - save / update_fields：写入后端后用返回的完整文档替换缓存条目（write-through）
+    - 条目数与估算的常驻字节数都有上限，超出时淘汰最久未使用的条目
+    - 同一会话的写入与未命中读取按会话串行，避免较旧的读取结果覆盖刚写入的文档
+    """
+
+    def __init__(self, backend, max_entries: int = 512, max_bytes: int = 64 * 1024 * 1024):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[object, dict, int]]" = OrderedDict()  # id -> (版本, 文档, 字节数)
+        self._key_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0  # 命中但版本已变（外部修改）而重新读取的次数
+        self.evictions = 0
+        self.writes = 0
+
+    @contextmanager
+    def _key_lock(self, conversation_id: str) -> Iterator[None]:
+        with striped_lock(self._key_locks, conversation_id):
+            yield
+
+    def _put(self, conversation_id: str, version: object, doc: Optional[dict]) -> None:
+        with self._lock:
+            old = self._entries.pop(conversation_id, None)
+            if old is not None:
+                self.resident_bytes -= old[2]
+            if doc is None or version is None:
+                return
+            size = _document_bytes(doc)
+            self._entries[conversation_id] = (version, doc, size)
+            self.resident_bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self.resident_bytes > self.max_bytes):
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.resident_bytes -= evicted
+                self.evictions += 1
+
+    def load(self, conversation_id: str) -> Optional[dict]:
+        version = self.backend.conversation_version(conversation_id)
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(conversation_id)
+                self.hits += 1
+                return dict(entry[1])
+            self.misses += 1
+            if entry is not None:
+                self.stale += 1
+        with self._key_lock(conversation_id):
+            # 先取版本再读文档：读取期间被改写时版本偏旧，下次访问会重新读取
+            version = self.backend.conversation_version(conversation_id)
+            doc = self.backend.load_conversation(conversation_id)
+            self._put(conversation_id, version, doc)
+        return dict(doc) if doc is not None else None
+
+    def save(
+        self, conversation_id: str, messages: List[dict], user_name: Optional[str], now: str, locale: Optional[str] = None
+    ) -> dict:
+        with self._key_lock(conversation_id):
+            doc, version = self.backend.save_conversation_versioned(conversation_id, messages, user_name, now, locale)
+            self._put(conversation_id, version, doc)
+            self.writes += 1
+        return dict(doc)
+
+    def update_fields(self, conversation_id: str, fields: dict) -> Optional[dict]:
+        with self._key_lock(conversation_id):
+            doc, version = self.backend.update_conversation_fields_versioned(conversation_id, fields)
+            self._put(conversation_id, version, doc)
+            self.writes += 1
+        return dict(doc) if doc is not None else None
+
+    def metrics(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "resident_bytes": self.resident_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "stale_reloads": self.stale,
+                "evictions": self.evictions,
+                "writes": self.writes,
+            }
+
+
+class ScentAnalysisStore:
+    """香水分析结果表：key -> (更新时间, 分析 JSON)"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS scent_analyses (
+                key TEXT PRIMARY KEY,
+                updated_at REAL,
+                data TEXT
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[float, dict]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT updated_at, data FROM scent_analyses WHERE key = ?", (key,)
+            ).fetchone()
+        return (row[0], serialization.loads(row[1])) if row else None
+
+    def put(self, key: str, data: dict, updated_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO scent_analyses (key, updated_at, data) VALUES (?, ?, ?)",
+                (key, updated_at if updated_at is not None else time.time(), serialization.dumps(data)),
+            )
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM scent_analyses").fetchone()[0]
+
+
+def create_backend(name: str, base_dir: str) -> Union[FileSystemBackend, SqliteBackend]:
+    """按名称创建存储后端（filesystem / sqlite），路径可用环境变量覆盖"""
+    if name == "sqlite":
+        db_path = os.getenv("STORAGE_SQLITE_PATH", os.path.join(base_dir, "storage.sqlite3"))
+        return SqliteBackend(db_path)
+    conversations_dir = os.path.join(base_dir, "conversations")
+    recipes_dir = os.path.join(base_dir, "recipes")
+    os.makedirs(conversations_dir, exist_ok=True)
+    os.makedirs(recipes_dir, exist_ok=True)
+    index_path = os.getenv(
+        "CONVERSATION_INDEX_PATH", os.path.join(base_dir, "conversations_index.sqlite3")
+    )
+    mode = os.getenv("CONVERSATION_STORAGE_MODE", "json").lower()
+    return FileSystemBackend(conversations_dir, recipes_dir, index_path, mode)
+
+
+def migrate_to_sqlite(base_dir: str, db_path: str) -> Tuple[int, int]:
+    """把文件系统里的会话（json / log 两种格式）和配方批量导入 SQLite，返回 (会话数, 配方数)"""
+    source = FileSystemBackend(
+        os.path.join(base_dir, "conversations"),
+        os.path.join(base_dir, "recipes"),
+        ":memory:",
+        "log",  # log 存储能同时读出旧 .json 与 JSONL 会话
+    )
+    target = SqliteBackend(db_path)
+    conversations = 0
+    for data in source.iter_conversations():
+        target.import_conversation(data)
+        conversations += 1
+    recipes = 0
+    for data in source.iter_recipes():
+        target.save_recipe(data["id"], data)
+        recipes += 1
+    return conversations, recipes
+
+
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Scent Alchemist 存储工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = sub.add_parser("migrate", help="把 conversations/ 和 recipes/ 导入 SQLite")
+    migrate_parser.add_argument("--source", default=base_dir, help="包含 conversations/ 与 recipes/ 的目录")
+    migrate_parser.add_argument(
+        "--db",
+        default=os.getenv("STORAGE_SQLITE_PATH", os.path.join(base_dir, "storage.sqlite3")),
+        help="目标 SQLite 文件",
+    )
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        n_conversations, n_recipes = migrate_to_sqlite(args.source, args.db)
+        print(f"[迁移] 已导入 {n_conversations} 个会话、{n_recipes} 个配方到 {args.db}")
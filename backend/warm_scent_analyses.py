@@ -0,0 +1,61 @@
+"""预热 Lab 香水分析结果
+
+为一批热门香水预先计算分析结果并写入分析结果表，之后的 /api/analyze_scent 直接读取。
+需要 .env 中的 LLM 与 Tavily 配置。
+
+    python warm_scent_analyses.py popular.txt            # 每行一个香水名
+    python warm_scent_analyses.py                        # 不给文件时使用别名索引中的全部官方名称
+    python warm_scent_analyses.py popular.txt --refresh  # 忽略已有结果，全部重新计算
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+import server
+
+
+def read_names(paths: List[str]) -> List[str]:
+    names: List[str] = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            names.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    return list(dict.fromkeys(names))
+
+
+async def warm(names: List[str], concurrency: int, refresh: bool) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {"found": 0, "not_found": 0, "failed": 0}
+    official_names = await server.get_official_names(names)  # 批量别名解析
+
+    async def warm_one(name: str) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            official_name = official_names.get(name, name)
+            try:
+                result = await server.analyze_perfume(name, official_name, refresh=refresh)
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"[分析预热] ❌ {name}: {e}")
+                return
+            status = "found" if result.get("found") else "not_found"
+            counts[status] += 1
+            print(f"[分析预热] {'✅' if status == 'found' else '⚠️'} {name} -> {official_name}（{time.perf_counter() - start:.2f}s）")
+
+    await asyncio.gather(*(warm_one(name) for name in names))
+    await server._shutdown()
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="预热 Lab 香水分析结果")
+    parser.add_argument("files", nargs="*", help="香水名称列表文件（每行一个，# 开头为注释）")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时进行的分析数")
+    parser.add_argument("--refresh", action="store_true", help="忽略已有结果，重新计算")
+    args = parser.parse_args()
+
+    names = read_names(args.files) if args.files else sorted(server.alias_index.official_names())
+    start = time.perf_counter()
+    counts = asyncio.run(warm(names, args.concurrency, args.refresh))
+    print(f"[分析预热] 共 {len(names)} 款，找到 {counts['found']}、未找到 {counts['not_found']}、失败 {counts['failed']}，"
+          f"耗时 {time.perf_counter() - start:.1f}s")